@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark reading a bamcheck file line by line against skipping straight to
+its SN and ID records with the BamcheckReader's block parser.
+
+    python benchmarks/bench_bamcheck.py [--files N] [--repeat N]
+"""
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.generate import write_bamcheck
+from frontier.IO.BamcheckReader import BamcheckReader
+
+class BamcheckLineReader(BamcheckReader):
+    """A BamcheckReader that reads each line with process_line."""
+    BLOCK_SIZE = None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--files", type=int, default=20, help="number of bamcheck files to read")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timings to take the best of")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(0, args.files):
+            path = os.path.join(tmp_dir, "%d_1#%d.bamcheck" % (i, i))
+            write_bamcheck(path, seed=i)
+            paths.append(path)
+        size = sum(os.path.getsize(path) for path in paths)
+        print("%d files of %.2f MB on average" % (len(paths), float(size) / len(paths) / 1e6))
+
+        # Both readers must agree before their timings are worth comparing
+        for path in paths:
+            if BamcheckLineReader(path).summary != BamcheckReader(path).summary:
+                raise Exception("Readers disagree on %s" % path)
+
+        timings = {}
+        for reader_class in [BamcheckLineReader, BamcheckReader]:
+            best = min(timeit.repeat(lambda: [reader_class(path) for path in paths],
+                    number=1, repeat=args.repeat))
+            timings[reader_class] = best
+            print("%-20s %8.2f ms/file %8.2f MB/s" % (reader_class.__name__,
+                    best / len(paths) * 1e3, size / best / 1e6))
+        print("Speedup %.1fx" % (timings[BamcheckLineReader] / timings[BamcheckReader]))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic generators of realistic synthetic input files for benchmarking
+Frontier's readers.
+"""
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import os
+import random
+
+# Keys of the SN section of a bamcheck file, as written by samtools stats
+# and extended by bamcheckr
+SN_KEYS = [
+    "raw total sequences", "filtered sequences", "sequences", "is paired",
+    "is sorted", "1st fragments", "last fragments", "reads mapped",
+    "reads unmapped", "reads unpaired", "reads paired", "reads duplicated",
+    "reads MQ0", "reads QC failed", "non-primary alignments", "total length",
+    "bases mapped", "bases mapped (cigar)", "bases trimmed", "bases duplicated",
+    "mismatches", "error rate", "average length", "maximum length",
+    "average quality", "insert size average", "insert size standard deviation",
+    "inward oriented pairs", "outward oriented pairs",
+    "pairs with other orientation", "pairs on different chromosomes",
+] + [
+    "%s.percent.%s.%s.baseline" % (strand, indel, side)
+        for strand in ["fwd", "rev"]
+        for indel in ["insertions", "deletions"]
+        for side in ["above", "below"]
+] + [
+    "%s.percent.%s" % (base, stat)
+        for base in "ACGT"
+        for stat in ["mean.above.baseline", "mean.below.baseline",
+                     "max.above.baseline", "max.below.baseline",
+                     "max.baseline.deviation", "total.mean.baseline.deviation"]
+]
+
+# Labels of each class of the CLASSES used for generated data sets
+CLASSES = {
+    "pass": {"names": ["pass", "passed"], "code": 1},
+    "fail": {"names": ["fail", "failed"], "code": -1},
+    "warn": {"names": ["warn", "warning"], "code": 0},
+}
+
+def sn_keys(n_parameters=None):
+    """
+    Return the SN keys of a bamcheck file, padded with numbered keys or
+    truncated to n_parameters keys if given.
+    """
+    if n_parameters is None:
+        return list(SN_KEYS)
+    keys = SN_KEYS[:n_parameters]
+    for i in range(len(keys), n_parameters):
+        keys.append("extra.summary.number.%d" % i)
+    return keys
+
+def generate_bamcheck(fh, rng, read_length=150, coverage_bins=5000, insert_sizes=2000, qualities=42, keys=None):
+    """
+    Write a bamcheck file with an SN section (of the given keys, or SN_KEYS)
+    and every other section that samtools stats writes (sized by the read
+    length, number of coverage bins and number of insert sizes) to fh, using
+    values drawn from rng.
+    """
+    write = fh.write
+    write("# This file was produced by samtools stats and processed by bamcheckr\n")
+    write("# Summary Numbers. Use `grep ^SN | cut -f 2-` to extract this part.\n")
+    for key in keys or SN_KEYS:
+        if "percent" in key or "rate" in key:
+            write("SN\t%s:\t%.9f\n" % (key, rng.random()))
+        else:
+            write("SN\t%s:\t%d\n" % (key, rng.randint(0, 50000000)))
+
+    def table(section, rows, columns, high):
+        write("# %s section\n" % section)
+        for i in range(1, rows + 1):
+            write("%s\t%d\t%s\n" % (section, i,
+                    "\t".join(str(rng.randint(0, high)) for j in range(columns))))
+
+    table("FFQ", read_length, qualities, 10000000)
+    table("LFQ", read_length, qualities, 10000000)
+    table("MPC", read_length, qualities + 1, 100000)
+    table("GCF", 100, 1, 1000000)
+    table("GCL", 100, 1, 1000000)
+    table("GCC", read_length, 4, 100)
+    table("IS", insert_sizes, 4, 100000)
+    table("RL", 1, 1, 50000000)
+    table("ID", 40, 2, 200000)
+    table("IC", read_length, 4, 1000)
+    table("COV", coverage_bins, 1, 100000)
+    table("GCD", 60, 6, 100)
+
+def write_bamcheck(path, seed=0, **kwargs):
+    """Write a bamcheck file to path, deterministically for a given seed."""
+    fh = open(path, "w")
+    try:
+        generate_bamcheck(fh, random.Random(seed), **kwargs)
+    finally:
+        fh.close()
+
+def write_dataset(path, n_observations, n_parameters=None, class_mix=None, duplicate_rate=0.0,
+        missing_rate=0.0, extra_target_rate=0.5, files_per_dir=1000, seed=0, **kwargs):
+    """
+    Write a data set of n_observations bamcheck files (split over directories
+    of files_per_dir files) to path/data and an AQC matrix of their targets to
+    path/aqc.txt, deterministically for a given seed. Returns the data
+    directory and target file paths.
+
+    class_mix gives the relative frequency of each class of CLASSES (equal by
+    default). A duplicate_rate fraction of files repeat the id of an earlier
+    file and a missing_rate fraction of ids have no target, while the AQC
+    matrix has extra_target_rate times as many ids again that have no data.
+    Other keyword arguments size each bamcheck file (see generate_bamcheck).
+    """
+    rng = random.Random(seed)
+    if class_mix is None:
+        class_mix = dict((cl, 1.0) for cl in CLASSES)
+    classes = sorted(class_mix)
+    weights = [class_mix[cl] for cl in classes]
+    keys = sn_keys(n_parameters)
+
+    data_dir = os.path.join(path, "data")
+    ids = []
+    for i in range(0, n_observations):
+        if ids and rng.random() < duplicate_rate:
+            _id = rng.choice(ids)
+        else:
+            _id = "%d_%d#%d" % (10000 + i // 96, 1 + (i // 12) % 8, 1 + i % 12)
+            ids.append(_id)
+
+        subdir = os.path.join(data_dir, "%04d" % (i // files_per_dir))
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        fh = open(os.path.join(subdir, "%s.%d.bamcheck" % (_id, i)), "w")
+        try:
+            generate_bamcheck(fh, rng, keys=keys, **kwargs)
+        finally:
+            fh.close()
+
+    target_ids = [_id for _id in ids if rng.random() >= missing_rate]
+    target_ids += ["%d_9#%d" % (90000 + i // 12, 1 + i % 12)
+            for i in range(0, int(len(ids) * extra_target_rate))]
+    rng.shuffle(target_ids)
+
+    target_path = os.path.join(path, "aqc.txt")
+    fh = open(target_path, "w")
+    try:
+        fh.write("lanelet\tsample\tstudy\tnpg\taqc\tnotes\n")
+        for i, _id in enumerate(target_ids):
+            cl = _weighted_choice(rng, classes, weights)
+            fh.write("%s\tSAMPLE%07d\tSTUDY%d\tnpg\t%s\t...\n" % (_id, i, i % 10,
+                    rng.choice(CLASSES[cl]["names"])))
+    finally:
+        fh.close()
+    return data_dir, target_path
+
+def _weighted_choice(rng, choices, weights):
+    """Return one of choices, drawn with the given relative weights."""
+    point = rng.random() * sum(weights)
+    for choice, weight in zip(choices, weights):
+        point -= weight
+        if point < 0:
+            return choice
+    return choices[-1]
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Time each phase of loading and querying generated data sets of increasing
+size, and compare the results against a stored baseline.
+
+    python benchmarks/suite.py [--sizes 1000,10000,100000] [--output results.json]
+            [--baseline baseline.json] [--threshold 1.25]
+
+Each size is written once (deterministically for --seed) to a temporary
+directory, then for each phase the best of --repeat timings and the peak
+memory traced by tracemalloc are recorded. Phases that are slower (or use
+more memory) than --threshold times their baseline are reported as
+regressions, and the suite exits with a non-zero status.
+
+Timings depend on the machine, so no baseline is kept in the repository.
+Write one from a checkout of the reference revision on the machine that
+will run the comparison, then compare a later checkout against it with the
+same arguments:
+
+    python benchmarks/suite.py --sizes 1000,10000 --output baseline.json
+    python benchmarks/suite.py --sizes 1000,10000 --baseline baseline.json
+"""
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.generate import CLASSES, write_dataset
+from frontier import frontier
+from frontier.IO.AQCReader import AQCReader
+from frontier.IO.BamcheckReader import BamcheckReader
+
+# Keys of the phase results compared against a baseline
+METRICS = ["seconds", "peak_bytes"]
+
+@contextlib.contextmanager
+def quiet():
+    """Discard anything printed or logged to the frontier logger by the
+    block, so only the work is timed."""
+    logger = logging.getLogger("frontier")
+    disabled = logger.disabled
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    logger.disabled = True
+    try:
+        yield
+    finally:
+        logger.disabled = disabled
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def measure(func, repeat=1):
+    """
+    Return the best of repeat timings of func, the peak memory it traced
+    and its last result as a (result, {seconds, peak_bytes}) tuple.
+    """
+    best = None
+    for i in range(0, repeat):
+        with quiet():
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # Memory is traced in a separate run as tracing slows allocations down
+    tracemalloc.start()
+    try:
+        with quiet():
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, {"seconds": best, "peak_bytes": peak}
+
+def run_size(n_observations, args):
+    """Generate a data set of n_observations files and time each phase."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        data_dir, target_path = write_dataset(tmp_dir, n_observations,
+                n_parameters=args.parameters, class_mix=args.class_mix,
+                duplicate_rate=args.duplicate_rate, missing_rate=args.missing_rate,
+                seed=args.seed, read_length=args.read_length, coverage_bins=10,
+                insert_sizes=10, qualities=10)
+        print("Generated %d files in %.2fs" % (n_observations, time.perf_counter() - start))
+
+        phases = {}
+        def load():
+            return frontier.Statplexer(data_dir, target_path, CLASSES, BamcheckReader, AQCReader)
+        plex, phases["load_data"] = measure(load)
+
+        def parse_targets():
+            return AQCReader(target_path, frontier.ClassRegistry(CLASSES))
+        ignored, phases["parse_targets"] = measure(parse_targets, args.repeat)
+
+        ignored, phases["test_variance"] = measure(plex._test_variance, args.repeat)
+
+        names = plex.list_parameters()
+        codes = [CLASSES["pass"]["code"], CLASSES["fail"]["code"]]
+        ignored, phases["get_data_by_parameters"] = measure(
+                lambda: plex.get_data_by_parameters(names), args.repeat)
+        ignored, phases["get_data_by_target"] = measure(
+                lambda: plex.get_data_by_target(names, codes), args.repeat)
+
+        for phase in sorted(phases):
+            print("%8d %-24s %10.4fs %10.2f MB" % (n_observations, phase,
+                    phases[phase]["seconds"], phases[phase]["peak_bytes"] / 1e6))
+        return phases
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of (size, phase, metric, value, baseline value) for each
+    metric of a phase in results worse than threshold times its baseline.
+    Sizes and phases missing from either side are not compared.
+    """
+    regressions = []
+    for size, phases in sorted(results.items()):
+        for phase, metrics in sorted(phases.items()):
+            base = baseline.get(size, {}).get(phase)
+            if base is None:
+                continue
+            for metric in METRICS:
+                if metric in base and metrics[metric] > base[metric] * threshold:
+                    regressions.append((size, phase, metric, metrics[metric], base[metric]))
+    return regressions
+
+def parse_class_mix(value):
+    """Parse a class mix of the form pass=0.7,fail=0.2,warn=0.1."""
+    class_mix = {}
+    for item in value.split(","):
+        cl, weight = item.split("=")
+        if cl not in CLASSES:
+            raise argparse.ArgumentTypeError("Unknown class %s" % cl)
+        class_mix[cl] = float(weight)
+    return class_mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+            help="comma separated numbers of observations to generate")
+    parser.add_argument("--parameters", type=int, default=None,
+            help="number of SN parameters of each file (default all samtools stats keys)")
+    parser.add_argument("--class-mix", type=parse_class_mix, default=None,
+            help="relative frequency of each class, eg. pass=0.7,fail=0.2,warn=0.1")
+    parser.add_argument("--duplicate-rate", type=float, default=0.01,
+            help="fraction of files repeating an earlier id")
+    parser.add_argument("--missing-rate", type=float, default=0.01,
+            help="fraction of ids without a target")
+    parser.add_argument("--read-length", type=int, default=30,
+            help="read length, sizing the per-cycle sections of each file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="number of timings to take the best of")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="compare results against this JSON output")
+    parser.add_argument("--threshold", type=float, default=1.25,
+            help="ratio to the baseline above which a phase has regressed")
+    args = parser.parse_args()
+
+    results = {}
+    for size in [int(size) for size in args.sizes.split(",")]:
+        results[str(size)] = run_size(size, args)
+
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "arguments": dict((key, value) for key, value in vars(args).items()
+                    if key not in ("output", "baseline")),
+        },
+        "results": results,
+    }
+    if args.output:
+        fh = open(args.output, "w")
+        try:
+            json.dump(output, fh, indent=2, sort_keys=True)
+        finally:
+            fh.close()
+
+    if args.baseline:
+        fh = open(args.baseline)
+        try:
+            baseline = json.load(fh)["results"]
+        finally:
+            fh.close()
+        regressions = compare(results, baseline, args.threshold)
+        for size, phase, metric, value, base in regressions:
+            print("[FAIL] %s %s %s regressed %.2fx (%g against %g)" % (size, phase,
+                    metric, float(value) / base, value, base))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against %s" % args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -3,32 +3,95 @@ __copyright__ = "Copyright (c) Sam Nicholls"
 __version__ = "0.1.2"
 __maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
 
-from frontier.frontier import classify_label, encode_class
+import numpy as np
+
+from frontier.frontier import ClassRegistry
 from frontier.IO.AbstractReader import AbstractReader
+from frontier.targets import TargetTable
 
 class AQCReader(AbstractReader):
-    """Wraps a file handler and provides access to AQC matrix contents."""
+    """
+    Wraps a file handler and provides access to AQC matrix contents, read in
+    to a TargetTable of the code (or label, without CLASSES) of each id.
+    """
+
+    BLOCK_SIZE = 1 << 22
 
-    def __init__(self, filepath, CLASSES=None, auto_close=True):
-        """Initialise the structures for storing data and construct the reader."""
+    def __init__(self, filepath, CLASSES=None, auto_close=True, cache=None, fileobj=None, ids=None):
+        """
+        Initialise the structures for storing data and construct the reader.
+        If ids are given, only the targets of those ids are kept.
+        """
         self.targets = {}
-        super(AQCReader, self).__init__(filepath, CLASSES, auto_close, 1)
+        self.ids = set(ids) if ids is not None else None
+        self._id_keys = set(_id.encode("utf-8") for _id in ids) if ids is not None else None
+
+        # Ids and codes of each block, built in to the table once the whole
+        # file has been processed
+        self._id_blocks = []
+        self._code_blocks = []
+        if CLASSES is not None:
+            CLASSES = ClassRegistry.compile(CLASSES)
+        super(AQCReader, self).__init__(filepath, CLASSES, auto_close, 1, cache, fileobj)
+
+    def process_file(self):
+        """Process the file and build the table of its targets."""
+        super(AQCReader, self).process_file()
+
+        # Targets read line by line follow those read in blocks
+        if self.targets:
+            self._id_blocks.append(np.char.encode(np.asarray(list(self.targets.keys())), "utf-8"))
+            self._code_blocks.append(np.asarray(list(self.targets.values())))
+        if self._id_blocks:
+            self.targets = TargetTable(np.concatenate(self._id_blocks), np.concatenate(self._code_blocks))
+        else:
+            self.targets = TargetTable()
+        self._id_blocks = []
+        self._code_blocks = []
 
     def process_line(self, line):
         """Process a record of the AQC matrix file."""
         fields = line.split("\t")
 
         _id = fields[0]
+        if self.ids is not None and _id not in self.ids:
+            return
         if self.CLASSES is None:
             _class = fields[4]
             _code = _class
         else:
-            _class = classify_label(self.CLASSES, fields[4])
-            _code = encode_class(self.CLASSES, _class)
+            _class = self.CLASSES.classify(fields[4])
+            _code = self.CLASSES.encode(_class)
 
         self.targets[_id] = _code
 
+    def process_block(self, block):
+        """Process a block of records of the AQC matrix file, keeping ids as
+        bytes and decoding and classifying each distinct label only once."""
+        ids = []
+        labels = []
+        for line in block.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            fields = line.split(b"\t", 5)
+            if self._id_keys is not None and fields[0] not in self._id_keys:
+                continue
+            ids.append(fields[0])
+            labels.append(fields[4])
+        if not ids:
+            return
+
+        distinct, inverse = np.unique(np.array(labels), return_inverse=True)
+        distinct = [label.decode("utf-8") for label in distinct.tolist()]
+        if self.CLASSES is None:
+            codes = np.array(distinct)[inverse]
+        else:
+            codes = self.CLASSES.encode_labels(distinct)[inverse]
+        self._id_blocks.append(np.array(ids))
+        self._code_blocks.append(codes)
+
     def get_data(self):
-        """Return the targets structure."""
+        """Return the TargetTable of targets."""
         return self.targets
 
@@ -3,19 +3,74 @@ __copyright__ = "Copyright (c) Sam Nicholls"
 __version__ = "0.1.2"
 __maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
 
+import mmap
+
+from frontier.IO.compression import open_text
+
 class AbstractReader(object):
     """Wraps a file handler and provides controlled access to its contents."""
 
-    def __init__(self, filepath, CLASSES, auto_close, header):
-        """Constructs the read only file handler."""
+    # Names of the attributes holding the structures read from a file, readers
+    # that list them may have those structures stored in and restored from a
+    # ParseCache instead of processing the file
+    CACHE_ATTRIBUTES = None
+
+    # Readers that implement process_block may set the number of bytes to
+    # pass to it at a time (or 0 for the whole file at once), the file is
+    # otherwise passed to process_line one line at a time
+    BLOCK_SIZE = None
+
+    # Number of threads to decompress the blocks of a bgzip compressed file
+    # with, a bgzip file is otherwise decompressed as a gzip file
+    DECOMPRESS_THREADS = None
+
+    def __init__(self, filepath, CLASSES, auto_close, header, cache=None, fileobj=None):
+        """
+        Constructs the read only file handler. Files compressed with gzip,
+        bgzip, xz or zstd (if the zstandard package is installed) are detected
+        by their magic bytes and decompressed as they are read.
+
+        If a fileobj is given (a text file object of the contents of filepath,
+        such as an io.TextIOWrapper of bytes already read) it is used as the
+        handler rather than opening filepath, which still names the file.
+
+        If a ParseCache is given and the reader defines CACHE_ATTRIBUTES, those
+        attributes are restored from a valid cache entry for the file rather
+        than processing it, or stored in the cache after processing.
+
+        Problems found while processing the file are noted in diagnostics
+        (see note) rather than printed, for the loader to count and log.
+        """
         self.header = header
         self.CLASSES = CLASSES
+        self.filepath = filepath
+        self.handler = None
+        self.compression = None
+        self.diagnostics = []
 
         if not filepath:
             raise IOError("You must specify a file.")
 
-        self.handler = open(filepath, 'r')
-        self.process_file()
+        if cache is None or not self.CACHE_ATTRIBUTES:
+            cache = None
+            state = None
+        else:
+            state = cache.get(self.__class__, filepath)
+
+        if state is None or not auto_close:
+            if fileobj is not None:
+                self.handler = fileobj
+            else:
+                self.handler, self.compression = open_text(filepath, self.DECOMPRESS_THREADS)
+
+        if state is None:
+            self.process_file()
+            if cache is not None:
+                cache.put(self.__class__, filepath,
+                        dict((name, getattr(self, name)) for name in self.CACHE_ATTRIBUTES))
+        else:
+            for name in self.CACHE_ATTRIBUTES:
+                setattr(self, name, state[name])
 
         if auto_close:
             self.close()
@@ -28,7 +83,21 @@ class AbstractReader(object):
     def close(self):
         """Close the file handler."""
         #TODO Check file is not already closed...
-        self.handler.close()
+        if self.handler is not None:
+            self.handler.close()
+
+    def note(self, kind, *args):
+        """
+        Note a problem of a kind listed in frontier.report.DIAGNOSTICS, with
+        the arguments of its message.
+        """
+        self.diagnostics.append((kind,) + args)
+
+    @classmethod
+    def path_id(cls, filepath):
+        """Return the ID of a file given only its path, or None if the ID is
+        read from the contents of the file."""
+        return None
 
     def get_id(self):
         """Return record ID."""
@@ -42,8 +111,17 @@ class AbstractReader(object):
         """Process a record of the input file."""
         raise NotImplementedError("process_line has not been implemented")
 
+    def process_block(self, block):
+        """Process a block of whole lines of the input file, as bytes."""
+        raise NotImplementedError("process_block has not been implemented")
+
     def process_file(self):
-        """Calls process_line for each line in input file."""
+        """Calls process_block for each block of the input file if the reader
+        has a BLOCK_SIZE, otherwise calls process_line for each line."""
+        if self.BLOCK_SIZE is not None:
+            for block in self.iter_blocks(self.BLOCK_SIZE):
+                self.process_block(block)
+            return
 
         # Skip Header
         for i in range(0,self.header):
@@ -52,3 +130,65 @@ class AbstractReader(object):
         for line in self.handler:
             self.process_line(line.strip())
 
+    def iter_blocks(self, block_size):
+        """
+        Yield the input file after the header as blocks of bytes of about
+        block_size (or all of the file, if block_size is 0), each ending at
+        the end of a line. The file is memory mapped where possible,
+        otherwise (or if it is compressed) it is read through a buffer.
+        """
+        mapped = None
+        if self.compression is None:
+            try:
+                mapped = mmap.mmap(self.handler.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, IOError, OSError, ValueError):
+                # Not a regular file, or an empty one
+                mapped = None
+
+        if mapped is None:
+            for block in self._iter_buffered_blocks(block_size):
+                yield block
+            return
+
+        try:
+            start = 0
+            for i in range(0, self.header):
+                start = mapped.find(b"\n", start) + 1
+                if start == 0:
+                    return
+
+            size = len(mapped)
+            while start < size:
+                end = size
+                if block_size and start + block_size < size:
+                    end = mapped.rfind(b"\n", start, start + block_size) + 1
+                    if end == 0:
+                        # Line longer than a block, extend the block to its end
+                        end = mapped.find(b"\n", start + block_size) + 1 or size
+                yield mapped[start:end]
+                start = end
+        finally:
+            mapped.close()
+
+    def _iter_buffered_blocks(self, block_size):
+        """Yield blocks of whole lines after the header by reading the
+        handler's underlying binary buffer, for files that cannot be mapped."""
+        raw = getattr(self.handler, "buffer", self.handler)
+        for i in range(0, self.header):
+            raw.readline()
+
+        remainder = b""
+        while True:
+            data = raw.read(block_size or -1)
+            if not data:
+                break
+            data = remainder + data
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                remainder = data
+                continue
+            remainder = data[end:]
+            yield data[:end]
+        if remainder:
+            yield remainder
+
@@ -4,9 +4,22 @@ __version__ = "0.1.2"
 __maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
 
 import os
+import re
+
+import numpy as np
 
 from frontier.IO.AbstractReader import AbstractReader
 
+# Only the SN and ID sections are read, every other line is skipped over by
+# searching whole blocks of a file for these patterns. Records are matched by
+# the newline before them, rather than with ^ and re.M, so the search can skip
+# ahead to each literal prefix.
+SN_PATTERN = re.compile(br"\nSN\t([^\t\r\n]*)\t([^\t\r\n]*)")
+ID_PATTERN = re.compile(br"\nID\t([^\t\r\n]*)\t([^\t\r\n]*)\t([^\t\r\n]*)")
+
+# Memoised tidy_key results, the same few keys appear in every file
+_TIDY_KEYS = {}
+
 def tidy_key(key):
     """Sanitize summary number key."""
     key = key[:-1].replace(" ", "-")
@@ -14,15 +27,58 @@ def tidy_key(key):
     key = key.replace("_", "-")
     return key.strip()
 
+def tidy_key_cached(key):
+    """Sanitize summary number key, remembering the result for next time."""
+    try:
+        return _TIDY_KEYS[key]
+    except KeyError:
+        if isinstance(key, bytes):
+            tidy = tidy_key(key.decode("utf-8"))
+        else:
+            tidy = tidy_key(key)
+        _TIDY_KEYS[key] = tidy
+        return tidy
+
 class BamcheckReader(AbstractReader):
     """Wraps a file handler and provides access to bamcheckr'd file contents."""
 
-    def __init__(self, filepath, CLASSES=None, auto_close=True):
+    CACHE_ATTRIBUTES = ("summary", "indel", "diagnostics")
+
+    # Read whole files as a single block with process_block, set to None
+    # to read line by line with process_line instead
+    BLOCK_SIZE = 0
+
+    # Add the summaries of the indel distribution to the data returned by
+    # get_data, as parameters named by IndelDistribution.summary
+    INDEL_PARAMETERS = False
+
+    def __init__(self, filepath, CLASSES=None, auto_close=True, cache=None, fileobj=None):
         """Initialise the structures for storing data and construct the reader."""
-        self._id = os.path.basename(filepath).split(".")[0]
+        self._id = self.path_id(filepath)
         self.summary = SummaryNumbers()
         self.indel = IndelDistribution()
-        super(BamcheckReader, self).__init__(filepath, CLASSES, auto_close, 0)
+
+        # ID records are collected as they are read (as arrays of records for
+        # each block, or a list of records from each line) and built in to the
+        # indel distribution once the whole file has been processed
+        self._indel_blocks = []
+        self._indel_records = []
+        super(BamcheckReader, self).__init__(filepath, CLASSES, auto_close, 0, cache, fileobj)
+
+    @classmethod
+    def path_id(cls, filepath):
+        """Return the ID of a file, the first part of its name."""
+        return os.path.basename(filepath).split(".")[0]
+
+    def process_file(self):
+        """Process the file and build the indel distribution from its records."""
+        super(BamcheckReader, self).process_file()
+        if self._indel_records:
+            self._indel_blocks.append(np.array(self._indel_records, dtype=np.int64))
+        if self._indel_blocks:
+            self.indel = IndelDistribution.from_records(np.concatenate(self._indel_blocks))
+        self._indel_blocks = []
+        self._indel_records = []
 
     def process_line(self, line):
         """Process a record of the bamcheckr'd file."""
@@ -31,32 +87,59 @@ class BamcheckReader(AbstractReader):
             return
         fields = line.split("\t")
         if fields[0] == "SN":
-            name = tidy_key(fields[1])
+            key = tidy_key_cached(fields[1])
             try:
                 value = float(fields[2])
             except ValueError:
                 value = fields[2]
+                self.note("non_numeric", key, value, self.filepath)
+            self.add_summary(key, value)
 
-            # Check whether key already exists in summary
-            if name in self.summary:
-                print("[NOTE] Duplicate key for %s found in %s" % (name, self.handler.name))
+        elif fields[0] == "ID":
+            self._indel_records.append((int(fields[1]), int(fields[2]), int(fields[3])))
 
-                # Check whether the duplicate value is equal to the current
-                if self.summary[name] != value:
-                    raise Exception("[FAIL] Duplicate differing key for %s found in %s" % (name, self.handler.name))
-                return
-            self.summary[name] = value
+    def process_block(self, block):
+        """Process the SN and ID records of a block of the bamcheckr'd file,
+        skipping all other sections."""
+        # Blocks start at the start of a line
+        block = b"\n" + block
 
-        elif fields[0] == "ID":
-            self.indel.lengths.append(int(fields[1]))
-            self.indel.inserts.append(int(fields[2]))
-            self.indel.deletes.append(int(fields[3]))
+        for key, value in SN_PATTERN.findall(block):
+            key = tidy_key_cached(key)
+            try:
+                value = float(value)
+            except ValueError:
+                value = value.decode("utf-8").strip()
+                self.note("non_numeric", key, value, self.filepath)
+            self.add_summary(key, value)
+
+        records = ID_PATTERN.findall(block)
+        if records:
+            self._indel_blocks.append(np.array(records).astype(np.int64))
+
+    def add_summary(self, name, value):
+        """Add a summary number, checking any duplicate key has the same value."""
+        # Check whether key already exists in summary
+        if name in self.summary:
+            self.note("duplicate_key", name, self.filepath)
+
+            # Check whether the duplicate value is equal to the current
+            if self.summary[name] != value:
+                raise Exception("[FAIL] Duplicate differing key for %s found in %s" % (name, self.filepath))
+            return
+        self.summary[name] = value
 
     def get_id(self):
         return self._id
 
     def get_data(self):
-        """Return read summary data."""
+        """Return read summary data, and the indel distribution summaries if
+        INDEL_PARAMETERS is set."""
+        if self.INDEL_PARAMETERS:
+            data = SummaryNumbers()
+            data.update(self.summary)
+            data.update(self.indel.summary())
+            return data
         return self.summary
 
 
@@ -74,16 +157,69 @@ class SummaryNumbers(dict):
         return matches
 
 class IndelDistribution(object):
-    """Novel object to hold a trio of lengths, inserts and deletes counters."""
-    def __init__(self):
-        self.lengths = []
-        self.inserts = []
-        self.deletes = []
+    """
+    Novel object to hold a trio of lengths, inserts and deletes counters, as
+    parallel integer arrays sorted by length.
+    """
+    def __init__(self, lengths=(), inserts=(), deletes=()):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        order = np.argsort(lengths, kind="mergesort")
+        self.lengths = lengths[order]
+        self.inserts = np.asarray(inserts, dtype=np.int64)[order]
+        self.deletes = np.asarray(deletes, dtype=np.int64)[order]
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a distribution from an array of (length, inserts, deletes) rows."""
+        records = np.asarray(records, dtype=np.int64).reshape(-1, 3)
+        return cls(records[:, 0], records[:, 1], records[:, 2])
 
     def total_inserts(self):
         """Return sum of total inserts."""
-        return sum(self.inserts)
+        return int(self.inserts.sum())
 
     def total_deletes(self):
         """Return sum of total deletes."""
-        return sum(self.deletes)
+        return int(self.deletes.sum())
+
+    def mean_length(self):
+        """Return the mean length of all indels (or NaN if there are none)."""
+        counts = self.inserts + self.deletes
+        total = counts.sum()
+        if not total:
+            return np.nan
+        return float((self.lengths * counts).sum()) / total
+
+    def quantiles(self, qs):
+        """
+        Return the indel length at each of the given quantiles (between 0 and
+        1) of all indels, ie. the shortest length at which the cumulative count
+        of indels reaches that fraction of the total (or NaN if there are none).
+        """
+        cumulative = np.cumsum(self.inserts + self.deletes)
+        qs = np.asarray(qs, dtype=float)
+        if not len(cumulative) or not cumulative[-1]:
+            return np.zeros(qs.shape) * np.nan
+        targets = np.maximum(np.ceil(qs * cumulative[-1]), 1)
+        return self.lengths[np.searchsorted(cumulative, targets)].astype(float)
+
+    def insert_delete_ratio(self):
+        """Return the ratio of inserts to deletes (or NaN if there are no deletes)."""
+        deletes = self.total_deletes()
+        if not deletes:
+            return np.nan
+        return float(self.total_inserts()) / deletes
+
+    def summary(self):
+        """Return a dictionary of summaries of the distribution, named as
+        parameters alongside the summary numbers."""
+        quartiles = self.quantiles([0.25, 0.5, 0.75])
+        return {
+            "indel-total-inserts": float(self.total_inserts()),
+            "indel-total-deletes": float(self.total_deletes()),
+            "indel-mean-length": self.mean_length(),
+            "indel-lower-quartile-length": quartiles[0],
+            "indel-median-length": quartiles[1],
+            "indel-upper-quartile-length": quartiles[2],
+            "indel-insert-delete-ratio": self.insert_delete_ratio(),
+        }
@@ -0,0 +1,170 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Increment to invalidate all existing entries if the cached structures change
+CACHE_VERSION = 3
+
+def hash_file(filepath, block_size=1 << 20):
+    """Return the SHA1 hex digest of the contents of a file."""
+    digest = hashlib.sha1()
+    fh = open(filepath, 'rb')
+    try:
+        block = fh.read(block_size)
+        while block:
+            digest.update(block)
+            block = fh.read(block_size)
+    finally:
+        fh.close()
+    return digest.hexdigest()
+
+class ParseCache(object):
+    """
+    An on-disk cache of the structures parsed from input files by a reader,
+    stored as one pickle per reader class and file under cache_dir.
+
+    An entry is valid while the path, size and modification time of its file
+    are unchanged (and the SHA1 of its content, if use_hash is set). Entries
+    are evicted in least recently used order once the cache exceeds max_size
+    bytes, if given. A disabled cache never returns or stores entries.
+
+    Readers opt in by listing the attributes to cache in CACHE_ATTRIBUTES,
+    those attributes must not depend on the CLASSES given to the reader.
+    """
+
+    def __init__(self, cache_dir, max_size=None, use_hash=False, enabled=True):
+        """Initialise the cache, creating cache_dir if required."""
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.use_hash = use_hash
+        self.enabled = enabled
+
+        # Total size of entries, counted on the first store
+        self._size = None
+
+        if enabled and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_path(self, reader_class, filepath):
+        """Return the path of the entry for a file read by a reader class."""
+        key = "%d:%s.%s:%s" % (CACHE_VERSION, reader_class.__module__,
+                reader_class.__name__, os.path.abspath(filepath))
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def _signature(self, filepath):
+        """Return the (path, size, mtime[, hash]) used to validate an entry."""
+        st = os.stat(filepath)
+        signature = (os.path.abspath(filepath), st.st_size, st.st_mtime)
+        if self.use_hash:
+            signature += (hash_file(filepath),)
+        return signature
+
+    def get(self, reader_class, filepath):
+        """
+        Return the cached dictionary of attributes read from a file by the
+        given reader class, or None if there is no valid entry.
+        """
+        if not self.enabled:
+            return None
+
+        entry_path = self._entry_path(reader_class, filepath)
+        try:
+            fh = open(entry_path, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            signature, state = pickle.load(fh)
+        except Exception:
+            # Treat an unreadable entry as a miss, it will be replaced
+            return None
+        finally:
+            fh.close()
+
+        if signature != self._signature(filepath):
+            self._remove(entry_path)
+            return None
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return state
+
+    def put(self, reader_class, filepath, state):
+        """Store the dictionary of attributes read from a file by the given
+        reader class, evicting old entries if the cache is too large."""
+        if not self.enabled:
+            return
+
+        entry_path = self._entry_path(reader_class, filepath)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp")
+        fh = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump((self._signature(filepath), state), fh, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fh.close()
+
+        # Replace atomically so concurrent readers never see a partial entry
+        os.rename(tmp_path, entry_path)
+
+        if self.max_size is not None:
+            if self._size is None:
+                self._size = sum(size for path, size, mtime in self._entries())
+            else:
+                self._size += os.path.getsize(entry_path)
+            if self._size > self.max_size:
+                self.evict()
+
+    def invalidate(self, reader_class, filepath):
+        """Remove the entry for a file read by the given reader class."""
+        self._remove(self._entry_path(reader_class, filepath))
+
+    def clear(self):
+        """Remove all entries."""
+        for path, size, mtime in self._entries():
+            self._remove(path)
+        self._size = 0
+
+    def evict(self, max_size=None):
+        """Remove the least recently used entries until the cache is no larger
+        than max_size bytes (or the max_size of the cache)."""
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if total <= max_size:
+                break
+            self._remove(path)
+            total -= size
+        self._size = total
+
+    def _entries(self):
+        """Return a list of (path, size, mtime) for each entry."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Removed by another process
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _remove(self, path):
+        """Remove an entry, ignoring entries already removed."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
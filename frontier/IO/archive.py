@@ -0,0 +1,51 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import tarfile
+import zipfile
+
+# Extensions of the archives read in place of a data file, archives are told
+# apart by name so that listing a data directory does not open every file
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_EXTENSIONS = (".zip",)
+
+def is_archive(path):
+    """Return whether path names a tar or zip archive."""
+    return path.lower().endswith(TAR_EXTENSIONS + ZIP_EXTENSIONS)
+
+def iter_archive(path, members=None):
+    """
+    Yield the (name, contents) of each regular file in the tar or zip archive
+    at path (or only those named in members, if given), reading the archive
+    once from start to end without extracting it.
+    """
+    if path.lower().endswith(ZIP_EXTENSIONS):
+        zf = zipfile.ZipFile(path)
+        try:
+            for info in zf.infolist():
+                if info.filename.endswith("/"):
+                    continue
+                if members is not None and info.filename not in members:
+                    continue
+                yield info.filename, zf.read(info)
+        finally:
+            zf.close()
+        return
+
+    # Open as a stream, so a compressed tar is only decompressed once
+    tf = tarfile.open(path, "r|*")
+    try:
+        for info in tf:
+            if not info.isfile():
+                continue
+            if members is not None and info.name not in members:
+                continue
+            fh = tf.extractfile(info)
+            try:
+                yield info.name, fh.read()
+            finally:
+                fh.close()
+    finally:
+        tf.close()
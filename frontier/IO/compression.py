@@ -0,0 +1,207 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import collections
+import concurrent.futures
+import gzip
+import io
+import lzma
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Leading bytes of each supported compressed format (bgzip is gzip with a BC
+# extra field, told apart by detect_compression)
+MAGIC = [
+    ("gzip", b"\x1f\x8b"),
+    ("xz", b"\xfd7zXZ\x00"),
+    ("zstd", b"\x28\xb5\x2f\xfd"),
+]
+
+# An empty BGZF block, written at the end of every BGZF file
+BGZF_EOF = (b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00"
+        b"\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+# Largest amount of data written to a single BGZF block
+BGZF_BLOCK_SIZE = 0xff00
+
+def detect_compression(fh):
+    """
+    Return the compression format (gzip, bgzip, xz or zstd) of a binary
+    file object by its magic bytes, or None if it is not compressed. The
+    position of fh is left unchanged.
+    """
+    position = fh.tell()
+    head = fh.read(14)
+    fh.seek(position)
+
+    for compression, magic in MAGIC:
+        if head.startswith(magic):
+            if compression == "gzip" and len(head) == 14 and ord(head[3:4]) & 4 and head[12:14] == b"BC":
+                return "bgzip"
+            return compression
+    return None
+
+def open_stream(source, compression, threads=None):
+    """
+    Return a binary file object that streams the decompressed contents of
+    source (a path or binary file object), compressed with the given format.
+    A bgzip stream is decompressed a block at a time by a pool of threads, if
+    more than one is given.
+    """
+    if compression == "bgzip" and threads is not None and threads > 1:
+        return io.BufferedReader(BgzfReader(_open_binary(source), threads))
+    elif compression in ("gzip", "bgzip"):
+        return gzip.open(source, "rb")
+    elif compression == "xz":
+        return lzma.open(source, "rb")
+    elif compression == "zstd":
+        if zstandard is None:
+            raise Exception("The zstandard package is required to read zstd compressed input")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(_open_binary(source)))
+    raise Exception("Unknown compression: %s" % compression)
+
+def _open_binary(source):
+    """Return source opened for binary reading, if it is a path."""
+    if isinstance(source, str):
+        return open(source, 'rb')
+    return source
+
+class _SourceText(io.TextIOWrapper):
+    """A text stream of a decompressed stream that also closes the file the
+    compressed data is read from."""
+
+    def __init__(self, stream, source):
+        super(_SourceText, self).__init__(stream)
+        self._source = source
+
+    def close(self):
+        try:
+            super(_SourceText, self).close()
+        finally:
+            self._source.close()
+
+def open_text(filepath, threads=None):
+    """
+    Open a file for reading as text, decompressing it as it is read if it is
+    compressed. The file is opened once, its magic bytes are read through the
+    same handle that the text (or the decompressor) then reads. Returns the
+    text file object and the compression format (or None).
+    """
+    fh = open(filepath, 'rb')
+    try:
+        compression = detect_compression(fh)
+        if compression is None:
+            return io.TextIOWrapper(fh), None
+        return _SourceText(open_stream(fh, compression, threads), fh), compression
+    except Exception:
+        fh.close()
+        raise
+
+def open_bytes(content, threads=None):
+    """
+    Return a text file object of the given contents of a file (as bytes),
+    decompressing them as they are read if they are compressed.
+    """
+    fh = io.BytesIO(content)
+    compression = detect_compression(fh)
+    if compression is None:
+        return io.TextIOWrapper(fh)
+    return io.TextIOWrapper(open_stream(fh, compression, threads))
+
+class BgzfReader(io.RawIOBase):
+    """
+    A raw binary stream of the decompressed contents of a BGZF file. Blocks
+    are read in order from fh and decompressed by a pool of threads, up to
+    four blocks per thread ahead of the reader (zlib releases the GIL while
+    it decompresses).
+    """
+
+    def __init__(self, fh, threads):
+        super(BgzfReader, self).__init__()
+        self._fh = fh
+        self._executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self._window = threads * 4
+        self._pending = collections.deque()
+        self._buffer = b""
+        self._offset = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _read_block(self):
+        """Return the next whole (compressed) block of the file, or None at
+        the end of the file."""
+        header = self._fh.read(12)
+        if not header:
+            return None
+        if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+            raise Exception("Invalid BGZF block header")
+
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = self._fh.read(xlen)
+        bsize = None
+        i = 0
+        while i + 4 <= len(extra):
+            slen = struct.unpack("<H", extra[i + 2:i + 4])[0]
+            if extra[i:i + 2] == b"BC" and slen == 2:
+                bsize = struct.unpack("<H", extra[i + 4:i + 6])[0]
+                break
+            i += 4 + slen
+        if bsize is None:
+            raise Exception("BGZF block has no BC field")
+
+        rest = self._fh.read(bsize + 1 - 12 - xlen)
+        return header + extra + rest
+
+    def _fill(self):
+        """Keep the window of blocks being decompressed full."""
+        while not self._eof and len(self._pending) < self._window:
+            block = self._read_block()
+            if block is None:
+                self._eof = True
+                break
+            # wbits of 31 decompresses the block as a whole gzip member
+            self._pending.append(self._executor.submit(zlib.decompress, block, 31))
+
+    def readinto(self, b):
+        while self._offset >= len(self._buffer):
+            self._fill()
+            if not self._pending:
+                return 0
+            self._buffer = self._pending.popleft().result()
+            self._offset = 0
+
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._fh.close()
+        super(BgzfReader, self).close()
+
+def bgzf_compress(data, level=6):
+    """Return the given bytes compressed as a BGZF file, as written by bgzip."""
+    blocks = []
+    for start in range(0, len(data), BGZF_BLOCK_SIZE):
+        chunk = data[start:start + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(chunk) + compressor.flush()
+        blocks.append(b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00")
+        blocks.append(struct.pack("<H", len(cdata) + 25))
+        blocks.append(cdata)
+        blocks.append(struct.pack("<II", zlib.crc32(chunk) & 0xffffffff, len(chunk)))
+    blocks.append(BGZF_EOF)
+    return b"".join(blocks)
@@ -0,0 +1,163 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import json
+import os
+
+import numpy as np
+
+from frontier.sampling import class_rows
+
+# Increment if the layout of saved splits changes
+SPLITS_VERSION = 1
+
+def _split(fold_of, n_folds):
+    """Return a (train, test) pair of index arrays for each fold of fold_of."""
+    return [(np.flatnonzero(fold_of != fold), np.flatnonzero(fold_of == fold))
+            for fold in range(0, n_folds)]
+
+def stratified_kfold(codes, k, rng):
+    """
+    Return a list of k (train, test) pairs of sorted index arrays of the given
+    target codes, where each index is in exactly one test set and the test
+    sets hold each class in (about) the same proportion as the codes, using
+    the numpy RandomState rng.
+    """
+    codes = np.asarray(codes)
+    if k < 2 or k > len(codes):
+        raise Exception("Cannot make %d folds of %d observations" % (k, len(codes)))
+
+    fold_of = np.empty(len(codes), dtype=int)
+    start = 0
+    for code, group in sorted(class_rows(codes).items()):
+        # Deal the rows of each class to the folds in turn, starting where the
+        # last class stopped so that the folds are as even in size as possible
+        fold_of[rng.permutation(group)] = (start + np.arange(len(group))) % k
+        start = (start + len(group)) % k
+    return _split(fold_of, k)
+
+def stratified_holdout(codes, test_size, rng):
+    """
+    Return a (train, test) pair of sorted index arrays of the given target
+    codes, where the test set holds test_size (a fraction) of each class,
+    using the numpy RandomState rng.
+    """
+    if not 0 < test_size < 1:
+        raise Exception("test_size must be between 0 and 1")
+    codes = np.asarray(codes)
+    in_test = np.zeros(len(codes), dtype=int)
+    for code, group in sorted(class_rows(codes).items()):
+        in_test[rng.permutation(group)[:int(round(test_size * len(group)))]] = 1
+    return _split(in_test, 2)[1]
+
+class Splits(object):
+    """
+    A list of (train, test) splits of a set of rows of an ObservationStore.
+
+    rows holds the store row indexes of the observations that were split,
+    in order, and train and test hold indexes in to rows. Iterating over
+    Splits yields the (train, test) pairs, so they may be passed as the cv
+    of a scikit-learn search over the data and targets of those rows (as
+    returned by get_data_by_target) without copying them. fingerprint is
+    that of the store the splits were made of (see ObservationStore).
+    """
+
+    def __init__(self, kind, rows, pairs, fingerprint=None, options=None):
+        self.kind = kind
+        self.rows = np.asarray(rows, dtype=int)
+        self.pairs = [(np.asarray(train, dtype=int), np.asarray(test, dtype=int))
+                for train, test in pairs]
+        self.fingerprint = fingerprint
+        self.options = options or {}
+
+    @classmethod
+    def kfold(cls, rows, codes, k=5, repeats=1, seed=0, fingerprint=None):
+        """
+        Return repeats sets of stratified k-fold splits of the given rows
+        and their target codes, shuffled by a RandomState seeded with seed.
+        """
+        rng = np.random.RandomState(seed)
+        pairs = []
+        for _ in range(0, repeats):
+            pairs.extend(stratified_kfold(codes, k, rng))
+        return cls("kfold", rows, pairs, fingerprint,
+                {"k": k, "repeats": repeats, "seed": seed})
+
+    @classmethod
+    def holdout(cls, rows, codes, test_size=0.25, repeats=10, seed=0, fingerprint=None):
+        """
+        Return repeats stratified holdout splits of the given rows and their
+        target codes, shuffled by a RandomState seeded with seed.
+        """
+        rng = np.random.RandomState(seed)
+        pairs = [stratified_holdout(codes, test_size, rng) for _ in range(0, repeats)]
+        return cls("holdout", rows, pairs, fingerprint,
+                {"test_size": test_size, "repeats": repeats, "seed": seed})
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __getitem__(self, index):
+        return self.pairs[index]
+
+    def store_rows(self, index):
+        """Return the (train, test) store row indexes of a split."""
+        train, test = self.pairs[index]
+        return self.rows[train], self.rows[test]
+
+    def save(self, path):
+        """Write the splits to an .npz file at path."""
+        arrays = {"rows": self.rows}
+        for i, (train, test) in enumerate(self.pairs):
+            arrays["train_%d" % i] = train
+            arrays["test_%d" % i] = test
+        meta = {
+            "version": SPLITS_VERSION,
+            "kind": self.kind,
+            "n": len(self.pairs),
+            "fingerprint": self.fingerprint,
+            "options": self.options,
+        }
+        fh = open(path, "wb")
+        try:
+            np.savez(fh, meta=np.array(json.dumps(meta)), **arrays)
+        finally:
+            fh.close()
+
+    @classmethod
+    def open(cls, path):
+        """Return the splits saved at path."""
+        arrays = np.load(path)
+        try:
+            meta = json.loads(str(arrays["meta"]))
+            if meta["version"] != SPLITS_VERSION:
+                raise Exception("Unsupported splits version %s in %s" % (meta["version"], path))
+            pairs = [(arrays["train_%d" % i], arrays["test_%d" % i]) for i in range(0, meta["n"])]
+            return cls(meta["kind"], arrays["rows"], pairs, meta["fingerprint"], meta["options"])
+        finally:
+            arrays.close()
+
+def save_splits(path, splits):
+    """Write a dictionary of named Splits to the directory at path, removing
+    any splits already saved there."""
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for fname in os.listdir(path):
+        if fname.endswith(".npz"):
+            os.remove(os.path.join(path, fname))
+    for name, split in splits.items():
+        split.save(os.path.join(path, "%s.npz" % name))
+
+def open_splits(path):
+    """Return a dictionary of the named Splits saved in the directory at path."""
+    splits = {}
+    if os.path.isdir(path):
+        for fname in sorted(os.listdir(path)):
+            if fname.endswith(".npz"):
+                splits[fname[:-4]] = Splits.open(os.path.join(path, fname))
+    return splits
@@ -4,18 +4,122 @@ __copyright__ = "Copyright (c) Sam Nicholls"
 __version__ = "0.1.2"
 __maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
 
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import logging
 import math
+import multiprocessing
 import os
 import sys
+import time
 
 import numpy as np
 
+from frontier.IO.archive import is_archive, iter_archive
+from frontier.IO.compression import open_bytes
+from frontier.IO.ParseCache import hash_file
+from frontier import sampling
+from frontier.folds import Splits, open_splits, save_splits
+from frontier.report import Diagnostics, LoadReport
+from frontier.store import ObservationStore
+from frontier.targets import TargetTable
+
+logger = logging.getLogger("frontier")
+
+class ClassRegistry(dict):
+    """
+    A CLASSES dictionary compiled with a map of each lowercase name to its
+    class and of each code to its canonical class (ignoring classes that have
+    been given a _recode), so labels and codes can be looked up in constant
+    time. A ClassRegistry may be used wherever a CLASSES dictionary is.
+
+    Each class is copied, so counts are kept separately from the CLASSES the
+    registry was compiled from.
+    """
+
+    def __init__(self, classes):
+        """Copy and compile the given CLASSES dictionary."""
+        dict.__init__(self, ((cl, dict(classes[cl])) for cl in classes))
+
+        self._labels = {}
+        self._codes = {}
+        for cl in self:
+            for name in self[cl]["names"]:
+                self._labels.setdefault(name.lower(), cl)
+            if "code" in self[cl] and "_recode" not in self[cl]:
+                self._codes.setdefault(self[cl]["code"], cl)
+
+    @classmethod
+    def compile(cls, classes):
+        """Return the given classes as a ClassRegistry, compiling them if needed."""
+        if isinstance(classes, cls):
+            return classes
+        return cls(classes)
+
+    def classify(self, label):
+        """Return the canonical class label of a label."""
+        try:
+            return self._labels[label.lower()]
+        except KeyError:
+            raise Exception("Unknown Label Class: %s" % label)
+
+    def encode(self, class_label):
+        """Given a canonical class label, return its code."""
+        if not class_label in self:
+            raise Exception("Unknown Class: %s" % class_label)
+
+        if "code" not in self[class_label]:
+            raise Exception("Class %s has no Code" % class_label)
+        return self[class_label]["code"]
+
+    def decode(self, class_code):
+        """Given a code, return the canonical class label (or its recoded label)."""
+        try:
+            return self._codes[class_code]
+        except (KeyError, TypeError):
+            raise Exception("Unknown Label Code: %s" % class_code)
+
+    def digest(self):
+        """Return a hash of the names, codes and recodes of the classes,
+        ignoring their counts."""
+        classes = dict((cl, dict((key, value) for key, value in self[cl].items() if key != "_count"))
+                for cl in self)
+        return hashlib.sha1(json.dumps(classes, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def count(self, class_label, n=1):
+        """Increment the _count of a class by n, given its canonical label."""
+        if not class_label in self:
+            raise Exception("Unknown Class: %s" % class_label)
+        self[class_label]["_count"] = self[class_label].get("_count", 0) + n
+
+    def encode_labels(self, labels):
+        """Return an array of the code of the class of each label, classifying
+        each distinct label once."""
+        codes = {}
+        for label in set(labels):
+            codes[label] = self.encode(self.classify(label))
+        return np.array([codes[label] for label in labels])
+
+    def decode_codes(self, class_codes):
+        """Return an array of the canonical class label of each code."""
+        class_codes = np.asarray(class_codes)
+        if not len(class_codes):
+            return np.array([], dtype=object)
+        unique, inverse = np.unique(class_codes, return_inverse=True)
+        labels = np.array([self.decode(code) for code in unique.tolist()], dtype=object)
+        return labels[inverse.reshape(-1)]
+
 def classify_label(classes, label):
     """
     Attempt to classify a label by comparing a given string to each set of
     names defined in classes, an exact match will return the relevant canonical
     class label.
     """
+    if isinstance(classes, ClassRegistry):
+        return classes.classify(label)
     for cl in classes:
         for name in classes[cl]["names"]:
             if name.lower() == label.lower():
@@ -24,6 +128,8 @@ def classify_label(classes, label):
 
 def encode_class(classes, class_label):
     """Given a canonical class label, return its code."""
+    if isinstance(classes, ClassRegistry):
+        return classes.encode(class_label)
     if not class_label in classes:
         raise Exception("Unknown Class: %s" % class_label)
 
@@ -33,6 +139,8 @@ def encode_class(classes, class_label):
 
 def decode_class(classes, class_code):
     """ Given a code, return the canonical class label (or its recoded label)."""
+    if isinstance(classes, ClassRegistry):
+        return classes.decode(class_code)
     for cl in classes:
         if classes[cl]["code"] == class_code and "_recode" not in classes[cl]:
             return cl
@@ -41,6 +149,8 @@ def decode_class(classes, class_code):
 def count_class(classes, class_label):
     """Increment the _count in classes for a particular class,
     given its canonical label."""
+    if isinstance(classes, ClassRegistry):
+        return classes.count(class_label)
     if not class_label in classes:
         raise Exception("Unknown Class: %s" % class_label)
 
@@ -48,107 +158,810 @@ def count_class(classes, class_label):
         classes[class_label]["_count"] = 0
     classes[class_label]["_count"] += 1
 
+def _file_stat(fpath):
+    """Return the (size, mtime) of a file, used to tell if it has changed."""
+    st = os.stat(fpath)
+    return st.st_size, st.st_mtime
+
+# Data reader class and CLASSES used by the worker processes of a parallel
+# load, set once per worker by _init_reader_worker rather than sent per task
+_WORKER_READER = None
+
+def _init_reader_worker(CLASSES, DATA_READER_CLASS, cache):
+    """Prepare a worker process to read observations for a parallel load."""
+    global _WORKER_READER
+    _WORKER_READER = (CLASSES, DATA_READER_CLASS, cache)
+
+def _open_reader(READER_CLASS, fpath, CLASSES, cache=None, fileobj=None, ids=None):
+    """Construct a reader, only passing the cache, file object and ids to
+    readers if they are in use."""
+    kwargs = {}
+    if cache is not None:
+        kwargs["cache"] = cache
+    if fileobj is not None:
+        kwargs["fileobj"] = fileobj
+    if ids is not None:
+        kwargs["ids"] = ids
+    return READER_CLASS(fpath, CLASSES, auto_close=True, **kwargs)
+
+def _read_observation(fpath, CLASSES=None, DATA_READER_CLASS=None, cache=None):
+    """
+    Read a single data file and return its path, (size, mtime), id, data, the
+    problems noted by its reader and the (wall, cpu) time taken to read it,
+    using the given reader or the one set up for this worker by
+    _init_reader_worker.
+    """
+    if DATA_READER_CLASS is None:
+        CLASSES, DATA_READER_CLASS, cache = _WORKER_READER
+    wall, cpu = time.time(), time.process_time()
+    stat = _file_stat(fpath)
+    drc = _open_reader(DATA_READER_CLASS, fpath, CLASSES, cache)
+    data = drc.get_data()
+    return fpath, stat, drc.get_id(), data, drc.diagnostics, (time.time() - wall, time.process_time() - cpu)
+
+def _read_file_bytes(fpath):
+    """
+    Return the (size, mtime), contents and wall time taken to read a data
+    file, called from the executor threads of an asynchronous load.
+    """
+    wall = time.time()
+    stat = _file_stat(fpath)
+    fh = open(fpath, 'rb')
+    try:
+        content = fh.read()
+    finally:
+        fh.close()
+    return stat, content, time.time() - wall
+
+def _iter_observations_async(fpaths, CLASSES, DATA_READER_CLASS, cache, concurrency):
+    """
+    Yield the (path, stat, id, data, diagnostics, timing) observation of each data file in
+    order, as _read_observation. An asyncio event loop keeps up to concurrency
+    files being read ahead by a thread executor, so the latency of opening and
+    reading each file is hidden behind the parsing of those before it. Each
+    read buffer is parsed in this process (decompressing it, if needed) by
+    passing it to the reader as its fileobj.
+    """
+    loop = asyncio.new_event_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+    fpaths = iter(fpaths)
+    pending = collections.deque()
+
+    def read_ahead():
+        for fpath in fpaths:
+            pending.append((fpath, loop.run_in_executor(executor, _read_file_bytes, fpath)))
+            return
+
+    try:
+        for i in range(0, concurrency):
+            read_ahead()
+
+        while pending:
+            fpath, future = pending.popleft()
+            stat, content, read_wall = loop.run_until_complete(future)
+            read_ahead()
+
+            wall, cpu = time.time(), time.process_time()
+            fileobj = open_bytes(content, getattr(DATA_READER_CLASS, "DECOMPRESS_THREADS", None))
+            drc = _open_reader(DATA_READER_CLASS, fpath, CLASSES, cache, fileobj)
+            data = drc.get_data()
+            yield fpath, stat, drc.get_id(), data, drc.diagnostics, (read_wall + time.time() - wall,
+                    time.process_time() - cpu)
+    finally:
+        for fpath, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        loop.close()
+
+def _iter_archive_observations(archive, members, CLASSES, DATA_READER_CLASS):
+    """
+    Yield the (path, stat, id, data, diagnostics, timing) observation of each member of an
+    archive (or only those named in members, if given), as _read_observation.
+    The path of each member is its name joined to the path of the archive and
+    its stat is that of the archive. The archive is read once, in order, and
+    each member is parsed in this process.
+    """
+    stat = _file_stat(archive)
+    threads = getattr(DATA_READER_CLASS, "DECOMPRESS_THREADS", None)
+
+    wall, cpu = time.time(), time.process_time()
+    for name, content in iter_archive(archive, members):
+        fpath = os.path.join(archive, name)
+        drc = _open_reader(DATA_READER_CLASS, fpath, CLASSES, fileobj=open_bytes(content, threads))
+        data = drc.get_data()
+        yield fpath, stat, drc.get_id(), data, drc.diagnostics, (time.time() - wall, time.process_time() - cpu)
+        wall, cpu = time.time(), time.process_time()
+
 class Statplexer(object):
     """An interface for the loading, storage and retrieval of data and targets."""
 
-    def __init__(self, data_dir, target_path, CLASSES, DATA_READER_CLASS, TARGET_READER_CLASS):
+    def __init__(self, data_dir, target_path, CLASSES, DATA_READER_CLASS, TARGET_READER_CLASS,
+            processes=1, chunksize=64, cache=None, progress=None, concurrency=None,
+            join_targets=False, target_index=None, dedup=False, dtypes=None):
         """
         Initialise the Statplexer _data and _target structures and pass the user
         provided data and target path to the load_data function.
+
+        processes, chunksize and concurrency are passed to load_data to control
+        whether data files are read serially, by a pool of worker processes
+        or asynchronously, cache is an optional ParseCache for the readers and
+        progress an optional callback for the LoadReport of the load (kept as
+        load_report). join_targets and target_index control how the targets
+        are read and dedup whether duplicate data files are read, see
+        load_data. dtypes is an optional DtypePolicy of the dtypes the data
+        and targets are stored and returned as (float64 by default).
         """
         self.data_dir = data_dir
         self.target_path = target_path
 
+        # Observations are read in to _data and moved to the columnar _store
+        # by _get_store before the data is next queried
         self._data = {}
         self._targets = {}
+        self._store = ObservationStore(dtypes)
+
+        # The (size, mtime) and observation (or None, if it had no target) of
+        # each data file read, and the state of the target file and all of
+        # its targets, so refresh can read only what has changed
+        self._files = {}
+        self._target_stat = None
+
+        # The data file each loaded observation was read from, as data files
+        # of the same name (in different directories) are the same observation
+        self._sources = {}
+        self._target_lookup = {}
 
-        self._classes = CLASSES.copy()
+        # Ids the targets were read for, if only the targets of the ids of
+        # the data files were read
+        self._target_ids = None
+
+        # The (size, mtime) and content hash of each data file hashed to find
+        # duplicates, the content hash of each file being read that shares its
+        # contents and of each observation waiting in _data that does
+        self._hashes = {}
+        self._file_keys = {}
+        self._data_keys = {}
+
+        # The (size, mtime) and member paths of each archive read, and the
+        # archive and name of each member path
+        self._archives = {}
+        self._members = {}
+
+        self._readers = (DATA_READER_CLASS, TARGET_READER_CLASS)
+        self._read_options = {"processes": processes, "chunksize": chunksize, "cache": cache,
+                "concurrency": concurrency, "join_targets": join_targets, "target_index": target_index}
+
+        self._classes = ClassRegistry(CLASSES)
         for cl in self._classes:
             self._classes[cl]["_count"] = 0
 
+        self.load_report = None
+
+        # Named Splits made by make_folds and make_holdouts
+        self._splits = {}
+
         if data_dir and target_path:
-            self.load_data(data_dir, target_path, DATA_READER_CLASS, TARGET_READER_CLASS)
+            self.load_data(data_dir, target_path, DATA_READER_CLASS, TARGET_READER_CLASS,
+                    processes=processes, chunksize=chunksize, cache=cache, progress=progress,
+                    concurrency=concurrency, join_targets=join_targets, target_index=target_index,
+                    dedup=dedup)
+
+    def load_data(self, data_dir, target_path, DATA_READER_CLASS, TARGET_READER_CLASS,
+            processes=1, chunksize=64, cache=None, progress=None, concurrency=None,
+            join_targets=False, target_index=None, dedup=False):
+        """
+        Populate the _data and _target structures using the specified readers.
+
+        Data files are read serially by default, otherwise by a pool of
+        processes workers (or one per CPU if processes is None), each given
+        chunksize files at a time. The DATA_READER_CLASS must be importable
+        by the workers (ie. defined at the top level of a module) to read in
+        parallel. Results are merged in the same order as a serial read, so
+        both produce the same data and warnings.
+
+        For file systems where opening and reading a file is slow (such as a
+        network file system), concurrency may be given instead of processes
+        to read data files asynchronously, keeping up to concurrency files
+        being read ahead by a thread executor while those already read are
+        parsed in this process. The DATA_READER_CLASS must then accept a
+        fileobj keyword argument, as the AbstractReader does.
+
+        data_dir may also be a tar or zip archive, and archives found in the
+        data directory are read in place of a data file, see _read_files.
+
+        If a ParseCache is given, it is passed to the readers (which must then
+        accept a cache keyword argument) so that files unchanged since they
+        were last read are restored from the cache rather than parsed.
+
+        The target file is read in full by default. If join_targets is set,
+        the data directory is walked first and only the targets of the ids of
+        its data files (the names of the files up to the first ".") are kept,
+        the TARGET_READER_CLASS must then accept an ids keyword argument, as
+        the AQCReader does. Otherwise, if a target_index directory is given,
+        the targets are saved there as a TargetTable the first time the target
+        file is read (or whenever it changes) and the memory mapped table is
+        searched for the target of each data file instead.
 
-    def load_data(self, data_dir, target_path, DATA_READER_CLASS, TARGET_READER_CLASS):
-        """Populate the _data and _target structures using the specified readers."""
+        If dedup is set, data files with the same contents as another are
+        found (by comparing sizes, then hashing only files whose size is that
+        of another) and each distinct content is only read once. Observations
+        of files with the same contents share one row of the store, the
+        groups of duplicate files found are kept in the LoadReport (see also
+        duplicate_groups). The ids of copies are given by the path_id of the
+        DATA_READER_CLASS, or are that of the file that was read.
+
+        Returns a LoadReport of the time taken by each phase of the load, the
+        throughput and the slowest files read (also kept as load_report). If
+        given, progress is called with the report after each data file is
+        read, see ProgressLogger for a callback that logs progress and ETA.
+        """
         #FUTURE Better handling for missing targets
         #FUTURE Better handling to ensure all observations have all variables
+        self.data_dir = data_dir
+        self.target_path = target_path
+        self._readers = (DATA_READER_CLASS, TARGET_READER_CLASS)
+        self._read_options = {"processes": processes, "chunksize": chunksize, "cache": cache,
+                "concurrency": concurrency, "join_targets": join_targets, "target_index": target_index,
+                "dedup": dedup}
 
-        # targets written to local variable rather than self._targets class
+        # targets written to _target_lookup rather than self._targets class
         # variable to ensure only targets for observations actually seen in
         # the input data are added to the data structure
-        targets = TARGET_READER_CLASS(target_path, self._classes, auto_close=True).get_data()
+        report = LoadReport(progress=progress)
+        if join_targets:
+            started = report.start()
+            fpaths = self._walk(data_dir)
+            report.stop("walk", started)
 
-        for root, subfolders, files in os.walk(self.data_dir):
-            print(root + "(" + str(len(files)) + " files)")
-            for f in files:
-                fpath = os.path.join(root, f)
+        started = report.start()
+        self._read_targets(self._file_ids(fpaths) if join_targets else None)
+        report.stop("targets", started)
 
-                drc = DATA_READER_CLASS(fpath, self._classes, auto_close=True)
-                _data = drc.get_data()
-                _id = drc.get_id()
+        if not join_targets:
+            started = report.start()
+            fpaths = self._walk(data_dir)
+            report.stop("walk", started)
+        report.files_total = len(fpaths)
 
-                if _id in self._data:
-                    print("[WARN] Duplicate observation %s found in %s" % (_id, fpath))
+        self._read_files(fpaths, report)
+        started = report.start()
+        self._get_store()
+        report.stop("merge", started)
 
-                if _id in targets:
-                    self._targets[_id] = targets[_id]
-                    self._data[f] = _data
+        # Test parameter variances and note those that are zero
+        started = report.start()
+        self._test_variance(report.diagnostics)
+        report.stop("variance", started)
 
-                    class_label = decode_class(self._classes, targets[_id])
-                    count_class(self._classes, class_label)
-                else:
-                    print("[WARN] INPUT missing TARGET")
+        report.finish()
+        self.load_report = report
+        return report
+
+    def save(self, path):
+        """
+        Write a snapshot of the loaded data to the directory at path, that can
+        be opened with Statplexer.open without reading the data again. The
+        snapshot holds the stored observations, parameter statistics, classes
+        (and their counts), targets and any splits.
+        """
+        store = self._get_store()
+        store.save(path)
+        save_splits(os.path.join(path, "splits"), self._splits)
+
+        fh = open(os.path.join(path, "statplexer.json"), "w")
+        try:
+            json.dump({
+                "data_dir": self.data_dir,
+                "target_path": self.target_path,
+                "classes": self._classes,
+                "targets": [[_id, code] for _id, code in self._targets.items()],
+            }, fh)
+        finally:
+            fh.close()
+
+    @classmethod
+    def open(cls, path, mmap_mode="r"):
+        """
+        Return a Statplexer of a snapshot written by save. The matrix of
+        parameter values is memory mapped with the given mmap_mode (see
+        ObservationStore.open), so opening is quick and the pages of the
+        matrix can be shared by several processes.
+
+        The readers used to load the snapshot are not saved, so refresh is
+        not available, but data can still be loaded with load_data.
+        """
+        fh = open(os.path.join(path, "statplexer.json"))
+        try:
+            snapshot = json.load(fh)
+        finally:
+            fh.close()
 
-        # Test parameter variances and output warning if zero
+        plex = cls(None, None, snapshot["classes"], None, None)
+        for cl in snapshot["classes"]:
+            plex._classes[cl]["_count"] = snapshot["classes"][cl]["_count"]
+        plex.data_dir = snapshot["data_dir"]
+        plex.target_path = snapshot["target_path"]
+        plex._targets = dict((_id, code) for _id, code in snapshot["targets"])
+        plex._store = ObservationStore.open(path, mmap_mode)
+        plex._splits = open_splits(os.path.join(path, "splits"))
+        return plex
+
+    def refresh(self):
+        """
+        Bring the loaded data up to date with the data directory and target
+        file, reading only data files that are new or have changed since they
+        were read and dropping those that have been deleted. The target file
+        is only read again if it has changed, in which case the targets (and
+        class counts) of loaded observations are updated and files that were
+        missing a target are read again.
+
+        An archive is read again in full if it has changed, otherwise its
+        members are treated as data files that have not changed.
+
+        Returns the lists of added and removed data file paths.
+        """
+        self._check_readers("refresh")
+        walked = self._walk(self.data_dir)
+        fpaths = self._expand_archives(walked, changed=False)
+        current = set(fpaths)
+
+        ids = None
+        if self._read_options["join_targets"]:
+            ids = self._file_ids(fpaths)
+        if (_file_stat(self.target_path) != self._target_stat
+                or (self._target_ids is not None and not (ids is not None and ids <= self._target_ids))):
+            self._read_targets(ids)
+            self._update_targets()
+            retry = set(fpath for fpath in self._files if self._files[fpath][1] is None)
+        else:
+            retry = set()
+
+        removed = []
+        for fpath in sorted(self._files):
+            if fpath not in current:
+                removed.append(fpath)
+            elif fpath in retry or self._stat(fpath) != self._files[fpath][0]:
+                removed.append(fpath)
+        self.remove_files(removed)
+
+        added = [fpath for fpath in fpaths if fpath not in self._files]
+        self._read_files(added)
+
+        if added or removed:
+            self._test_variance()
+
+        # Members of a changed archive that it still holds were read again
+        current = set(self._expand_archives(walked))
+        return added, [fpath for fpath in removed if fpath not in current]
+
+    def add_files(self, fpaths):
+        """
+        Read the given data files (replacing any already read from the same
+        path) and add their observations to the loaded data.
+        """
+        self._check_readers("add_files")
+        self.remove_files([fpath for fpath in self._expand_archives(fpaths) if fpath in self._files])
+        self._read_files(fpaths)
         self._test_variance()
 
-    def _test_variance(self):
-        """Test the variance of each parameter over all observations to ensure it
-        is non-zero, otherwise print a warning."""
-        parameters = self.list_parameters()
-        variances = np.zeros(len(parameters))
-        means = np.zeros(len(parameters))
+    def _check_readers(self, action):
+        """Raise an Exception if there are no readers to read data files with,
+        as for a Statplexer opened from a snapshot."""
+        if None in self._readers:
+            raise Exception("Cannot %s without data and target readers, call load_data "
+                    "to read data in to a Statplexer opened from a snapshot" % action)
+
+    def remove_files(self, fpaths):
+        """Remove the observations read from the given data files (or all
+        members of the given archives)."""
+        expanded = self._expand_archives(fpaths)
+        for fpath in fpaths:
+            self._archives.pop(fpath, None)
+
+        observations = []
+        for fpath in expanded:
+            observation = self._files.pop(fpath)[1]
+            self._file_keys.pop(fpath, None)
+            if observation is not None and self._sources.get(observation) == fpath:
+                observations.append(observation)
+
+        # Forget any other data file of a dropped observation, so that
+        # refresh reads it again
+        if observations:
+            dropped = set(observations)
+            for fpath in [fpath for fpath in self._files if self._files[fpath][1] in dropped]:
+                del self._files[fpath]
+                self._file_keys.pop(fpath, None)
+        self._remove_observations(observations)
+
+    def _walk(self, data_dir):
+        """Return the path of each file in data_dir and its subdirectories,
+        or just data_dir if it is a file (such as an archive)."""
+        if os.path.isfile(data_dir):
+            return [data_dir]
+
+        fpaths = []
+        for root, subfolders, files in os.walk(data_dir):
+            logger.debug("%s (%d files)", root, len(files))
+            for f in files:
+                fpaths.append(os.path.join(root, f))
+        return fpaths
+
+    def _expand_archives(self, fpaths, changed=True):
+        """
+        Return fpaths with each archive that has already been read replaced
+        by the paths of its members, or only those archives that have not
+        changed since they were read if changed is False.
+        """
+        expanded = []
+        for fpath in fpaths:
+            if fpath in self._archives and (changed or _file_stat(fpath) == self._archives[fpath][0]):
+                expanded.extend(self._archives[fpath][1])
+            else:
+                expanded.append(fpath)
+        return expanded
+
+    def _stat(self, fpath):
+        """Return the (size, mtime) of a data file, or of the archive of an
+        archive member."""
+        if fpath in self._members:
+            return _file_stat(self._members[fpath][0])
+        return _file_stat(fpath)
+
+    def _file_ids(self, fpaths):
+        """
+        Return the set of ids of the given data files, named by the file name
+        up to the first ".", or None if any is an archive (whose members are
+        not known until it is read).
+        """
+        ids = set()
+        for fpath in fpaths:
+            if is_archive(fpath):
+                return None
+            ids.add(os.path.basename(fpath).split(".")[0])
+        return ids
+
+    def _read_targets(self, ids=None):
+        """
+        Read the targets in the target file (or only those of the given ids)
+        in to _target_lookup, through the target_index if one is in use.
+        """
+        TARGET_READER_CLASS = self._readers[1]
+        index = self._read_options["target_index"]
+        self._target_stat = _file_stat(self.target_path)
+        self._target_ids = ids
+
+        # An index is only used for the same target file, unchanged, encoded
+        # with the same classes
+        source = [os.path.abspath(self.target_path)] + list(self._target_stat) + [self._classes.digest()]
+        if index is not None:
+            self._target_ids = None
+            if os.path.exists(os.path.join(index, "table.json")):
+                table = TargetTable.open(index)
+                if table.source == source:
+                    self._target_lookup = table
+                    return
+
+        targets = _open_reader(TARGET_READER_CLASS, self.target_path, self._classes,
+                self._read_options["cache"], ids=None if index is not None else ids).get_data()
+        if index is not None:
+            if not isinstance(targets, TargetTable):
+                targets = TargetTable.from_dict(targets)
+            targets.source = source
+            targets.save(index)
+            targets = TargetTable.open(index)
+        self._target_lookup = targets
+
+    def _read_files(self, fpaths, report=None):
+        """
+        Read the given data files and merge their observations, recording
+        the time taken and problems found in report (if given, otherwise in a
+        report of just these files that is finished once they are read).
+
+        Each tar or zip archive (or member path of an archive already read) is
+        read in a single pass after the data files, in this process and
+        without the ParseCache.
+        """
+        finish = report is None
+        if finish:
+            report = LoadReport()
+            report.files_total = len(fpaths)
+
+        archives = {}
+        files = []
+        for fpath in fpaths:
+            if is_archive(fpath):
+                archives[fpath] = None
+            elif fpath in self._members:
+                archive, name = self._members[fpath]
+                members = archives.setdefault(archive, set())
+                if members is not None:
+                    members.add(name)
+            else:
+                files.append(fpath)
+        fpaths = files
 
-        for i, observation in enumerate(sorted(self._data)):
-            for j, regressor in enumerate(sorted(parameters)):
-                obs_val = self._data[observation][regressor]
-                if means[j] == 0.0:
-                    means[j] = obs_val
+        DATA_READER_CLASS = self._readers[0]
+        processes = self._read_options["processes"]
+        chunksize = self._read_options["chunksize"]
+        cache = self._read_options["cache"]
+        concurrency = self._read_options["concurrency"]
 
-                last_mean = means[j]
-                last_variance = variances[j]
+        copies = {}
+        if self._read_options.get("dedup"):
+            started = report.start()
+            fpaths, copies = self._find_duplicates(fpaths, report)
+            report.stop("dedup", started)
 
-                means[j] = (last_mean + (obs_val - last_mean)/(i+1))
-                variances[j] = last_variance + (obs_val - last_mean)*(obs_val - means[j])
+        if concurrency:
+            self._merge_observations(self._target_lookup, self._iter_copies(_iter_observations_async(fpaths,
+                    self._classes, DATA_READER_CLASS, cache, concurrency), copies), report)
+        elif processes is None or processes > 1:
+            pool = multiprocessing.Pool(processes, _init_reader_worker,
+                    (self._classes, DATA_READER_CLASS, cache))
+            try:
+                self._merge_observations(self._target_lookup, self._iter_copies(
+                        pool.imap(_read_observation, fpaths, chunksize), copies), report)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self._merge_observations(self._target_lookup, self._iter_copies(
+                    (_read_observation(fpath, self._classes, DATA_READER_CLASS, cache) for fpath in fpaths),
+                    copies), report)
 
-        # NOTE Use sample or population? (n-1 vs n, where n is i+1)
+        for archive, members in archives.items():
+            self._merge_observations(self._target_lookup,
+                    self._read_archive(archive, members, report), report)
+
+        if finish:
+            report.finish()
+
+    def _hash(self, fpath, stat):
+        """Return the content hash of a data file of the given (size, mtime),
+        hashing it again only if it has changed since it was last hashed."""
+        if fpath not in self._hashes or self._hashes[fpath][0] != stat:
+            self._hashes[fpath] = (stat, hash_file(fpath))
+        return self._hashes[fpath][1]
+
+    def _find_duplicates(self, fpaths, report):
+        """
+        Return the data files of fpaths to read, and a dictionary of the
+        (path, stat) of the copies of each (or, under None, of the copies of
+        files already read, as (path, stat, copied path)), recording the group
+        of each file that has copies in report.
+
+        Files are only hashed if their size is that of another file being
+        read, or of a data file already read, and the content hash of each
+        file with copies is kept so that their observations share a row.
+        """
+        store = self._get_store()
+        stats = dict((fpath, _file_stat(fpath)) for fpath in fpaths)
+        sizes = {}
+        for fpath in fpaths:
+            sizes.setdefault(stats[fpath][0], []).append(fpath)
+        read_sizes = {}
+        for fpath, (stat, observation) in self._files.items():
+            if observation is not None and fpath not in stats and fpath not in self._members:
+                read_sizes.setdefault(stat[0], []).append(fpath)
+
+        unique = []
+        copies = {}
+        groups = {}
+        seen = {}
+        for fpath in fpaths:
+            size = stats[fpath][0]
+            if len(sizes[size]) == 1 and size not in read_sizes:
+                unique.append(fpath)
+                continue
+
+            # Hash the files already read of this size the first time it is seen
+            for read in read_sizes.pop(size, []):
+                seen.setdefault(self._hash(read, self._files[read][0]), (read, True))
+
+            key = self._hash(fpath, stats[fpath])
+            if key not in seen:
+                seen[key] = (fpath, False)
+                unique.append(fpath)
+                continue
+
+            first, was_read = seen[key]
+            if was_read:
+                store.set_content_keys({self._files[first][1]: key})
+                copies.setdefault(None, []).append((fpath, stats[fpath], first))
+            else:
+                copies.setdefault(first, []).append((fpath, stats[fpath]))
+            self._file_keys[first] = key
+            self._file_keys[fpath] = key
+            groups.setdefault(first, [first]).append(fpath)
+
+        report.duplicates.extend(groups[first] for first in sorted(groups))
+        return unique, copies
+
+    def _iter_copies(self, observations, copies):
+        """
+        Yield each observation read, followed by an observation of each of
+        its copies (sharing its data) and then an observation of each copy of
+        a file already read, as found by _find_duplicates.
+        """
+        path_id = getattr(self._readers[0], "path_id", lambda fpath: None)
+        for fpath, stat, _id, _data, notes, timing in observations:
+            yield fpath, stat, _id, _data, notes, timing
+            for copy, copy_stat in copies.get(fpath, []):
+                copy_id = path_id(copy)
+                yield copy, copy_stat, copy_id if copy_id is not None else _id, _data, [], (0.0, 0.0)
+
+        store = self._get_store()
+        for copy, copy_stat, first in copies.get(None, []):
+            copy_id = path_id(copy)
+            if copy_id is None:
+                copy_id = store.ids[store.rows([self._files[first][1]])[0]]
+            # The data of the copy is that of the row of its content hash
+            yield copy, copy_stat, copy_id, {}, [], (0.0, 0.0)
+
+    def duplicate_groups(self):
+        """
+        Return a list of the groups of loaded data files found to have the
+        same contents (when loading with dedup), as sorted lists of paths.
+        """
+        groups = {}
+        for fpath, (stat, key) in self._hashes.items():
+            if fpath in self._files and fpath in self._file_keys:
+                groups.setdefault(key, []).append(fpath)
+        return sorted(sorted(group) for group in groups.values() if len(group) > 1)
+
+    def _read_archive(self, archive, members, report):
+        """
+        Yield the observations of the members of an archive (or only those
+        named in members), recording the members of an archive read in full.
+        """
+        if members is None:
+            # The archive was counted as a single file
+            report.files_total -= 1
+            self._archives[archive] = (_file_stat(archive), [])
+
+        for observation in _iter_archive_observations(archive, members, self._classes,
+                self._readers[0]):
+            fpath = observation[0]
+            if members is None:
+                report.files_total += 1
+                self._archives[archive][1].append(fpath)
+            self._members[fpath] = (archive, fpath[len(archive) + 1:])
+            yield observation
+
+    def _merge_observations(self, targets, observations, report):
+        """
+        Add each read (path, stat, id, data, diagnostics, timing) observation
+        with a known target to the _data and _target structures, counting the
+        class of each target, and record the time taken to read and merge it
+        and any problems noted by its reader or the merge in report.
+        """
+        diagnostics = report.diagnostics
+        for fpath, stat, _id, _data, notes, timing in observations:
+            report.add_file(fpath, stat[0], timing[0], timing[1])
+            started = report.start()
+
+            for note in notes:
+                diagnostics.note(*note)
+            if _id in self._targets:
+                diagnostics.note("duplicate_observation", _id, fpath)
+
+            if _id in targets:
+                observation = os.path.basename(fpath)
+                if observation in self._sources:
+                    # The observation read before is replaced, and uncounted
+                    self._classes.count(self._classes.decode(self._targets[_id]), -1)
+                self._sources[observation] = fpath
+                self._targets[_id] = targets[_id]
+                self._data[observation] = _data
+                self._files[fpath] = (stat, observation)
+                if fpath in self._file_keys:
+                    self._data_keys[observation] = self._file_keys[fpath]
+
+                self._classes.count(self._classes.decode(targets[_id]))
+            else:
+                self._files[fpath] = (stat, None)
+                diagnostics.note("missing_target", _id, fpath)
+
+            report.stop("merge", started)
+
+    def _remove_observations(self, observations):
+        """Remove observations (and their targets, if no other observation
+        shares their id) from the loaded data, uncounting their classes."""
+        store = self._get_store()
+        observations = [o for o in observations if o in store]
+        if not observations:
+            return
+
+        for code in store.targets[store.rows(observations)].tolist():
+            self._classes.count(self._classes.decode(code), -1)
+        store.remove(observations)
+        for observation in observations:
+            self._sources.pop(observation, None)
+
+        for _id in list(self._targets):
+            if not store.has_id(_id):
+                del self._targets[_id]
+
+    def _update_targets(self):
+        """
+        Update the target of each loaded observation after the targets have
+        been read again, removing observations that no longer have a target.
+        """
+        store = self._get_store()
+        lost = set()
+        rows = []
+        codes = []
+        for row, observation in enumerate(store.observations):
+            _id = store.ids[row]
+            if _id not in self._target_lookup:
+                lost.add(observation)
+                continue
+
+            code = self._target_lookup[_id]
+            if code != store.targets[row]:
+                self._classes.count(self._classes.decode(store.targets[row]), -1)
+                self._classes.count(self._classes.decode(code))
+                rows.append(row)
+                codes.append(code)
+                self._targets[_id] = code
+        store.set_targets(rows, codes)
+
+        for fpath in self._files:
+            if self._files[fpath][1] in lost:
+                self._files[fpath] = (self._files[fpath][0], None)
+        self._remove_observations(list(lost))
+
+    def _get_store(self):
+        """
+        Move any observations waiting in _data in to the columnar _store and
+        return the store.
+        """
+        if self._data:
+            #FUTURE Currently using handling for file names being used as keys
+            ids = dict((observation, observation.split(".")[0]) for observation in self._data)
+            targets = dict((observation, self._targets[ids[observation]]) for observation in self._data)
+            self._store.add(self._data, ids, targets, self._data_keys)
+            self._data = {}
+            self._data_keys = {}
+        return self._store
+
+    def _test_variance(self, diagnostics=None):
+        """Test the variance of each parameter over all observations to ensure it
+        is non-zero, otherwise note a nil_variance problem to diagnostics (a
+        Diagnostics of its own, summarised on return, if not given)."""
+        store = self._get_store()
+        if len(store) == 0:
+            return
+        parameters = store.parameters
+        summarise = diagnostics is None
+        if diagnostics is None:
+            diagnostics = Diagnostics()
+
+        # Statistics are kept up to date by the store as observations are
+        # added and removed, ignoring missing values
+        # NOTE Use sample or population? (n-1 vs n)
         #      Although technically moot as we only care about 0 and the
         #      absolute difference would be relatively trivial for larger n
+        means = store.stats.mean
+        variances = store.stats.variance
 
-        #FUTURE Store means and variances
-        variances /= i+1
         variance_magnitudes = np.zeros(len(parameters))
         for i, variance in enumerate(variances):
-            if variance == 0.0:
-                print("[WARN] %s parameter has NIL variance (with mean %.2f)"
-                        % (parameters[i], means[i]))
-                print("       Was it read correctly? Perhaps consider removing it from your data.")
+            if not variance > 0.0:
+                diagnostics.note("nil_variance", parameters[i], means[i])
                 continue
             variance_magnitudes[i] = int(math.log10(variance))
 
         min_varmag = np.min(variance_magnitudes)
         max_varmag = np.max(variance_magnitudes)
         if max_varmag - min_varmag >= 2:
-            print ("\n[WARN] Magnitude of variance ranges from %d to %d (difference tolerance is ±1)."
-                    % (min_varmag, max_varmag))
-            print("       Consider normalising or removing some parameters from your data.")
-
-            print("[    ] #\tName%s-10   -5    0    5    10" % (" " * 39))
-            print("[    ]  \t    %s  ^    ^    ^    ^    ^" % (" " * 39))
+            diagnostics.note("variance_range", min_varmag, max_varmag)
 
+            table = ["#\tName%s-10   -5    0    5    10" % (" " * 39),
+                    " \t    %s  ^    ^    ^    ^    ^" % (" " * 39)]
             for i in variance_magnitudes.argsort():
-                if variances[i] == 0.0:
+                if not variances[i] > 0.0:
                     continue
 
                 offset = 15
@@ -160,122 +973,245 @@ class Statplexer(object):
                     offset += 11
                 else:
                     offchar = '*'
-                    offset += variance_magnitudes[i]
+                    offset += int(variance_magnitudes[i])
+
+                table.append("%d\t%40s%s%c" % (i, parameters[i][:40], " " * offset, offchar))
+            logger.info("Magnitude of variance of each parameter:\n%s", "\n".join(table))
+
+        if summarise:
+            diagnostics.summarise()
+
+    def parameter_stats(self, names=None):
+        """
+        Return a dictionary of the mean, (population) variance, minimum,
+        maximum, count of present values and count of missing values of each
+        of the given parameters, or all parameters.
+        """
+        store = self._get_store()
+        if names is None:
+            names = store.parameters
+        stats = store.stats
+        variances = stats.variance
 
-                print("[    ] %d\t%40s%s%c" % (i, parameters[i][:40], " " * offset, offchar))
+        parameter_stats = {}
+        for name, j in zip(names, store.columns(names)):
+            parameter_stats[name] = {
+                "mean": float(stats.mean[j]) if stats.count[j] else float("nan"),
+                "variance": float(variances[j]),
+                "min": float(stats.min[j]),
+                "max": float(stats.max[j]),
+                "count": int(stats.count[j]),
+                "missing": int(stats.missing[j]),
+            }
+        return parameter_stats
 
     def __len__(self):
-        """Return the number of observations stored in _data."""
-        return len(self._data)
+        """Return the number of observations stored."""
+        return len(self._get_store())
 
     def list_parameters(self):
         """Return an ordered list of all parameters."""
-        #FUTURE Need better method of getting all parameters than
-        #       breaking out of counting the first observation...
-        parameters = []
-        for observation in sorted(self._data):
-            for r in self._data[observation]:
-                if r not in parameters:
-                    parameters.append(r)
-            break
-        return sorted(parameters)
-
-    def find_parameters(self, queries):
+        return list(self._get_store().catalogue.parameters)
+
+    def count_parameters(self):
+        """Return the number of observations with a value for each parameter."""
+        return dict(self._get_store().catalogue.counts)
+
+    def find_parameters(self, queries, regex=False, ignore_case=False):
         """Given a list of input strings, return a list of parameters which
-        contain any of those strings as a substring."""
-        parameters = []
-        for observation in sorted(self._data):
-            for r in self._data[observation]:
-                for query in queries:
-                    if query in r:
-                        if r not in parameters:
-                            parameters.append(r)
-                            continue
-            break
-        return sorted(parameters)
+        contain any of those strings as a substring (or match any of them as
+        a regular expression, if regex is set)."""
+        return self._get_store().catalogue.find(queries, ignore_case=ignore_case, regex=regex)
 
     def exclude_parameters(self, queries, exact=False):
         """
         Given a list of input strings, return a list of parameters which do not
         contain any of the input strings as a substring, or if needed, an exact match.
         """
-        parameters = self.list_parameters()
-        to_remove = []
-        for query in queries:
-            for i, r in enumerate(parameters):
-                if exact:
-                    if query.lower() == r.lower():
-                        to_remove.append(r)
-                else:
-                    if query.lower() in r.lower():
-                        to_remove.append(r)
-
-        to_remove = set(to_remove)
-        for key in to_remove:
-            parameters.remove(key)
-        return sorted(parameters)
+        return self._get_store().catalogue.exclude(queries, exact=exact)
 
     def get_data_by_parameters(self, names):
         """
         Return data for each observation, but only include columns
         for each parameter in the given list.
         """
-        np_array = np.empty([len(self),len(names)])
-        for i, observation in enumerate(sorted(self._data)):
-            observation_n = np.zeros(len(names))
-            for j, regressor in enumerate(names):
-                observation_n[j] = self._data[observation][regressor]
-            np_array[i] = observation_n
-        return np_array
+        store = self._get_store()
+        return store.take(columns=store.columns(names))
 
     def get_data_by_target(self, names, targets):
         """
         Return data for each observation that have been classified in one of the
         targets specified and additionally only return columns for the
         parameters in the given list.
+
+        targets may be a list of codes or a single code, all observations
+        are returned if it is None or empty. The rows of each set of targets
+        are kept until the stored observations next change.
         """
-        total = 0
-        for _id in self._targets:
-            target = self._targets[_id]
-            if targets:
-                if target in targets:
-                    total += 1
-            else:
-                total += 1
-
-        data_np_array = np.empty([total,len(names)])
-        targ_np_array = np.empty([total])
-
-        counter = 0
-        levels = []
-        for observation in sorted(self._data):
-            _id = observation.split(".")[0]
-            target = self._targets[_id]
-            if targets:
-                if target not in targets:
-                    continue
+        store = self._get_store()
+        columns = store.columns(names)
 
-            observation_n = np.zeros(len(names))
-            for j, regressor in enumerate(names):
-                observation_n[j] = self._data[observation][regressor]
-            data_np_array[counter] = observation_n
-            targ_np_array[counter] = self._targets[_id]
-            if self._targets[_id] not in levels:
-                levels.append(self._targets[_id])
-            counter += 1
+        rows = store.target_rows(targets)
+        target_codes = store.targets[rows]
+        levels = np.unique(target_codes).tolist()
+        return store.take(rows, columns), store.target_values(target_codes), levels
 
-        return data_np_array, targ_np_array, sorted(levels)
+    def iter_data_by_parameters(self, names, chunk_rows=4096):
+        """
+        Yield the data of get_data_by_parameters as (data, targets, ids) for
+        chunks of at most chunk_rows observations, in the same (stable) order.
+        Only a chunk is held in memory at a time, for a Statplexer opened from
+        a snapshot the data is read from disk as each chunk is taken.
+        """
+        return self._iter_chunks(names, None, chunk_rows)
+
+    def iter_data_by_target(self, names, targets, chunk_rows=4096):
+        """
+        Yield the data and targets of get_data_by_target as (data, targets,
+        ids) for chunks of at most chunk_rows observations, in the same order.
+        """
+        return self._iter_chunks(names, targets, chunk_rows)
+
+    def _iter_chunks(self, names, targets, chunk_rows):
+        """Yield (data, targets, ids) for chunks of the rows of the given
+        targets (or all rows) and the columns of the named parameters."""
+        store = self._get_store()
+        columns = store.columns(names)
+        rows = store.target_rows(targets) if targets is not None else None
+        for chunk, data in store.iter_take(rows, columns, chunk_rows):
+            yield data, store.target_values(store.targets[chunk]), [store.ids[row] for row in chunk]
+
+    def iter_batches(self, names, batch_size, targets=None, seed=0, epochs=1,
+            stratify=False, balance=False, drop_last=False, prefetch=0):
+        """
+        Yield shuffled mini-batches of (data, targets, ids) of batch_size
+        observations of the given targets (or all observations, if None) and
+        the named parameters, for each of epochs passes over the observations
+        (or forever, if epochs is None).
+
+        Observations are shuffled each epoch by a RandomState seeded with
+        seed, so the same seed always gives the same batches. If stratify is
+        set, each batch holds every class in about the same proportion as
+        the observations, if balance is set the observations of each smaller
+        class are drawn again at random until every class is the size of the
+        largest (see sampling.shuffled_rows). Only the row indexes of each
+        epoch are shuffled, each batch is then taken from the store.
+
+        If drop_last is set, the last batch of an epoch is dropped if it has
+        fewer than batch_size observations. If prefetch is given, up to that
+        many batches are taken ahead by a background thread.
+        """
+        if batch_size < 1:
+            raise Exception("batch_size must be at least 1")
+
+        store = self._get_store()
+        columns = store.columns(names)
+        rows = store.target_rows(targets)
+        codes = store.targets[rows]
+        rng = np.random.RandomState(seed)
+
+        def batches():
+            epoch = 0
+            while epochs is None or epoch < epochs:
+                order = rows[sampling.shuffled_rows(codes, rng, stratify, balance)]
+                for start in range(0, len(order), batch_size):
+                    batch = order[start:start + batch_size]
+                    if drop_last and len(batch) < batch_size:
+                        break
+                    yield (store.take(batch, columns), store.target_values(store.targets[batch]),
+                            [store.ids[row] for row in batch])
+                epoch += 1
+
+        if prefetch:
+            return sampling.prefetch(batches(), prefetch)
+        return batches()
+
+    def make_folds(self, k=5, targets=None, repeats=1, seed=0, name="folds"):
+        """
+        Make repeats sets of stratified k-fold splits of the observations of
+        the given targets (or all observations, if None), each fold holding
+        every class in about the same proportion as the observations, and
+        keep them as name (see get_splits). The same seed always gives the
+        same splits of the same observations.
+        """
+        store = self._get_store()
+        rows = store.target_rows(targets)
+        splits = Splits.kfold(rows, store.targets[rows], k=k, repeats=repeats, seed=seed,
+                fingerprint=store.row_fingerprint)
+        splits.options["targets"] = self._split_targets(targets)
+        self._splits[name] = splits
+        return splits
+
+    def make_holdouts(self, test_size=0.25, repeats=10, targets=None, seed=0, name="holdout"):
+        """
+        Make repeats stratified holdout splits of the observations of the
+        given targets (or all observations, if None), each testing test_size
+        of every class, and keep them as name (see get_splits).
+        """
+        store = self._get_store()
+        rows = store.target_rows(targets)
+        splits = Splits.holdout(rows, store.targets[rows], test_size=test_size,
+                repeats=repeats, seed=seed, fingerprint=store.row_fingerprint)
+        splits.options["targets"] = self._split_targets(targets)
+        self._splits[name] = splits
+        return splits
+
+    def _split_targets(self, targets):
+        """Return the targets of a split as a sorted list (or None)."""
+        if targets is None:
+            return None
+        return sorted(set(np.atleast_1d(targets).tolist()))
+
+    def list_splits(self):
+        """Return the names of the kept splits."""
+        return sorted(self._splits)
+
+    def get_splits(self, name):
+        """
+        Return the Splits kept as name, raising a KeyError if there are none.
+        The indexes of the splits are in to the rows of get_data_by_target
+        for the targets that were split, so the Splits may be passed as the
+        cv of a search over that data. Splits made before the stored
+        observations (or their targets) changed raise an Exception.
+        """
+        splits = self._splits[name]
+        if splits.fingerprint != self._get_store().row_fingerprint:
+            raise Exception("Splits %s were made before the observations changed" % name)
+        return splits
+
+    def iter_split_data(self, name, names):
+        """
+        Yield (train_data, train_targets, test_data, test_targets) of each of
+        the splits kept as name, for the columns of the named parameters. The
+        rows of each split are taken from the store as it is yielded.
+        """
+        splits = self.get_splits(name)
+        store = self._get_store()
+        columns = store.columns(names)
+        for index in range(0, len(splits)):
+            train, test = splits.store_rows(index)
+            yield (store.take(train, columns), store.target_values(store.targets[train]),
+                    store.take(test, columns), store.target_values(store.targets[test]))
 
     def get_targets(self):
         """
         Return all targets, sorted by id.
         """
-        np_array = np.empty([len(self)])
-        for i, observation in enumerate(sorted(self._data)):
-            #FUTURE Currently using handling for file names being used as keys
-            _id = observation.split(".")[0]
-            np_array[i] = self._targets[_id]
-        return np_array
+        store = self._get_store()
+        return store.target_values(store.targets)
+
+    @property
+    def dtypes(self):
+        """The DtypePolicy of the stored data and targets."""
+        return self._store.dtypes
+
+    def set_dtypes(self, dtypes):
+        """
+        Store the data and targets as the dtypes of a DtypePolicy from now
+        on, converting those already stored (and logging any parameter that
+        must be kept as float64).
+        """
+        self._get_store().set_dtypes(dtypes)
 
     def count_targets_by_class(self, targets=None):
         """
@@ -287,15 +1223,49 @@ class Statplexer(object):
             counts[class_label] = 0
 
         if targets is None:
-            targets = self._targets.values()
+            targets = list(self._targets.values())
 
-        for target in targets:
-            class_label = decode_class(self._classes, target)
-            counts[class_label] += 1
+        codes, code_counts = np.unique(np.asarray(targets), return_counts=True)
+        for code, count in zip(codes.tolist(), code_counts.tolist()):
+            counts[self._classes.decode(code)] += count
         return counts
 
-    def write_log(self, log_filename, pdf_filename, data_set, param_set, parameters, used_targets, scores, folds, importance):
-        """Write results to a log file."""
+    def fingerprint(self):
+        """
+        Return a hash of the loaded data (the observations, their ids, target
+        codes and parameter values) for keying the results of experiments on
+        it in a ResultsCache.
+        """
+        return self._get_store().data_fingerprint()
+
+    def cached_result(self, cache, parameters, used_targets, folds):
+        """
+        Return the Result cached for an experiment on the loaded data with the
+        given parameters, targets (codes, or the targets of the observations
+        used) and folds, or None if it has not been run.
+        """
+        return cache.get(self.fingerprint(), parameters, used_targets, folds)
+
+    def write_log(self, log_filename, pdf_filename, data_set, param_set, parameters, used_targets, scores, folds, importance,
+            cache=None, timings=None):
+        """
+        Write results to a log file.
+
+        If a ResultsCache is given the scores, importance and timings are also
+        stored in it, or if scores is None they are read from the result
+        cached for the experiment (raising a KeyError if there is none).
+        """
+        if cache is not None:
+            fingerprint = self.fingerprint()
+            if scores is None:
+                result = cache.get(fingerprint, parameters, used_targets, folds)
+                if result is None:
+                    raise KeyError("No cached result for %s" % param_set)
+                scores = result.scores
+                importance = result.importance
+            else:
+                cache.put(fingerprint, parameters, used_targets, folds, scores=scores,
+                        importance=importance, timings=timings, param_set=param_set)
 
         def write(message):
             sys.stdout.write(message)
@@ -306,6 +1276,8 @@ class Statplexer(object):
         write("********\n")
         write("Data Dir\t%s\n" % self.data_dir)
         write("AQC File\t%s\n" % self.target_path)
+        if cache is not None:
+            write("Data Hash\t%s\n" % fingerprint)
         write("\n")
         write("Class Def\t" + "\t".join([cl for cl in sorted(self._classes)]) + "\n")
         write("Class Read\t" + "\t".join([str(v["_count"]) for k,v in sorted(self._classes.items())]) + "\n")
@@ -0,0 +1,228 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import heapq
+import logging
+import time
+
+# Phases of a load, in the order they are run
+PHASES = ["walk", "targets", "dedup", "parse", "merge", "variance"]
+
+# Kinds of problem noted by a load and the message logged for each, formatted
+# with the arguments the problem was noted with
+DIAGNOSTICS = {
+    "missing_target": "Observation %s of %s has no target",
+    "duplicate_observation": "Duplicate observation %s found in %s",
+    "duplicate_key": "Duplicate key for %s found in %s",
+    "non_numeric": "Non-numeric value of %s (%r) found in %s",
+    "nil_variance": "Parameter %s has NIL variance (with mean %.2f), was it read correctly? Perhaps consider removing it from your data",
+    "variance_range": "Magnitude of variance ranges from %d to %d (difference tolerance is ±1), consider normalising or removing some parameters from your data",
+}
+
+class Diagnostics(object):
+    """
+    Counts of each kind of problem (see DIAGNOSTICS) noted while loading data
+    and samples of the first few of each, kept as formatted messages.
+
+    Each of the first log_limit problems of a kind is logged to logger at
+    level, after which the kind is only counted (and logged once in total by
+    summarise), so a load that notes a problem for every file writes a
+    bounded number of messages.
+    """
+
+    def __init__(self, logger=None, level=logging.WARNING, log_limit=10, samples=10):
+        self.logger = logger or logging.getLogger("frontier")
+        self.level = level
+        self.log_limit = log_limit
+        self.n_samples = samples
+        self.counts = {}
+        self.samples = {}
+
+    def note(self, kind, *args):
+        """Count a problem of a kind, given the arguments of its message."""
+        count = self.counts.get(kind, 0) + 1
+        self.counts[kind] = count
+
+        if count <= self.n_samples:
+            self.samples.setdefault(kind, []).append(DIAGNOSTICS[kind] % args)
+        if count <= self.log_limit:
+            self.logger.log(self.level, DIAGNOSTICS[kind], *args)
+            if count == self.log_limit:
+                self.logger.log(self.level, "Not logging further %s problems until the load has finished", kind)
+
+    def summarise(self):
+        """Log the total count of each kind of problem noted more than
+        log_limit times."""
+        for kind in sorted(self.counts):
+            if self.counts[kind] > self.log_limit:
+                self.logger.log(self.level, "%d %s problems were found in total", self.counts[kind], kind)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def to_dict(self):
+        """Return the counts and samples of each kind of problem."""
+        return dict((kind, {"count": count, "samples": list(self.samples.get(kind, []))})
+                for kind, count in self.counts.items())
+
+class LoadReport(object):
+    """
+    Timings and throughput of a load, returned by Statplexer.load_data.
+
+    The wall and CPU time of each phase are kept in phases. Data files are
+    parsed and merged as they are read, so the parse phase is the sum of the
+    time taken to read each file (by the worker processes, for a parallel
+    load) and the merge phase is the time spent merging them in to the loaded
+    data. The slowest files read are kept as (seconds, path, bytes) tuples
+    and problems found by the load are counted by diagnostics. If duplicate
+    data files were looked for, the dedup phase is the time taken to find
+    them and each group of files found with the same contents is kept in
+    duplicates (as a list of paths, the file that was read first).
+    """
+
+    def __init__(self, slowest=10, progress=None, diagnostics=None):
+        """
+        Initialise an empty report, keeping the given number of slowest
+        files and calling progress (if given) with the report after each
+        data file has been read. Problems are noted in diagnostics, if given,
+        or a new Diagnostics.
+        """
+        self.phases = dict((phase, {"wall": 0.0, "cpu": 0.0}) for phase in PHASES)
+        self.files_total = 0
+        self.files_read = 0
+        self.bytes_read = 0
+        self.duplicates = []
+        self.n_slowest = slowest
+        self.progress = progress
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+
+        self._slowest = []
+        self._started = time.time()
+        self.finished = None
+
+    def start(self):
+        """Return the current (wall, cpu) time, to be passed to stop."""
+        return time.time(), time.process_time()
+
+    def stop(self, phase, started):
+        """Add the time since started (as returned by start) to a phase."""
+        wall, cpu = self.start()
+        self.add(phase, wall - started[0], cpu - started[1])
+
+    def add(self, phase, wall, cpu):
+        """Add the given wall and CPU time to a phase."""
+        self.phases[phase]["wall"] += wall
+        self.phases[phase]["cpu"] += cpu
+
+    def add_file(self, fpath, size, wall, cpu):
+        """Record the reading of a data file of size bytes, and report progress."""
+        self.add("parse", wall, cpu)
+        self.files_read += 1
+        self.bytes_read += size
+
+        if self.n_slowest:
+            if len(self._slowest) < self.n_slowest:
+                heapq.heappush(self._slowest, (wall, fpath, size))
+            elif wall > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (wall, fpath, size))
+
+        if self.progress is not None:
+            self.progress(self)
+
+    def finish(self):
+        """Mark the load as finished, logging the totals of its diagnostics."""
+        self.finished = time.time()
+        self.diagnostics.summarise()
+
+    @property
+    def elapsed(self):
+        """Wall time since the load started (until it finished)."""
+        return (self.finished or time.time()) - self._started
+
+    @property
+    def slowest(self):
+        """The slowest files read, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    @property
+    def files_per_second(self):
+        """Data files read per second of elapsed time."""
+        if not self.elapsed:
+            return 0.0
+        return self.files_read / self.elapsed
+
+    @property
+    def bytes_per_second(self):
+        """Bytes of data files read per second of elapsed time."""
+        if not self.elapsed:
+            return 0.0
+        return self.bytes_read / self.elapsed
+
+    def eta(self):
+        """
+        Return the estimated seconds until all data files have been read, at
+        the rate they have been read so far (or None before the first file).
+        """
+        if not self.files_read:
+            return None
+        rate = self.files_read / (time.time() - self._started)
+        return (self.files_total - self.files_read) / rate
+
+    def to_dict(self):
+        """Return the report as a dictionary, suitable for serialising as JSON."""
+        return {
+            "phases": dict((phase, dict(times)) for phase, times in self.phases.items()),
+            "elapsed": self.elapsed,
+            "files_total": self.files_total,
+            "files_read": self.files_read,
+            "bytes_read": self.bytes_read,
+            "files_per_second": self.files_per_second,
+            "bytes_per_second": self.bytes_per_second,
+            "slowest": [{"path": fpath, "seconds": wall, "bytes": size}
+                    for wall, fpath, size in self.slowest],
+            "diagnostics": self.diagnostics.to_dict(),
+            "duplicates": [list(group) for group in self.duplicates],
+        }
+
+    def __str__(self):
+        lines = ["Read %d of %d files (%.2f MB) in %.2fs, %.1f files/s, %.2f MB/s" % (
+                self.files_read, self.files_total, self.bytes_read / 1e6, self.elapsed,
+                self.files_per_second, self.bytes_per_second / 1e6)]
+        for phase in PHASES:
+            lines.append("%-10s %10.3fs wall %10.3fs cpu" % (phase,
+                    self.phases[phase]["wall"], self.phases[phase]["cpu"]))
+        for wall, fpath, size in self.slowest:
+            lines.append("%10.3fs %s (%d bytes)" % (wall, fpath, size))
+        if self.duplicates:
+            lines.append("%d duplicate files in %d groups" % (
+                    sum(len(group) - 1 for group in self.duplicates), len(self.duplicates)))
+        for kind in sorted(self.diagnostics.counts):
+            lines.append("%-22s %d" % (kind, self.diagnostics.counts[kind]))
+        return "\n".join(lines)
+
+class ProgressLogger(object):
+    """
+    A progress callback for LoadReport that logs the number of files read,
+    throughput and ETA to a logger at most once every interval seconds (and
+    once all files have been read).
+    """
+
+    def __init__(self, logger=None, interval=5.0, level=logging.INFO):
+        self.logger = logger or logging.getLogger("frontier")
+        self.interval = interval
+        self.level = level
+        self._last = None
+
+    def __call__(self, report):
+        now = time.time()
+        done = report.files_read == report.files_total
+        if not done and self._last is not None and now - self._last < self.interval:
+            return
+        self._last = now
+
+        eta = report.eta()
+        self.logger.log(self.level, "Read %d of %d files (%.1f files/s, %.2f MB/s), ETA %s",
+                report.files_read, report.files_total, report.files_per_second,
+                report.bytes_per_second / 1e6, "%.0fs" % eta if eta is not None else "unknown")
@@ -0,0 +1,168 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# Increment to ignore all existing results if the key or result layout changes
+RESULTS_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    param_set TEXT,
+    parameters TEXT NOT NULL,
+    targets TEXT NOT NULL,
+    folds TEXT NOT NULL,
+    scores TEXT,
+    importance TEXT,
+    timings TEXT,
+    created REAL NOT NULL
+)
+"""
+
+def _to_list(values):
+    """Return an array (or any other sequence) of numbers as a list."""
+    return np.asarray(values).tolist() if values is not None else None
+
+def _target_codes(targets):
+    """
+    Return the sorted distinct codes of a list (or array) of target codes, as
+    ints where they are whole, so that the float targets returned with data
+    give the same key as the codes that selected them.
+    """
+    if targets is None:
+        return None
+    codes = np.unique(np.asarray(targets)).tolist()
+    return [int(code) if isinstance(code, float) and code.is_integer() else code for code in codes]
+
+def result_key(fingerprint, parameters, targets, folds):
+    """
+    Return the key of the result of an experiment on the data of the given
+    fingerprint, with the given parameters, target codes and folds. The order
+    of the parameters matters (as it is the order of the columns of the data),
+    the order of the targets does not.
+    """
+    key = json.dumps([RESULTS_VERSION, fingerprint, list(parameters), _target_codes(targets), folds])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+class Result(object):
+    """A result read from a ResultsCache."""
+
+    def __init__(self, row):
+        self.key = row["key"]
+        self.fingerprint = row["fingerprint"]
+        self.param_set = row["param_set"]
+        self.parameters = json.loads(row["parameters"])
+        self.targets = json.loads(row["targets"])
+        self.folds = json.loads(row["folds"])
+        self.scores = np.array(json.loads(row["scores"]) or [])
+        self.importance = json.loads(row["importance"]) or {}
+        self.timings = json.loads(row["timings"]) or {}
+        self.created = row["created"]
+
+class ResultsCache(object):
+    """
+    A store of the results (scores, feature importances and timings) of
+    experiments, held in an SQLite database at path and keyed on a
+    fingerprint of the data they were run on (see Statplexer.fingerprint),
+    their parameters, the target codes used and their folds. A result is
+    only returned for the same data, so a sweep can skip the experiments
+    that have already been done, in this session or an earlier one.
+    """
+
+    def __init__(self, path):
+        """Open the cache at path, creating it if required."""
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute(SCHEMA)
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM results WHERE version = ?",
+                (RESULTS_VERSION,)).fetchone()[0]
+
+    def get(self, fingerprint, parameters, targets, folds):
+        """Return the Result of an experiment, or None if it is not cached."""
+        row = self._db.execute("SELECT * FROM results WHERE key = ?",
+                (result_key(fingerprint, parameters, targets, folds),)).fetchone()
+        if row is None:
+            return None
+        return Result(row)
+
+    def contains(self, fingerprint, parameters, targets, folds):
+        """Return whether the result of an experiment is cached."""
+        return self.get(fingerprint, parameters, targets, folds) is not None
+
+    def put(self, fingerprint, parameters, targets, folds, scores=None, importance=None,
+            timings=None, param_set=None):
+        """
+        Store the scores (an array), importance (a dictionary of parameter
+        to importance) and timings (a dictionary of phase to seconds) of an
+        experiment, replacing any result already stored for it. Return the
+        key of the result.
+        """
+        key = result_key(fingerprint, parameters, targets, folds)
+        if importance is not None:
+            importance = dict((name, float(value)) for name, value in importance.items())
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                key,
+                RESULTS_VERSION,
+                fingerprint,
+                param_set,
+                json.dumps(list(parameters)),
+                json.dumps(_target_codes(targets)),
+                json.dumps(folds),
+                json.dumps(_to_list(scores)),
+                json.dumps(importance),
+                json.dumps(timings),
+                time.time(),
+            ))
+        return key
+
+    def find(self, fingerprint=None, param_set=None):
+        """
+        Return a list of the cached Results, oldest first, optionally only
+        those of the data of a fingerprint or of a named set of parameters.
+        """
+        query = "SELECT * FROM results WHERE version = ?"
+        args = [RESULTS_VERSION]
+        if fingerprint is not None:
+            query += " AND fingerprint = ?"
+            args.append(fingerprint)
+        if param_set is not None:
+            query += " AND param_set = ?"
+            args.append(param_set)
+        return [Result(row) for row in self._db.execute(query + " ORDER BY created", args)]
+
+    def remove(self, fingerprint=None):
+        """Remove all results, or only those of the data of a fingerprint."""
+        with self._db:
+            if fingerprint is None:
+                self._db.execute("DELETE FROM results")
+            else:
+                self._db.execute("DELETE FROM results WHERE fingerprint = ?", (fingerprint,))
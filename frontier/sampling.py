@@ -0,0 +1,101 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import queue
+import threading
+
+import numpy as np
+
+def class_rows(codes):
+    """Return a dictionary of the row indexes of each distinct code."""
+    codes = np.asarray(codes)
+    levels, inverse = np.unique(codes, return_inverse=True)
+    order = np.argsort(inverse, kind="mergesort")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(levels)))[:-1]
+    return dict(zip(levels.tolist(), np.split(order, bounds)))
+
+def shuffled_rows(codes, rng, stratify=False, balance=False):
+    """
+    Return a shuffled array of row indexes of the given target codes, using
+    the numpy RandomState rng.
+
+    If stratify is set, the rows of each class are spread evenly through the
+    order, so that every run of rows holds each class in (about) the same
+    proportion as the codes. If balance is set, the rows of each smaller
+    class are also drawn again at random (with replacement) until every
+    class has as many rows as the largest, and the order is stratified.
+    """
+    codes = np.asarray(codes)
+    if not balance and not stratify:
+        return rng.permutation(len(codes))
+
+    groups = class_rows(codes)
+    size = max(len(rows) for rows in groups.values()) if groups else 0
+
+    rows = []
+    keys = []
+    for code in sorted(groups):
+        group = rng.permutation(groups[code])
+        if balance and len(group) < size:
+            group = np.concatenate([group, rng.choice(group, size - len(group))])
+        rows.append(group)
+
+        # Place the i'th row of a class at about i/n of the way through
+        keys.append((np.arange(len(group)) + rng.uniform(size=len(group))) / len(group))
+
+    if not rows:
+        return np.zeros(0, dtype=int)
+    rows = np.concatenate(rows)
+    return rows[np.argsort(np.concatenate(keys), kind="mergesort")]
+
+class _Raise(object):
+    """Wraps an exception raised by the producer of a prefetched iterable."""
+    def __init__(self, exception):
+        self.exception = exception
+
+def prefetch(iterable, size):
+    """
+    Yield the items of iterable, produced by a background thread that keeps
+    up to size items ready ahead of the consumer. Exceptions raised by the
+    iterable are raised by this generator, and the thread stops if the
+    generator is closed before the iterable is exhausted.
+    """
+    items = queue.Queue(size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_Raise(e))
+            return
+        put(done)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, _Raise):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,801 @@
+# -*- coding: utf-8 -*-
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+import numpy as np
+
+# Version of the files written by ObservationStore.save
+SNAPSHOT_VERSION = 2
+
+logger = logging.getLogger("frontier")
+
+def to_float(value):
+    """Convert a parameter value to a float, or NaN if it is not numeric."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _write_replacing(path, write):
+    """
+    Call write with a binary file object of a temporary file in the directory
+    of path, then move it over path. An existing file at path (which may be
+    memory mapped by a store opened from it) is replaced, not overwritten.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+    fh = os.fdopen(fd, "wb")
+    try:
+        write(fh)
+    except Exception:
+        fh.close()
+        os.remove(tmp_path)
+        raise
+    fh.close()
+    os.replace(tmp_path, path)
+
+class ParameterStats(object):
+    """
+    The count of present (non-NaN) values, mean, sum of squared deviations
+    from the mean, minimum, maximum and count of missing values of each column
+    of a matrix, as arrays. Statistics of separate sets of rows can be merged
+    (and removed) without visiting the rows again.
+    """
+
+    def __init__(self, n_columns=0):
+        """Initialise the statistics of a matrix with no rows."""
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        self.missing = np.zeros(n_columns, dtype=np.int64)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.empty(n_columns)
+        self.min.fill(np.nan)
+        self.max = np.empty(n_columns)
+        self.max.fill(np.nan)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Compute the statistics of each column of a matrix, ignoring NaN."""
+        stats = cls(matrix.shape[1])
+        present = ~np.isnan(matrix)
+        stats.count = present.sum(axis=0)
+        stats.missing = matrix.shape[0] - stats.count
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats.mean = np.where(present, matrix, 0.0).sum(axis=0) / stats.count
+            stats.m2 = (np.where(present, matrix - stats.mean, 0.0) ** 2).sum(axis=0)
+
+        empty = stats.count == 0
+        stats.mean[empty] = 0.0
+        if matrix.shape[0]:
+            stats.min = np.where(present, matrix, np.inf).min(axis=0)
+            stats.max = np.where(present, matrix, -np.inf).max(axis=0)
+            stats.min[empty] = np.nan
+            stats.max[empty] = np.nan
+        stats._constant()
+        return stats
+
+    def _constant(self):
+        """Set the mean and variance of columns holding a single value
+        exactly, rather than as rounded by the running sums."""
+        constant = self.min == self.max
+        self.mean[constant] = self.min[constant]
+        self.m2[constant] = 0.0
+
+    @property
+    def variance(self):
+        """The population variance of each column (NaN for empty columns)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.m2 / self.count, np.nan)
+
+    def expand(self, columns, n_columns, n_rows):
+        """Move the statistics to the given column indexes of a wider matrix of
+        n_rows rows, with every value of the new columns missing."""
+        stats = ParameterStats(n_columns)
+        stats.missing[:] = n_rows
+        for name in ["count", "missing", "mean", "m2", "min", "max"]:
+            getattr(stats, name)[columns] = getattr(self, name)
+        return stats
+
+    def merge(self, other):
+        """Combine with the statistics of another set of rows of the same columns."""
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            mean = self.mean + delta * other.count / count
+            m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+
+        empty = count == 0
+        mean[empty] = 0.0
+        m2[empty] = 0.0
+        self.count = count
+        self.missing = self.missing + other.missing
+        self.mean = mean
+        self.m2 = m2
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self._constant()
+
+    def remove(self, other, matrix):
+        """
+        Remove the statistics of a subset of rows, given the matrix of the rows
+        that remain to find the new minimum and maximum of affected columns
+        (or a function returning the columns of that matrix selected by a
+        boolean mask).
+        """
+        count = self.count - other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (self.mean * self.count - other.mean * other.count) / count
+            delta = other.mean - mean
+            m2 = self.m2 - other.m2 - delta ** 2 * count * other.count / self.count
+
+        empty = count == 0
+        mean[empty] = 0.0
+        m2[empty] = 0.0
+        self.count = count
+        self.missing = self.missing - other.missing
+        self.mean = mean
+        self.m2 = np.maximum(m2, 0.0)
+
+        # Only columns where a removed value was the minimum or maximum change
+        changed = (other.min == self.min) | (other.max == self.max)
+        if changed.any():
+            if callable(matrix):
+                remaining = ParameterStats.from_matrix(matrix(changed))
+            else:
+                remaining = ParameterStats.from_matrix(matrix[:, changed])
+            self.min[changed] = remaining.min
+            self.max[changed] = remaining.max
+        self._constant()
+
+class ParameterCatalogue(object):
+    """
+    A catalogue of every parameter of a set of observations and the number
+    of observations with a (numeric) value for each, with lowercase names
+    prepared for searching and the results of each search remembered.
+    """
+
+    def __init__(self, parameters, counts):
+        """Catalogue the given sorted parameters and their counts."""
+        self.parameters = list(parameters)
+        self.counts = dict(zip(self.parameters, [int(c) for c in counts]))
+        self._lower = [p.lower() for p in self.parameters]
+        self._results = {}
+
+    def find(self, queries, ignore_case=False, regex=False):
+        """
+        Return the sorted parameters containing any of the queries as a
+        substring, or matching any of them as a regular expression.
+        """
+        key = ("find", tuple(queries), ignore_case, regex)
+        if key not in self._results:
+            names = self._lower if ignore_case else self.parameters
+            if regex:
+                flags = re.IGNORECASE if ignore_case else 0
+                patterns = [re.compile(query, flags) for query in queries]
+                matches = lambda name: any(p.search(name) for p in patterns)
+            else:
+                if ignore_case:
+                    queries = [query.lower() for query in queries]
+                matches = lambda name: any(query in name for query in queries)
+            self._results[key] = [p for p, name in zip(self.parameters, names) if matches(name)]
+        return list(self._results[key])
+
+    def exclude(self, queries, exact=False):
+        """
+        Return the sorted parameters that do not contain any of the queries
+        as a substring (or match any of them exactly), ignoring case.
+        """
+        key = ("exclude", tuple(queries), exact)
+        if key not in self._results:
+            queries = [query.lower() for query in queries]
+            if exact:
+                queries = set(queries)
+                keep = [name not in queries for name in self._lower]
+            else:
+                keep = [not any(query in name for query in queries) for name in self._lower]
+            self._results[key] = [p for p, k in zip(self.parameters, keep) if k]
+        return list(self._results[key])
+
+class DtypePolicy(object):
+    """
+    The dtypes an ObservationStore keeps and returns its values and target
+    codes as.
+
+    Parameter values are stored (and returned) as features, a float dtype,
+    apart from the wide parameters, which are kept as float64. If promote is
+    set, a parameter whose stored range would overflow features, or holds
+    integers too large for features to represent exactly (such as counts
+    beyond 2 ** 24 for float32), is made wide as soon as it is stored,
+    otherwise storing it raises an Exception. Data of a wide parameter is
+    returned as float64.
+
+    Target codes are stored as targets, an integer dtype, and returned as
+    target_values (float64 by default, as they always have been).
+    """
+
+    def __init__(self, features="float64", targets="int64", target_values="float64",
+            wide=(), promote=True):
+        self.features = np.dtype(features)
+        self.targets = np.dtype(targets)
+        self.target_values = np.dtype(target_values)
+        self.wide = sorted(wide)
+        self.promote = promote
+
+        if self.features.kind != "f":
+            raise Exception("Parameters must be stored as a float dtype, not %s" % self.features)
+        if self.targets.kind not in "iu":
+            raise Exception("Target codes must be stored as an integer dtype, not %s" % self.targets)
+
+    @classmethod
+    def compact(cls, wide=(), promote=True):
+        """Return a policy of float32 values and int8 target codes, which
+        are also returned as int8."""
+        return cls("float32", "int8", "int8", wide, promote)
+
+    def check(self, parameters, stats):
+        """
+        Return a dictionary of the reason ("overflow" or "precision") each of
+        the named parameters (of the given ParameterStats) does not fit the
+        features dtype, for those that do not.
+        """
+        if self.features == np.float64:
+            return {}
+        info = np.finfo(self.features)
+        exact = 2.0 ** (info.nmant + 1)
+        with np.errstate(invalid="ignore"):
+            largest = np.fmax(np.abs(stats.min), np.abs(stats.max))
+        reasons = {}
+        for j in np.flatnonzero(np.isfinite(largest) & (largest > exact)).tolist():
+            reasons[parameters[j]] = "overflow" if largest[j] > info.max else "precision"
+        return reasons
+
+    def reject(self, reasons):
+        """Raise an Exception for the first parameter of reasons (as returned
+        by check) that is not wide, unless such parameters are promoted."""
+        reasons = dict((p, reason) for p, reason in reasons.items() if p not in self.wide)
+        if reasons and not self.promote:
+            parameter = min(reasons)
+            raise Exception("Parameter %s does not fit %s (%s)"
+                    % (parameter, self.features, reasons[parameter]))
+
+    def check_targets(self, codes):
+        """Return codes as the targets dtype, raising an Exception for any
+        code it cannot hold."""
+        codes = np.asarray(codes)
+        if len(codes):
+            info = np.iinfo(self.targets)
+            if codes.min() < info.min or codes.max() > info.max:
+                raise Exception("Target codes from %s to %s do not fit %s"
+                        % (codes.min(), codes.max(), self.targets))
+        return codes.astype(self.targets)
+
+    def to_dict(self):
+        """Return the policy as a dictionary, suitable for serialising as JSON."""
+        return {
+            "features": self.features.name,
+            "targets": self.targets.name,
+            "target_values": self.target_values.name,
+            "wide": self.wide,
+            "promote": self.promote,
+        }
+
+    @classmethod
+    def from_dict(cls, policy):
+        """Return the policy of a dictionary written by to_dict."""
+        return cls(**policy)
+
+class ObservationStore(object):
+    """
+    Columnar storage for observations; holding a single matrix of parameter
+    values (one row per distinct set of values, one column per parameter),
+    the index of each observation's row and each parameter's column and a
+    vector of the target code of each observation.
+
+    Observations are kept sorted by name and columns by parameter name.
+    value_rows holds the matrix row of each observation; each observation
+    has a row of its own unless it was added with the content key of another,
+    in which case they share a row. Matrix rows are kept in the order of the
+    first observation of each, so without shared rows value_rows is just the
+    index of each observation. Parameters that were missing from (or not
+    numeric in) an observation are stored as NaN.
+
+    Values and target codes are stored as the dtypes of a DtypePolicy. The
+    values of its wide parameters are kept at float64 in the columns of
+    wide (one for each of wide_parameters, with the rows of the matrix)
+    rather than in the matrix.
+    """
+
+    def __init__(self, dtypes=None):
+        """Initialise an empty store, with the given DtypePolicy (or one of
+        float64 values and int64 target codes)."""
+        self.dtypes = dtypes if dtypes is not None else DtypePolicy()
+        self.observations = []
+        self.ids = []
+        self.parameters = []
+        self.matrix = np.empty([0, 0], dtype=self.dtypes.features)
+        self.value_rows = np.zeros(0, dtype=np.int64)
+        self.wide_parameters = []
+        self.wide = np.empty([0, 0])
+        self.targets = np.zeros(0, dtype=self.dtypes.targets)
+        self.stats = ParameterStats()
+        self._wide_columns = np.zeros(0, dtype=np.int64)
+        self._wide_positions = {}
+
+        # Matrix row of each content key given to add
+        self._content_rows = {}
+
+        self._rows = {}
+        self._columns = {}
+        self._id_rows = {}
+        self._catalogue = None
+
+        # Rows of the observations of each requested set of target codes,
+        # cleared whenever the rows or targets of the store change
+        self._target_rows = {}
+        self._row_fingerprint = None
+        self._data_fingerprint = None
+
+    def save(self, path):
+        """
+        Write the store to the directory at path (creating it if required),
+        as .npy files of the matrix, wide values, value rows and targets, an
+        .npz of the parameter statistics and a JSON table of the observation
+        and parameter names, content keys and DtypePolicy. Each file is
+        replaced rather than overwritten, so a store can be saved over the
+        snapshot it was opened from.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        arrays = [
+            ("matrix.npy", self.matrix),
+            ("wide.npy", self.wide),
+            ("rows.npy", self.value_rows),
+            ("targets.npy", self.targets),
+        ]
+        for fname, array in arrays:
+            _write_replacing(os.path.join(path, fname),
+                    lambda fh: np.save(fh, np.ascontiguousarray(array)))
+
+        stats = self.stats
+        _write_replacing(os.path.join(path, "stats.npz"), lambda fh: np.savez(fh,
+                count=stats.count, missing=stats.missing, mean=stats.mean, m2=stats.m2,
+                min=stats.min, max=stats.max))
+
+        names = json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "observations": self.observations,
+            "ids": self.ids,
+            "parameters": self.parameters,
+            "content_rows": self._content_rows,
+            "dtypes": self.dtypes.to_dict(),
+            "wide_parameters": self.wide_parameters,
+        })
+        _write_replacing(os.path.join(path, "store.json"), lambda fh: fh.write(names.encode("utf-8")))
+
+    @classmethod
+    def open(cls, path, mmap_mode="r"):
+        """
+        Open a store written by save. The matrix is memory mapped (read only,
+        by default) so it is only read as it is used and its pages are shared
+        between processes; it is copied in to memory if the store is changed.
+        """
+        fh = open(os.path.join(path, "store.json"))
+        try:
+            names = json.load(fh)
+        finally:
+            fh.close()
+        if names["version"] != SNAPSHOT_VERSION:
+            raise Exception("Unsupported snapshot version %s in %s (expected %d), the data must be loaded and saved again"
+                    % (names["version"], path, SNAPSHOT_VERSION))
+
+        store = cls(DtypePolicy.from_dict(names["dtypes"]))
+        store.observations = names["observations"]
+        store.ids = names["ids"]
+        store.parameters = names["parameters"]
+        store.matrix = np.load(os.path.join(path, "matrix.npy"), mmap_mode=mmap_mode)
+        store.targets = np.load(os.path.join(path, "targets.npy"))
+        store.value_rows = np.load(os.path.join(path, "rows.npy"))
+        store._content_rows = names["content_rows"]
+        store.wide_parameters = names["wide_parameters"]
+        store.wide = np.load(os.path.join(path, "wide.npy"), mmap_mode=mmap_mode)
+
+        stats = np.load(os.path.join(path, "stats.npz"))
+        for name in ["count", "missing", "mean", "m2", "min", "max"]:
+            setattr(store.stats, name, stats[name])
+        stats.close()
+
+        store._reindex()
+        return store
+
+    def __len__(self):
+        """Return the number of observations in the store."""
+        return len(self.observations)
+
+    def __contains__(self, observation):
+        """Return whether an observation of the given name is in the store."""
+        return observation in self._rows
+
+    def _reindex(self):
+        """Rebuild the observation to row and parameter to column indexes."""
+        self._rows = dict((o, i) for i, o in enumerate(self.observations))
+        self._columns = dict((p, j) for j, p in enumerate(self.parameters))
+        self._id_rows = {}
+        for i, _id in enumerate(self.ids):
+            self._id_rows.setdefault(_id, i)
+        self._index_wide()
+        self._target_rows = {}
+        self._row_fingerprint = None
+        self._data_fingerprint = None
+        self._catalogue = None
+
+    @property
+    def catalogue(self):
+        """The ParameterCatalogue of the store, rebuilt after any change."""
+        if self._catalogue is None:
+            self._catalogue = ParameterCatalogue(self.parameters, self.stats.count)
+        return self._catalogue
+
+    def rows(self, observations):
+        """Return the row indexes of the named observations."""
+        return [self._rows[o] for o in observations]
+
+    def id_rows(self, ids):
+        """Return the row index of the (first) observation of each id."""
+        return [self._id_rows[_id] for _id in ids]
+
+    def has_id(self, _id):
+        """Return whether an observation with the given id is in the store."""
+        return _id in self._id_rows
+
+    def target_rows(self, targets=None):
+        """
+        Return an array of the row indexes of observations whose target code
+        is one of the given codes (or all rows if targets is None or empty).
+        """
+        if targets is None:
+            targets = []
+        targets = np.atleast_1d(targets)
+        key = tuple(sorted(set(targets.tolist())))
+        if key not in self._target_rows:
+            if len(key):
+                self._target_rows[key] = np.flatnonzero(np.isin(self.targets, targets))
+            else:
+                self._target_rows[key] = np.arange(len(self))
+        return self._target_rows[key]
+
+    def set_targets(self, rows, targets):
+        """Set the target codes of the given rows."""
+        self.targets[rows] = self.dtypes.check_targets(targets)
+        self._target_rows = {}
+        self._row_fingerprint = None
+        self._data_fingerprint = None
+
+    @property
+    def row_fingerprint(self):
+        """
+        A hash of the observation and target code of each row, that changes
+        whenever row indexes of the store would pick different observations
+        or targets.
+        """
+        if self._row_fingerprint is None:
+            digest = hashlib.sha1()
+            digest.update("\0".join(self.observations).encode("utf-8"))
+            digest.update(np.ascontiguousarray(self.targets, dtype=np.int64).tobytes())
+            self._row_fingerprint = digest.hexdigest()
+        return self._row_fingerprint
+
+    def data_fingerprint(self, chunk_rows=4096):
+        """
+        Return a hash of the rows, ids, parameters and values of the store,
+        that changes whenever anything read from the store could. The values
+        of each observation are hashed in order, as take returns them as
+        float64, a chunk of rows at a time, so the hash does not depend on how
+        the rows are stored (such as shared by copies, or in wide columns).
+        The hash is kept until the store next changes.
+        """
+        if self._data_fingerprint is None:
+            digest = hashlib.sha1(self.row_fingerprint.encode("utf-8"))
+            digest.update("\0".join(self.ids).encode("utf-8"))
+            digest.update("\0".join(self.parameters).encode("utf-8"))
+            for rows, values in self.iter_take(chunk_rows=chunk_rows, dtype=np.float64):
+                digest.update(np.ascontiguousarray(values).tobytes())
+            self._data_fingerprint = digest.hexdigest()
+        return self._data_fingerprint
+
+    def columns(self, names):
+        """
+        Return the column indexes of the named parameters, raising a KeyError
+        for any parameter that is not in the store.
+        """
+        return [self._columns[name] for name in names]
+
+    def target_values(self, codes):
+        """Return an array of target codes as the target_values dtype."""
+        return np.asarray(codes).astype(self.dtypes.target_values)
+
+    def take(self, rows=None, columns=None, dtype=None):
+        """
+        Return a new matrix of the values at the given row and column indexes,
+        or all rows or columns if either are None, as dtype. By default this
+        is the features dtype of the DtypePolicy, or float64 if any of the
+        columns is of a wide parameter.
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        return self._values(self.value_rows[rows], columns, dtype)
+
+    def _values(self, matrix_rows, columns=None, dtype=None):
+        """Return the values at the given matrix rows and columns (including
+        those of wide parameters) as dtype, see take."""
+        if columns is None:
+            columns = np.arange(len(self.parameters))
+        columns = np.asarray(columns, dtype=np.int64)
+        wide = np.zeros(0, dtype=np.int64)
+        if len(self._wide_columns):
+            wide = np.flatnonzero(np.isin(columns, self._wide_columns))
+        if dtype is None:
+            dtype = np.float64 if len(wide) else self.dtypes.features
+
+        values = np.asarray(self.matrix[np.ix_(matrix_rows, columns)]).astype(dtype, copy=False)
+        if len(wide):
+            positions = [self._wide_positions[column] for column in columns[wide].tolist()]
+            values[:, wide] = self.wide[np.ix_(matrix_rows, positions)]
+        return values
+
+    def iter_take(self, rows=None, columns=None, chunk_rows=4096, dtype=None):
+        """
+        Yield (rows, matrix) for consecutive chunks of at most chunk_rows of
+        the given row indexes (or all rows), where matrix holds the values at
+        those rows and the given columns as take would (as dtype). Only one chunk is
+        copied at a time, so a memory mapped matrix is never read in full.
+        """
+        if chunk_rows < 1:
+            raise Exception("chunk_rows must be at least 1")
+        if rows is None:
+            rows = np.arange(len(self))
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start:start + chunk_rows]
+            yield chunk, self.take(chunk, columns, dtype)
+
+    def add(self, data, ids, targets, keys=None):
+        """
+        Add observations to the store, given a dictionary of parameter
+        dictionaries and a dictionary of the id and target code for each
+        observation. Observations already in the store are replaced and
+        parameters not yet in the store are added as new columns.
+
+        keys may give a content key for some observations, observations with
+        the same key share one row of the matrix (that of an observation
+        already in the store with the key, if there is one, in which case the
+        parameters of the new observation are not read).
+        """
+        if not data:
+            return
+        if keys is None:
+            keys = {}
+
+        names = sorted(data)
+        codes = self.dtypes.check_targets([targets[name] for name in names])
+        self._check(data, names)
+        self.remove([name for name in names if name in self._rows])
+
+        parameters = set(self.parameters)
+        for name in names:
+            if keys.get(name) not in self._content_rows:
+                parameters.update(data[name])
+        if len(parameters) > len(self.parameters):
+            self._add_parameters(sorted(parameters))
+
+        # Assign each new observation a matrix row, adding a row for each one
+        # that does not share the row of another
+        n_rows = len(self.matrix)
+        new_rows = []
+        added = []
+        content_rows = {}
+        for name in names:
+            key = keys.get(name)
+            if key is not None and key in self._content_rows:
+                new_rows.append(self._content_rows[key])
+            elif key is not None and key in content_rows:
+                new_rows.append(content_rows[key])
+            else:
+                if key is not None:
+                    content_rows[key] = n_rows + len(added)
+                new_rows.append(n_rows + len(added))
+                added.append(name)
+
+        block = np.empty([len(added), len(self.parameters)])
+        block.fill(np.nan)
+        for i, name in enumerate(added):
+            for parameter, value in data[name].items():
+                block[i, self._columns[parameter]] = to_float(value)
+        new_rows = np.array(new_rows, dtype=np.int64)
+
+        # Statistics count every observation, including those sharing a row
+        values = np.empty([len(names), len(self.parameters)])
+        shared = new_rows < n_rows
+        values[~shared] = block[new_rows[~shared] - n_rows]
+        if shared.any():
+            values[shared] = self._values(new_rows[shared], dtype=np.float64)
+        self.stats.merge(ParameterStats.from_matrix(values))
+        self._promote()
+
+        wide = np.vstack([self.wide, block[:, self._wide_columns]])
+        matrix = np.vstack([self.matrix, self._narrow(block)])
+
+        observations = self.observations + names
+        all_ids = self.ids + [ids[name] for name in names]
+        order = sorted(range(len(observations)), key=observations.__getitem__)
+
+        self.observations = [observations[i] for i in order]
+        self.ids = [all_ids[i] for i in order]
+        self._content_rows.update(content_rows)
+        self._set_matrix(matrix, np.concatenate([self.value_rows, new_rows])[order], wide)
+        self.targets = np.concatenate([self.targets, codes])[order]
+        self._reindex()
+
+    def _check(self, data, names):
+        """
+        Raise an Exception if the values of the named observations do not fit
+        the features dtype of a DtypePolicy that does not promote parameters,
+        before any of them are stored.
+        """
+        if self.dtypes.promote:
+            return
+        parameters = set()
+        for name in names:
+            parameters.update(data[name])
+        parameters = sorted(parameters - set(self.wide_parameters) - set(self.dtypes.wide))
+        columns = dict((p, j) for j, p in enumerate(parameters))
+
+        block = np.empty([len(names), len(parameters)])
+        block.fill(np.nan)
+        for i, name in enumerate(names):
+            for parameter, value in data[name].items():
+                if parameter in columns:
+                    block[i, columns[parameter]] = to_float(value)
+        self.dtypes.reject(self.dtypes.check(parameters, ParameterStats.from_matrix(block)))
+
+    def _index_wide(self):
+        """Index the columns of the wide parameters."""
+        self._wide_columns = np.array([self._columns[p] for p in self.wide_parameters], dtype=np.int64)
+        self._wide_positions = dict((column, j) for j, column in enumerate(self._wide_columns.tolist()))
+
+    def _narrow(self, values):
+        """Return float64 values as the features dtype, leaving the columns
+        of wide parameters (held in wide) as NaN."""
+        # Wide values may overflow features, but are then replaced
+        with np.errstate(over="ignore"):
+            narrow = values.astype(self.dtypes.features)
+        narrow[:, self._wide_columns] = np.nan
+        return narrow
+
+    def _promote(self):
+        """
+        Move any parameter that is wide in the DtypePolicy, or whose range no
+        longer fits its features dtype, to the wide values. Values already
+        stored were in range, so are copied from the matrix exactly.
+        """
+        reasons = self.dtypes.check(self.parameters, self.stats)
+        promote = set(reasons) | set(p for p in self.dtypes.wide if p in self._columns)
+        promote -= set(self.wide_parameters)
+        if not promote:
+            return
+
+        self.dtypes.reject(reasons)
+        for parameter in sorted(promote):
+            if parameter not in reasons:
+                continue
+            logger.info("Storing parameter %s as float64 (%s as %s)",
+                    parameter, reasons[parameter], self.dtypes.features)
+
+        previous = dict((p, j) for j, p in enumerate(self.wide_parameters))
+        parameters = sorted(promote | set(self.wide_parameters))
+        wide = np.empty([len(self.matrix), len(parameters)])
+        for j, parameter in enumerate(parameters):
+            if parameter in previous:
+                wide[:, j] = self.wide[:, previous[parameter]]
+            else:
+                wide[:, j] = self.matrix[:, self._columns[parameter]]
+        self.wide = wide
+        self.wide_parameters = parameters
+        self._index_wide()
+
+    def set_dtypes(self, dtypes):
+        """Store the values and target codes as the dtypes of a new
+        DtypePolicy, converting those already stored."""
+        targets = dtypes.check_targets(self.targets)
+        dtypes.reject(dtypes.check(self.parameters, self.stats))
+
+        values = self._values(np.arange(len(self.matrix)), dtype=np.float64)
+        self.targets = targets
+        self.dtypes = dtypes
+        self.matrix = values
+        self.wide_parameters = []
+        self.wide = np.empty([len(values), 0])
+        self._index_wide()
+        self._promote()
+        self.matrix = self._narrow(values)
+        self._reindex()
+
+    def _set_matrix(self, matrix, value_rows, wide=None):
+        """
+        Set the matrix (and wide values, if given) and the matrix row of each
+        observation, dropping rows no observation uses and ordering the rows
+        by their first observation.
+        """
+        if wide is None:
+            wide = self.wide
+        used, first = np.unique(value_rows, return_index=True)
+        row_order = used[np.argsort(first, kind="mergesort")]
+        if len(row_order) == len(matrix) and (row_order == np.arange(len(matrix))).all():
+            self.matrix = matrix
+            self.wide = wide
+            self.value_rows = value_rows
+            return
+
+        mapping = np.empty(len(matrix), dtype=np.int64)
+        mapping.fill(-1)
+        mapping[row_order] = np.arange(len(row_order))
+        self.matrix = matrix[row_order]
+        self.wide = wide[row_order]
+        self.value_rows = mapping[value_rows]
+        self._content_rows = dict((key, int(mapping[row])) for key, row in self._content_rows.items()
+                if mapping[row] >= 0)
+
+    def set_content_keys(self, keys):
+        """
+        Give the named observations in the store the given content keys, so
+        that observations later added with the same key share their row.
+        """
+        for name, key in keys.items():
+            self._content_rows[key] = int(self.value_rows[self._rows[name]])
+
+    def shared_rows(self):
+        """
+        Return a list of the lists of observations that share a matrix row,
+        for each row shared by more than one observation.
+        """
+        groups = {}
+        for observation, row in zip(self.observations, self.value_rows.tolist()):
+            groups.setdefault(row, []).append(observation)
+        return [group for row, group in sorted(groups.items()) if len(group) > 1]
+
+    def _add_parameters(self, parameters):
+        """Expand the matrix to the given sorted list of parameters,
+        filling the new columns with NaN."""
+        matrix = np.empty([len(self.matrix), len(parameters)], dtype=self.matrix.dtype)
+        matrix.fill(np.nan)
+        columns = dict((p, j) for j, p in enumerate(parameters))
+        matrix[:, [columns[p] for p in self.parameters]] = self.matrix
+
+        self.stats = self.stats.expand([columns[p] for p in self.parameters],
+                len(parameters), len(self))
+        self.parameters = parameters
+        self.matrix = matrix
+        self._reindex()
+
+    def remove(self, observations):
+        """Remove the named observations from the store."""
+        if not observations:
+            return
+        keep = np.ones(len(self), dtype=bool)
+        keep[self.rows(observations)] = False
+        removed = ParameterStats.from_matrix(self._values(self.value_rows[~keep], dtype=np.float64))
+
+        self.observations = [o for o, k in zip(self.observations, keep) if k]
+        self.ids = [_id for _id, k in zip(self.ids, keep) if k]
+        self._set_matrix(self.matrix, self.value_rows[keep])
+        self.targets = self.targets[keep]
+        self.stats.remove(removed, lambda changed: self._values(np.arange(len(self.matrix)),
+                np.flatnonzero(changed), np.float64))
+        self._reindex()
@@ -0,0 +1,163 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import json
+import os
+
+import numpy as np
+
+# Increment if the layout of a saved table changes
+TABLE_VERSION = 1
+
+def _encode_ids(ids):
+    """Return an array of ids as UTF-8 bytes."""
+    ids = np.asarray(ids)
+    if ids.dtype.kind == "U":
+        return np.char.encode(ids, "utf-8")
+    if ids.dtype.kind != "S":
+        ids = np.char.encode(ids.astype(str), "utf-8")
+    return ids
+
+class TargetTable(object):
+    """
+    A compact map of target ids to codes, held as a sorted array of ids (as
+    fixed width UTF-8 bytes) and a parallel array of codes, rather than as a
+    dictionary of strings. Ids are found by binary search. A TargetTable may
+    be used wherever a dictionary of targets is read.
+
+    A table can be saved and opened again with its arrays memory mapped, as
+    an on-disk index for point lookups that only reads the pages each
+    search touches.
+    """
+
+    def __init__(self, ids=(), codes=(), source=None):
+        """
+        Build a table of the given ids and their codes. If an id is given
+        more than once its last code is kept, as it would be in a dictionary.
+        source may record the file the targets were read from (see save).
+        """
+        ids = _encode_ids(ids) if len(ids) else np.zeros(0, dtype="S1")
+        codes = np.asarray(codes) if len(codes) else np.zeros(0, dtype=int)
+        if len(ids) != len(codes):
+            raise Exception("TargetTable needs a code for each id")
+
+        order = np.argsort(ids, kind="mergesort")
+        ids = ids[order]
+        codes = codes[order]
+        if len(ids) > 1:
+            last = np.append(ids[1:] != ids[:-1], True)
+            ids = ids[last]
+            codes = codes[last]
+
+        self.ids = ids
+        self.codes = codes
+        self.source = source
+
+    @classmethod
+    def from_dict(cls, targets):
+        """Build a table of a dictionary of ids to codes."""
+        return cls(list(targets.keys()), list(targets.values()))
+
+    def lookup(self, ids):
+        """
+        Return an array of the code of each of the given ids and a boolean
+        array of whether each was found (the codes of those not found are
+        meaningless).
+        """
+        keys = _encode_ids(ids)
+        if not len(self.ids):
+            return np.zeros(len(keys), dtype=self.codes.dtype), np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(self.ids, keys).clip(0, len(self.ids) - 1)
+        return self.codes[positions], self.ids[positions] == keys
+
+    def _position(self, _id):
+        """Return the index of an id in the table, or -1."""
+        key = _id.encode("utf-8")
+        position = int(np.searchsorted(self.ids, key))
+        if position < len(self.ids) and self.ids[position] == key:
+            return position
+        return -1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, _id):
+        return self._position(_id) >= 0
+
+    def __getitem__(self, _id):
+        position = self._position(_id)
+        if position < 0:
+            raise KeyError(_id)
+        return self.codes[position].item()
+
+    def get(self, _id, default=None):
+        """Return the code of an id, or default if it is not in the table."""
+        position = self._position(_id)
+        if position < 0:
+            return default
+        return self.codes[position].item()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """Return a list of the ids in the table, in sorted order."""
+        return [_id.decode("utf-8") for _id in self.ids.tolist()]
+
+    def values(self):
+        """Return a list of the codes in the table, in order of their ids."""
+        return self.codes.tolist()
+
+    def items(self):
+        """Return a list of the (id, code) pairs in the table."""
+        return list(zip(self.keys(), self.values()))
+
+    def to_dict(self):
+        """Return the table as a dictionary of ids to codes."""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (TargetTable, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def save(self, path):
+        """Write the table to the directory at path, creating it if required."""
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "codes.npy"), self.codes)
+
+        fh = open(os.path.join(path, "table.json"), "w")
+        try:
+            json.dump({"version": TABLE_VERSION, "source": self.source}, fh)
+        finally:
+            fh.close()
+
+    @classmethod
+    def open(cls, path, mmap_mode="r"):
+        """
+        Return the table saved at path, with its arrays memory mapped with
+        the given mmap_mode (or read in to memory if mmap_mode is None).
+        """
+        fh = open(os.path.join(path, "table.json"))
+        try:
+            meta = json.load(fh)
+        finally:
+            fh.close()
+        if meta["version"] != TABLE_VERSION:
+            raise Exception("Unsupported target table version %s" % meta["version"])
+
+        table = cls.__new__(cls)
+        table.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mmap_mode)
+        table.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode=mmap_mode)
+        table.source = meta["source"]
+        return table
@@ -0,0 +1,95 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from frontier.IO.AbstractReader import AbstractReader
+
+LINES = ["header"] + ["hoot%d\t%s" % (i, "o" * (i + 1)) for i in range(0, 50)]
+
+class LineReader(AbstractReader):
+    """Collects the lines passed to process_line."""
+    def __init__(self, filepath, header=1, fileobj=None):
+        self.lines = []
+        super(LineReader, self).__init__(filepath, None, True, header, fileobj=fileobj)
+
+    def process_line(self, line):
+        self.lines.append(line)
+
+class BlockReader(LineReader):
+    """Collects the lines of each block passed to process_block."""
+    BLOCK_SIZE = 64
+
+    def process_block(self, block):
+        self.blocks = getattr(self, "blocks", 0) + 1
+        self.lines.extend(block.decode("utf-8").splitlines())
+
+class BufferedBlockReader(BlockReader):
+    """Reads blocks through a buffer, as for a file that cannot be mapped."""
+    def iter_blocks(self, block_size):
+        return self._iter_buffered_blocks(block_size)
+
+class TestAbstractReader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.data_path = os.path.join(cls.tmp_dir, "hoot.txt")
+        fh = io.open(cls.data_path, "w", newline="")
+        fh.write("\r\n".join(LINES))
+        fh.close()
+
+        cls.empty_path = os.path.join(cls.tmp_dir, "empty.txt")
+        open(cls.empty_path, "w").close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_lines(self):
+        self.assertEqual(LINES[1:], LineReader(self.data_path).lines)
+
+    def test_fileobj(self):
+        content = open(self.data_path, "rb").read()
+        for reader_class in [LineReader, BlockReader]:
+            fileobj = io.TextIOWrapper(io.BytesIO(content))
+            reader = reader_class("elsewhere/hoot.txt", fileobj=fileobj)
+            self.assertEqual(LINES[1:], reader.lines)
+            self.assertTrue(fileobj.closed)
+
+    def test_blocks(self):
+        for reader_class in [BlockReader, BufferedBlockReader]:
+            reader = reader_class(self.data_path)
+            self.assertEqual(LINES[1:], reader.lines)
+            self.assertTrue(reader.blocks > 1)
+
+        # Lines longer than a block are not split
+        BlockReader.BLOCK_SIZE = 4
+        try:
+            for reader_class in [BlockReader, BufferedBlockReader]:
+                self.assertEqual(LINES[1:], reader_class(self.data_path).lines)
+        finally:
+            BlockReader.BLOCK_SIZE = 64
+
+    def test_whole_block(self):
+        BlockReader.BLOCK_SIZE = 0
+        try:
+            reader = BlockReader(self.data_path, header=3)
+        finally:
+            BlockReader.BLOCK_SIZE = 64
+        self.assertEqual(LINES[3:], reader.lines)
+        self.assertEqual(1, reader.blocks)
+
+    def test_empty(self):
+        for reader_class in [BlockReader, BufferedBlockReader]:
+            self.assertEqual([], reader_class(self.empty_path).lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
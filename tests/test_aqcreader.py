@@ -139,6 +139,10 @@ EXAMPLE_CLASSES = {
     },
 }
 
+class AQCLineReader(aqcr.AQCReader):
+    # Read the targets line by line rather than in blocks
+    BLOCK_SIZE = None
+
 class TestAQCReader(unittest.TestCase):
 
     @classmethod
@@ -189,5 +193,18 @@ class TestAQCReader(unittest.TestCase):
             self.assertEqual(expected_code, targets[t])
         aqc.close()
 
+    def test_block_line_content(self):
+        # Reading the file in blocks must match reading it line by line
+        for classes in [None, EXAMPLE_CLASSES]:
+            self.assertEqual(AQCLineReader(DATA_PATH, classes).get_data(),
+                    aqcr.AQCReader(DATA_PATH, classes).get_data())
+
+    def test_ids(self):
+        # Only the targets of the given ids are kept
+        ids = ["9999_9#2", "9999_9#7", "1234_5#6"]
+        for reader_class in [aqcr.AQCReader, AQCLineReader]:
+            targets = reader_class(DATA_PATH, EXAMPLE_CLASSES, ids=ids).get_data()
+            self.assertEqual({"9999_9#2": 1, "9999_9#7": -1}, targets.to_dict())
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,6 +6,8 @@ __maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
 import unittest
 import os
 
+import numpy as np
+
 from frontier.IO import BamcheckReader as bcr
 
 DATA_PATH = "tests/data/example.bamcheck.txt"
@@ -48,6 +50,13 @@ class TestBamcheckReader(unittest.TestCase):
                     SN_count += 1
         self.assertEqual(SN_count, len(dup_bamcheck.summary))
 
+        # Duplicate keys are noted for the loader rather than printed
+        self.assertTrue(len(dup_bamcheck.diagnostics) > 0)
+        for kind, key, fpath in dup_bamcheck.diagnostics:
+            self.assertEqual("duplicate_key", kind)
+            self.assertIn(key, dup_bamcheck.summary)
+            self.assertEqual(DUP_DATA_PATH, fpath)
+
     def test_invalid_duplicate(self):
         self.assertRaises(Exception, bcr.BamcheckReader, BAD_DUP_DATA_PATH)
 
@@ -85,6 +94,63 @@ class TestBamcheckReader(unittest.TestCase):
         bamcheck = bcr.BamcheckReader(DATA_PATH)
         self.assertEqual(os.path.basename(DATA_PATH).split(".")[0], bamcheck.get_id())
 
+    def test_block_line_equality(self):
+        # Skipping to the SN and ID records of whole blocks must read the same
+        # data as reading each line
+        class BamcheckLineReader(bcr.BamcheckReader):
+            BLOCK_SIZE = None
+
+        for path in [DATA_PATH, DUP_DATA_PATH]:
+            line_bamcheck = BamcheckLineReader(path)
+            bamcheck = bcr.BamcheckReader(path)
+            self.assertEqual(line_bamcheck.summary, bamcheck.summary)
+            self.assertEqual(line_bamcheck.indel.lengths.tolist(), bamcheck.indel.lengths.tolist())
+            self.assertEqual(line_bamcheck.indel.inserts.tolist(), bamcheck.indel.inserts.tolist())
+            self.assertEqual(line_bamcheck.indel.deletes.tolist(), bamcheck.indel.deletes.tolist())
+        self.assertRaises(Exception, BamcheckLineReader, BAD_DUP_DATA_PATH)
+
+    def test_indel_distribution(self):
+        example_lines = open(DATA_PATH).readlines()
+        bamcheck = bcr.BamcheckReader(DATA_PATH)
+
+        records = []
+        for line in example_lines:
+            if line.startswith("ID"):
+                records.append([int(field) for field in line.strip().split("\t")[1:]])
+        self.assertEqual(len(records), len(bamcheck.indel.lengths))
+        self.assertEqual(sum(r[1] for r in records), bamcheck.indel.total_inserts())
+        self.assertEqual(sum(r[2] for r in records), bamcheck.indel.total_deletes())
+
+        total = sum(r[1] + r[2] for r in records)
+        mean = float(sum(r[0] * (r[1] + r[2]) for r in records)) / total
+        self.assertAlmostEqual(mean, bamcheck.indel.mean_length())
+
+    def test_indel_summaries(self):
+        indel = bcr.IndelDistribution([3, 1, 2], [1, 6, 2], [1, 0, 0])
+        self.assertEqual([1, 2, 3], indel.lengths.tolist())
+        self.assertEqual([6, 2, 1], indel.inserts.tolist())
+        self.assertAlmostEqual(16.0 / 10, indel.mean_length())
+        self.assertEqual([1, 1, 2, 3], indel.quantiles([0, 0.5, 0.8, 1]).tolist())
+        self.assertEqual(9.0, indel.insert_delete_ratio())
+
+        empty = bcr.IndelDistribution()
+        self.assertEqual(0, empty.total_inserts())
+        self.assertTrue(np.isnan(empty.mean_length()))
+        self.assertTrue(np.isnan(empty.quantiles([0.5])).all())
+        self.assertTrue(np.isnan(empty.insert_delete_ratio()))
+
+    def test_indel_parameters(self):
+        class BamcheckIndelReader(bcr.BamcheckReader):
+            INDEL_PARAMETERS = True
+
+        bamcheck = bcr.BamcheckReader(DATA_PATH)
+        data = BamcheckIndelReader(DATA_PATH).get_data()
+        indel_summary = bamcheck.indel.summary()
+        self.assertEqual(len(bamcheck.get_data()) + len(indel_summary), len(data))
+        for key, value in indel_summary.items():
+            self.assertEqual(value, data[key])
+        self.assertNotIn("indel-mean-length", bamcheck.get_data())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,48 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import argparse
+import unittest
+
+from benchmarks import suite
+
+BASELINE = {
+    "1000": {
+        "load_data": {"seconds": 2.0, "peak_bytes": 1000},
+        "test_variance": {"seconds": 1.0, "peak_bytes": 500},
+    },
+}
+
+class TestSuite(unittest.TestCase):
+
+    def test_compare(self):
+        results = {
+            "1000": {
+                "load_data": {"seconds": 2.4, "peak_bytes": 1300},
+                "test_variance": {"seconds": 1.5, "peak_bytes": 500},
+                "parse_targets": {"seconds": 9.0, "peak_bytes": 9000},
+            },
+            "10000": {
+                "load_data": {"seconds": 90.0, "peak_bytes": 90000},
+            },
+        }
+
+        # Only metrics worse than the threshold are flagged, and phases or
+        # sizes missing from the baseline are not compared
+        self.assertEqual([
+                ("1000", "load_data", "peak_bytes", 1300, 1000),
+                ("1000", "test_variance", "seconds", 1.5, 1.0),
+            ], suite.compare(results, BASELINE, 1.25))
+        self.assertEqual([("1000", "test_variance", "seconds", 1.5, 1.0)],
+                suite.compare(results, BASELINE, 1.4))
+        self.assertEqual([], suite.compare(results, BASELINE, 2.0))
+        self.assertEqual([], suite.compare(BASELINE, BASELINE, 1.0))
+
+    def test_parse_class_mix(self):
+        self.assertEqual({"pass": 0.7, "fail": 0.3}, suite.parse_class_mix("pass=0.7,fail=0.3"))
+        self.assertRaises(argparse.ArgumentTypeError, suite.parse_class_mix, "pass=0.7,hoot=0.3")
+
+if __name__ == '__main__':
+    unittest.main()
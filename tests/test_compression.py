@@ -0,0 +1,124 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from frontier.IO import compression
+from frontier.IO.AQCReader import AQCReader
+from frontier.IO.BamcheckReader import BamcheckReader
+
+BAMCHECK_PATH = "tests/data/example.bamcheck.txt"
+AQC_PATH = "tests/data/example.aqc.txt"
+
+COMPRESSORS = {
+    "gzip": gzip.compress,
+    "bgzip": compression.bgzf_compress,
+    "xz": lzma.compress,
+}
+
+class ThreadedBamcheckReader(BamcheckReader):
+    """Decompresses bgzip blocks with a pool of threads."""
+    DECOMPRESS_THREADS = 4
+
+class TestCompression(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.bamcheck = open(BAMCHECK_PATH, "rb").read()
+        cls.paths = {}
+        for name, compress in COMPRESSORS.items():
+            path = os.path.join(cls.tmp_dir, "example.bamcheck.%s" % name)
+            fh = open(path, "wb")
+            fh.write(compress(cls.bamcheck))
+            fh.close()
+            cls.paths[name] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_detect_compression(self):
+        self.assertEqual(None, compression.detect_compression(io.BytesIO(self.bamcheck)))
+        self.assertEqual(None, compression.detect_compression(io.BytesIO(b"")))
+        for name, compress in COMPRESSORS.items():
+            fh = io.BytesIO(b"#" + compress(self.bamcheck))
+            fh.seek(1)
+            self.assertEqual(name, compression.detect_compression(fh))
+            self.assertEqual(1, fh.tell())
+        self.assertEqual("zstd", compression.detect_compression(io.BytesIO(b"\x28\xb5\x2f\xfd\x00")))
+
+    def test_open_text(self):
+        # Each file is opened once, and closed with the text read from it
+        real_open = open
+        text = io.TextIOWrapper(io.BytesIO(self.bamcheck)).read()
+        for name, path in [(None, BAMCHECK_PATH)] + sorted(self.paths.items()):
+            handles = []
+            def tracked(*args, **kwargs):
+                handles.append(real_open(*args, **kwargs))
+                return handles[-1]
+            with mock.patch("builtins.open", side_effect=tracked):
+                fh, found = compression.open_text(path, 2)
+            self.assertEqual(1, len(handles))
+            self.assertEqual(name, found)
+            self.assertEqual(text, fh.read())
+            fh.close()
+            self.assertTrue(handles[0].closed)
+
+    def test_bgzf_reader(self):
+        data = b"".join(b"line %d of some data\n" % i for i in range(0, 50000))
+        content = compression.bgzf_compress(data)
+        self.assertTrue(content.endswith(compression.BGZF_EOF))
+
+        # Plain gzip reads every member of a BGZF file
+        self.assertEqual(data, gzip.decompress(content))
+        for threads in [None, 1, 4]:
+            stream = compression.open_stream(io.BytesIO(content), "bgzip", threads)
+            self.assertEqual(data, stream.read())
+            stream.close()
+
+        stream = compression.open_stream(io.BytesIO(content), "bgzip", 2)
+        self.assertEqual(data[:100], stream.read(100))
+        stream.close()
+
+    def test_bamcheck_reader(self):
+        plain = BamcheckReader(BAMCHECK_PATH)
+        for name, path in self.paths.items():
+            for reader_class in [BamcheckReader, ThreadedBamcheckReader]:
+                reader = reader_class(path)
+                self.assertEqual(name, reader.compression)
+                self.assertEqual(plain.get_data(), reader.get_data())
+                self.assertEqual(plain.indel.total_inserts(), reader.indel.total_inserts())
+                self.assertEqual("example", reader.get_id())
+
+    def test_aqc_reader(self):
+        path = os.path.join(self.tmp_dir, "example.aqc.txt.gz")
+        fh = open(path, "wb")
+        fh.write(gzip.compress(open(AQC_PATH, "rb").read()))
+        fh.close()
+        self.assertEqual(AQCReader(AQC_PATH).get_data(), AQCReader(path).get_data())
+
+    def test_open_bytes(self):
+        for name, compress in COMPRESSORS.items():
+            fh = compression.open_bytes(compress(self.bamcheck), 2)
+            self.assertEqual(self.bamcheck.decode("utf-8").replace("\r\n", "\n"), fh.read())
+
+    @unittest.skipIf(compression.zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        path = os.path.join(self.tmp_dir, "example.bamcheck.zst")
+        fh = open(path, "wb")
+        fh.write(compression.zstandard.ZstdCompressor().compress(self.bamcheck))
+        fh.close()
+        self.assertEqual(BamcheckReader(BAMCHECK_PATH).get_data(), BamcheckReader(path).get_data())
+
+if __name__ == '__main__':
+    unittest.main()
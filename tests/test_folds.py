@@ -0,0 +1,100 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from frontier import folds
+
+CODES = np.array([1] * 60 + [0] * 30 + [-1] * 10)
+
+class TestFolds(unittest.TestCase):
+
+    def test_stratified_kfold(self):
+        pairs = folds.stratified_kfold(CODES, 5, np.random.RandomState(0))
+        self.assertEqual(5, len(pairs))
+
+        # Every index is tested exactly once and never trained on in its fold
+        tested = np.concatenate([test for train, test in pairs])
+        self.assertEqual(list(range(0, len(CODES))), sorted(tested.tolist()))
+        for train, test in pairs:
+            self.assertEqual(len(CODES), len(train) + len(test))
+            self.assertEqual(0, len(np.intersect1d(train, test)))
+            self.assertEqual(sorted(test.tolist()), test.tolist())
+
+            # Each fold holds a fifth of each class
+            self.assertEqual(12, (CODES[test] == 1).sum())
+            self.assertEqual(6, (CODES[test] == 0).sum())
+            self.assertEqual(2, (CODES[test] == -1).sum())
+
+        # The same seed gives the same folds
+        again = folds.stratified_kfold(CODES, 5, np.random.RandomState(0))
+        self.assertEqual([test.tolist() for train, test in pairs],
+                [test.tolist() for train, test in again])
+
+        self.assertRaises(Exception, folds.stratified_kfold, CODES, 1, np.random.RandomState(0))
+        self.assertRaises(Exception, folds.stratified_kfold, CODES[:3], 4, np.random.RandomState(0))
+
+    def test_uneven_kfold(self):
+        # Folds differ in size by at most one, even if no class divides evenly
+        codes = np.array([0] * 7 + [1] * 5 + [2] * 2)
+        sizes = [len(test) for train, test in folds.stratified_kfold(codes, 3, np.random.RandomState(0))]
+        self.assertEqual(14, sum(sizes))
+        self.assertTrue(max(sizes) - min(sizes) <= 1)
+
+    def test_stratified_holdout(self):
+        train, test = folds.stratified_holdout(CODES, 0.2, np.random.RandomState(0))
+        self.assertEqual(20, len(test))
+        self.assertEqual(80, len(train))
+        self.assertEqual(2, (CODES[test] == -1).sum())
+        self.assertRaises(Exception, folds.stratified_holdout, CODES, 1.5, np.random.RandomState(0))
+
+    def test_splits(self):
+        rows = np.arange(100, 200)
+        splits = folds.Splits.kfold(rows, CODES, k=4, repeats=2, seed=3, fingerprint="abc")
+        self.assertEqual(8, len(splits))
+        self.assertEqual({"k": 4, "repeats": 2, "seed": 3}, splits.options)
+
+        # Repeats are shuffled differently
+        self.assertNotEqual(splits[0][1].tolist(), splits[4][1].tolist())
+
+        train, test = splits.store_rows(1)
+        self.assertEqual((splits[1][1] + 100).tolist(), test.tolist())
+
+        holdouts = folds.Splits.holdout(rows, CODES, test_size=0.1, repeats=3)
+        self.assertEqual(3, len(holdouts))
+        self.assertEqual([10, 10, 10], [len(test) for train, test in holdouts])
+
+    def test_save_open(self):
+        tmp_dir = tempfile.mkdtemp()
+        splits = {
+            "folds": folds.Splits.kfold(np.arange(0, 100), CODES, k=5, fingerprint="abc"),
+            "holdout": folds.Splits.holdout(np.arange(0, 100), CODES, repeats=2),
+        }
+        folds.save_splits(os.path.join(tmp_dir, "splits"), splits)
+        opened = folds.open_splits(os.path.join(tmp_dir, "splits"))
+
+        self.assertEqual(sorted(splits), sorted(opened))
+        for name in splits:
+            self.assertEqual(splits[name].kind, opened[name].kind)
+            self.assertEqual(splits[name].fingerprint, opened[name].fingerprint)
+            self.assertEqual(splits[name].options, opened[name].options)
+            self.assertEqual(splits[name].rows.tolist(), opened[name].rows.tolist())
+            self.assertEqual([(train.tolist(), test.tolist()) for train, test in splits[name]],
+                    [(train.tolist(), test.tolist()) for train, test in opened[name]])
+
+        # Saving again replaces the splits saved before
+        folds.save_splits(os.path.join(tmp_dir, "splits"), {"holdout": splits["holdout"]})
+        self.assertEqual(["holdout"], sorted(folds.open_splits(os.path.join(tmp_dir, "splits"))))
+
+        self.assertEqual({}, folds.open_splits(os.path.join(tmp_dir, "missing")))
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,30 @@ __version__ = "0.1.2"
 __maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
 
 from frontier import frontier as f
+from frontier.IO.AQCReader import AQCReader
+from frontier.IO.BamcheckReader import BamcheckReader
+from frontier.IO.ParseCache import ParseCache
+from frontier.report import Diagnostics, ProgressLogger
+from frontier.results import ResultsCache
+from frontier.store import DtypePolicy
+from frontier.targets import TargetTable
+
+import gzip
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
+from unittest import mock
+
+import numpy as np
+
+BAMCHECK_PATH = "tests/data/example.bamcheck.txt"
+DUP_DATA_PATH = "tests/data/example.bamcheck.dups.txt"
 
 CLASSES = {
         "pass": {
@@ -70,6 +93,63 @@ class TestFrontierUtils(unittest.TestCase):
         self.assertRaises(Exception, f.count_class, CLASSES, "hoot")
 
 
+class TestClassRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = f.ClassRegistry(CLASSES)
+
+    def test_classify(self):
+        for class_name in CLASSES:
+            for name in CLASSES[class_name]["names"]:
+                self.assertEqual(class_name, self.registry.classify(name))
+                self.assertEqual(class_name, self.registry.classify(name.upper()))
+                self.assertEqual(class_name, f.classify_label(self.registry, name))
+        self.assertRaises(Exception, self.registry.classify, "hoot")
+
+    def test_encode_decode(self):
+        for class_name in CLASSES:
+            code = CLASSES[class_name]["code"]
+            self.assertEqual(code, self.registry.encode(class_name))
+            self.assertEqual(class_name, self.registry.decode(code))
+            self.assertEqual(class_name, f.decode_class(self.registry, code))
+        self.assertRaises(Exception, self.registry.encode, "hoot")
+        self.assertRaises(Exception, self.registry.decode, 5)
+
+    def test_decode_recode(self):
+        RECODE_CLASSES = {
+            "pass": {"names": ["pass"], "code": 1},
+            "warn": {"names": ["warn"], "code": 1, "_recode": True},
+        }
+        registry = f.ClassRegistry(RECODE_CLASSES)
+        self.assertEqual(1, registry.encode(registry.classify("warn")))
+        self.assertEqual("pass", registry.decode(1))
+
+    def test_encode_decode_arrays(self):
+        labels = ["pass", "FAILED", "warning", "pass", "fail"]
+        codes = self.registry.encode_labels(labels)
+        self.assertEqual([1, -1, 0, 1, -1], codes.tolist())
+        self.assertEqual(["pass", "fail", "warn", "pass", "fail"],
+                self.registry.decode_codes(codes).tolist())
+        self.assertEqual(0, len(self.registry.decode_codes([])))
+
+    def test_count(self):
+        registry = f.ClassRegistry({
+            "pass": {"names": ["pass"], "code": 1},
+            "fail": {"names": ["fail"], "code": -1},
+        })
+        registry.count("pass")
+        registry.count("pass", 2)
+        f.count_class(registry, "fail")
+        self.assertEqual(3, registry["pass"]["_count"])
+        self.assertEqual(1, registry["fail"]["_count"])
+        self.assertRaises(Exception, registry.count, "hoot")
+
+        # Counts are not written to the classes the registry was compiled from
+        classes = {"pass": {"names": ["pass"], "code": 1}}
+        f.ClassRegistry(classes).count("pass")
+        self.assertNotIn("_count", classes["pass"])
+
+
 NUM_OBSERVATIONS = 10
 TEST_PARAMETERS = [
     "hoothoot",
@@ -144,6 +224,16 @@ class TestFrontier(unittest.TestCase):
         for p in parameters:
             self.assertTrue(search_terms[0] in p or search_terms[1] in p)
 
+    def test_find_parameters_regex(self):
+        parameters = self.plex.find_parameters(["^talon-", "^hoot$"], regex=True)
+        self.assertEqual(["hoot", "talon-length", "talon-sharpness"], parameters)
+
+    def test_count_parameters(self):
+        counts = self.plex.count_parameters()
+        self.assertEqual(sorted(TEST_PARAMETERS), sorted(counts))
+        for tp in TEST_PARAMETERS:
+            self.assertEqual(NUM_OBSERVATIONS, counts[tp])
+
     def test_find_regressor_unknown(self):
         parameters = self.plex.find_parameters(["imgur-appearances"])
         self.assertEqual(0, len(parameters))
@@ -290,11 +380,667 @@ class TestFrontier(unittest.TestCase):
         self.assertEqual(len(search_targets), len(levels))
         self.assertEqual(sorted(search_targets), levels)
 
+    def test_parameter_stats(self):
+        # Data was generated in __init __ as i*j for jth attribute of ith observation
+        stats = self.plex.parameter_stats()
+        self.assertEqual(sorted(TEST_PARAMETERS), sorted(stats))
+
+        values = range(0, NUM_OBSERVATIONS)
+        for j, tp in enumerate(TEST_PARAMETERS):
+            self.assertAlmostEqual(np.mean(values) * j, stats[tp]["mean"])
+            self.assertAlmostEqual(np.var(values) * j * j, stats[tp]["variance"])
+            self.assertEqual(0, stats[tp]["min"])
+            self.assertEqual((NUM_OBSERVATIONS - 1) * j, stats[tp]["max"])
+            self.assertEqual(NUM_OBSERVATIONS, stats[tp]["count"])
+            self.assertEqual(0, stats[tp]["missing"])
+
+        stats = self.plex.parameter_stats(["hoot"])
+        self.assertEqual(["hoot"], list(stats))
+        self.assertRaises(KeyError, self.plex.parameter_stats, ["max-altitude"])
+
+    def test_get_data_by_target_single(self):
+        data, target, levels = self.plex.get_data_by_target(["hoot"], 1)
+        self.assertEqual([1, 1], target.tolist())
+        self.assertEqual([1], levels)
+        self.assertEqual([[2 * TEST_PARAMETERS.index("hoot")], [3 * TEST_PARAMETERS.index("hoot")]],
+                data.tolist())
+
+    def test_get_data_by_all_targets(self):
+        data, target, levels = self.plex.get_data_by_target(["hoot"], None)
+        self.assertEqual(NUM_OBSERVATIONS, len(data))
+        self.assertEqual(TARGETS, target.tolist())
+        self.assertEqual(sorted(set(TARGETS)), levels)
+
+    def test_iter_data_by_parameters(self):
+        data = self.plex.get_data_by_parameters(TEST_PARAMETERS)
+        chunks = list(self.plex.iter_data_by_parameters(TEST_PARAMETERS, chunk_rows=3))
+        self.assertEqual([3, 3, 3, 1], [len(chunk[0]) for chunk in chunks])
+        self.assertEqual(data.tolist(), np.vstack([chunk[0] for chunk in chunks]).tolist())
+        self.assertEqual(TARGETS, sum([chunk[1].tolist() for chunk in chunks], []))
+        self.assertEqual(["Frontier%d" % i for i in range(0, NUM_OBSERVATIONS)],
+                sum([chunk[2] for chunk in chunks], []))
+
+    def test_iter_data_by_target(self):
+        data, target, levels = self.plex.get_data_by_target(["hoot"], [0, 2])
+        chunks = list(self.plex.iter_data_by_target(["hoot"], [0, 2], chunk_rows=4))
+        self.assertEqual([4, 3], [len(chunk[0]) for chunk in chunks])
+        self.assertEqual(data.tolist(), np.vstack([chunk[0] for chunk in chunks]).tolist())
+        self.assertEqual(target.tolist(), np.concatenate([chunk[1] for chunk in chunks]).tolist())
+
+    def test_iter_batches(self):
+        batches = list(self.plex.iter_batches(["hoot"], 4, seed=1, epochs=2))
+        self.assertEqual([4, 4, 2, 4, 4, 2], [len(batch[0]) for batch in batches])
+
+        # Each epoch covers every observation, in a different order
+        first = sum([batch[2] for batch in batches[:3]], [])
+        second = sum([batch[2] for batch in batches[3:]], [])
+        self.assertEqual(sorted(self.plex._store.ids), sorted(first))
+        self.assertEqual(sorted(first), sorted(second))
+        self.assertNotEqual(first, second)
+        for data, target, ids in batches:
+            rows = self.plex._store.id_rows(ids)
+            self.assertEqual(self.plex._store.take(rows, self.plex._store.columns(["hoot"])).tolist(),
+                    data.tolist())
+            self.assertEqual(self.plex._store.targets[rows].tolist(), target.tolist())
+
+        # The same seed gives the same batches, with or without prefetching
+        again = list(self.plex.iter_batches(["hoot"], 4, seed=1, epochs=2, prefetch=2))
+        self.assertEqual([batch[2] for batch in batches], [batch[2] for batch in again])
+
+        batches = list(self.plex.iter_batches(["hoot"], 4, targets=[0, 2], drop_last=True))
+        self.assertEqual([4], [len(batch[0]) for batch in batches])
+        self.assertTrue(set(batches[0][1].tolist()) <= set([0, 2]))
+        self.assertRaises(Exception, self.plex.iter_batches, ["hoot"], 0)
+
+    def test_iter_balanced_batches(self):
+        batches = self.plex.iter_batches(["hoot"], 4, balance=True, epochs=None)
+        targets = np.concatenate([next(batches)[1] for i in range(0, 4)])
+        self.assertEqual(16, len(targets))
+        for code in [0, 1, 2, 3]:
+            self.assertEqual(4, (targets == code).sum())
+
     #TODO Not urgent, only used as part of log output and correct
     #     behaviour observed by manual check
+    def test_make_folds(self):
+        splits = self.plex.make_folds(k=2, targets=[0, 2], seed=1)
+        self.assertEqual(["folds"], self.plex.list_splits())
+        self.assertIs(splits, self.plex.get_splits("folds"))
+
+        # Indexes are in to the rows of get_data_by_target of the split targets
+        data, target, levels = self.plex.get_data_by_target(["hoot"], [0, 2])
+        for (train, test), split in zip(splits, self.plex.iter_split_data("folds", ["hoot"])):
+            self.assertEqual(data[train].tolist(), split[0].tolist())
+            self.assertEqual(target[train].tolist(), split[1].tolist())
+            self.assertEqual(data[test].tolist(), split[2].tolist())
+            self.assertEqual(target[test].tolist(), split[3].tolist())
+
+            # Each fold tests about half of each class
+            self.assertEqual(2, (target[test] == 2).sum())
+            self.assertIn((target[test] == 0).sum(), [1, 2])
+
+        holdouts = self.plex.make_holdouts(test_size=0.5, repeats=3, name="half")
+        self.assertEqual(["folds", "half"], self.plex.list_splits())
+        self.assertEqual(3, len(holdouts))
+        self.assertRaises(KeyError, self.plex.get_splits, "hoot")
+        self.plex._splits = {}
+
     def test_count_targets_by_class(self):
         pass
 
 
+LOAD_TARGETS = {
+    "9999_9#1": "pass",
+    "9999_9#2": "fail",
+    "9999_9#3": "warning",
+    "9999_9#4": "passed",
+    "9999_9#5": "failed",
+}
+
+class TestStatplexerLoad(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Copy the example bamcheck for each lanelet over two directories,
+        # leaving one lanelet without a target
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.data_dir = os.path.join(cls.tmp_dir, "data")
+        os.makedirs(os.path.join(cls.data_dir, "sub"))
+        for i, _id in enumerate(sorted(LOAD_TARGETS) + ["9999_9#6"]):
+            sub = "sub" if i % 2 else ""
+            shutil.copy(BAMCHECK_PATH, os.path.join(cls.data_dir, sub, _id + ".bamcheck"))
+
+        cls.target_path = os.path.join(cls.tmp_dir, "aqc.txt")
+        tdh = open(cls.target_path, "w")
+        tdh.write("lanelet\tsample\tstudy\tnpg\taqc\t...\n")
+        for _id, label in LOAD_TARGETS.items():
+            tdh.write("%s\tS\tS\tnpg\t%s\t...\n" % (_id, label))
+        tdh.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def load(self, **kwargs):
+        return f.Statplexer(self.data_dir, self.target_path, CLASSES,
+                BamcheckReader, AQCReader, **kwargs)
+
+    def test_load(self):
+        plex = self.load()
+        self.assertEqual(len(LOAD_TARGETS), len(plex))
+        self.assertEqual(len(LOAD_TARGETS), len(plex._targets))
+        self.assertEqual(2, plex._classes["pass"]["_count"])
+        self.assertEqual(2, plex._classes["fail"]["_count"])
+        self.assertEqual(1, plex._classes["warn"]["_count"])
+
+    def test_load_report(self):
+        progress = []
+        plex = self.load(progress=lambda report: progress.append(report.files_read))
+        report = plex.load_report
+        self.assertEqual(6, report.files_total)
+        self.assertEqual(6, report.files_read)
+        self.assertEqual([1, 2, 3, 4, 5, 6], progress)
+        self.assertEqual(6 * os.path.getsize(BAMCHECK_PATH), report.bytes_read)
+        self.assertEqual(0, report.eta())
+
+        for phase in ["walk", "targets", "parse", "merge", "variance"]:
+            self.assertTrue(report.phases[phase]["wall"] >= 0)
+        self.assertTrue(report.phases["parse"]["wall"] > 0)
+        self.assertEqual(6, len(report.slowest))
+        self.assertEqual(sorted(report.slowest, reverse=True), report.slowest)
+
+        summary = report.to_dict()
+        self.assertEqual(6, len(summary["slowest"]))
+        self.assertTrue(summary["files_per_second"] > 0)
+
+        # The lanelet without a target is counted rather than printed, as is
+        # each parameter without variance (every data file is the same bamcheck)
+        self.assertEqual({"missing_target": 1, "nil_variance": len(plex.list_parameters())},
+                report.diagnostics.counts)
+        self.assertIn("9999_9#6", summary["diagnostics"]["missing_target"]["samples"][0])
+
+        parallel = self.load(processes=2, chunksize=2)
+        self.assertEqual(6, parallel.load_report.files_read)
+        self.assertTrue(parallel.load_report.phases["parse"]["wall"] > 0)
+
+    def test_load_diagnostics(self):
+        with self.assertLogs("frontier", level="WARNING") as logs:
+            plex = self.load()
+        self.assertIn("9999_9#6", logs.output[0])
+        nil_variance = [line for line in logs.output if "NIL variance" in line]
+        self.assertEqual(10, len(nil_variance))
+        self.assertIn("%d nil_variance" % len(plex.list_parameters()), logs.output[-1])
+        self.assertEqual(13, len(logs.output))
+
+        # Duplicates of observations already loaded are noted, as are
+        # problems noted by the reader of each file
+        copy_dir = tempfile.mkdtemp()
+        copy_path = os.path.join(copy_dir, "9999_9#1.copy.bamcheck")
+        shutil.copy(BAMCHECK_PATH, copy_path)
+        with self.assertLogs("frontier", level="WARNING") as logs:
+            plex.add_files([copy_path, DUP_DATA_PATH])
+        self.assertEqual(1, len([line for line in logs.output if "Duplicate observation 9999_9#1" in line]))
+        self.assertTrue(len([line for line in logs.output if "Duplicate key" in line]) > 1)
+        shutil.rmtree(copy_dir)
+
+        # Only the first few problems of each kind are logged, all are counted
+        diagnostics = Diagnostics(log_limit=2, samples=3)
+        with self.assertLogs("frontier", level="WARNING") as logs:
+            for i in range(0, 100):
+                diagnostics.note("missing_target", "9999_9#%d" % i, "owl")
+            diagnostics.summarise()
+        self.assertEqual(4, len(logs.output))
+        self.assertIn("100 missing_target", logs.output[-1])
+        self.assertEqual(100, len(diagnostics))
+        self.assertEqual({"missing_target": {"count": 100, "samples": [
+                "Observation 9999_9#0 of owl has no target",
+                "Observation 9999_9#1 of owl has no target",
+                "Observation 9999_9#2 of owl has no target"]}}, diagnostics.to_dict())
+
+    def test_dedup(self):
+        # Every data file is a copy of the same bamcheck, so only one is read
+        with mock.patch.object(f, "_read_observation", wraps=f._read_observation) as read:
+            plex = self.load(dedup=True)
+        self.assertEqual(1, read.call_count)
+        fpaths = sorted(plex._files)
+        self.assertEqual(1, len(plex.load_report.duplicates))
+        self.assertEqual(read.call_args[0][0], plex.load_report.duplicates[0][0])
+        self.assertEqual(fpaths, sorted(plex.load_report.duplicates[0]))
+        self.assertEqual(6, plex.load_report.files_read)
+
+        # Observations with a target share one row, but keep their own targets
+        plain = self.load()
+        self.assertEqual(len(plain), len(plex))
+        self.assertEqual(1, len(plex._store.matrix))
+        self.assertEqual(plain._targets, plex._targets)
+        self.assertEqual(plain.count_targets_by_class(), plex.count_targets_by_class())
+        parameters = plain.list_parameters()
+        self.assertEqual(parameters, plex.list_parameters())
+        self.assertEqual(plain.parameter_stats(), plex.parameter_stats())
+        data, target, levels = plain.get_data_by_target(parameters, [1, -1])
+        d_data, d_target, d_levels = plex.get_data_by_target(parameters, [1, -1])
+        self.assertTrue((data == d_data).all())
+        self.assertEqual(target.tolist(), d_target.tolist())
+        self.assertEqual(plain.fingerprint(), plex.fingerprint())
+
+        # Shared rows are kept in a snapshot
+        path = os.path.join(self.tmp_dir, "dedup_snapshot")
+        plex.save(path)
+        snapshot = f.Statplexer.open(path)
+        self.assertEqual(1, len(snapshot._store.matrix))
+        self.assertTrue((data == snapshot.get_data_by_target(parameters, [1, -1])[0]).all())
+        shutil.rmtree(path)
+
+        # A copy added later shares the row of the files already read
+        copy_dir = tempfile.mkdtemp()
+        copy_path = os.path.join(copy_dir, "9999_9#2.rerun.bamcheck")
+        shutil.copy(BAMCHECK_PATH, copy_path)
+        plex.add_files([copy_path])
+        self.assertEqual(len(plain) + 1, len(plex))
+        self.assertEqual(1, len(plex._store.matrix))
+        self.assertEqual([sorted(fpaths + [copy_path])], plex.duplicate_groups())
+
+        # Different contents are read
+        fh = open(copy_path, "a")
+        fh.write("SN\towls:\t1\n")
+        fh.close()
+        plex.add_files([copy_path])
+        self.assertEqual(2, len(plex._store.matrix))
+        self.assertEqual([fpaths], plex.duplicate_groups())
+        plex.remove_files(fpaths[1:])
+        self.assertEqual([], plex.duplicate_groups())
+        shutil.rmtree(copy_dir)
+
+    def test_progress_logger(self):
+        logger = logging.getLogger("frontier.test")
+        with self.assertLogs(logger, level="INFO") as logs:
+            self.load(progress=ProgressLogger(logger, interval=3600))
+        # The first and last file are always logged
+        self.assertEqual(2, len(logs.output))
+        self.assertTrue("Read 6 of 6 files" in logs.output[-1])
+
+    def test_parallel_load(self):
+        serial = self.load()
+        parallel = self.load(processes=2, chunksize=2)
+
+        self.assertEqual(serial._targets, parallel._targets)
+        self.assertEqual(serial._store.observations, parallel._store.observations)
+        self.assertEqual(serial._store.ids, parallel._store.ids)
+        self.assertTrue((serial.get_targets() == parallel.get_targets()).all())
+        self.assertEqual(serial.count_targets_by_class(), parallel.count_targets_by_class())
+        parameters = serial.list_parameters()
+        self.assertTrue((serial.get_data_by_parameters(parameters)
+                == parallel.get_data_by_parameters(parameters)).all())
+
+    def test_async_load(self):
+        serial = self.load()
+
+        # Delay each read, as for a slow network file system, and count how
+        # many reads are running at once
+        read_file_bytes = f._read_file_bytes
+        lock = threading.Lock()
+        running = [0, 0]
+        def slow_read_file_bytes(fpath):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            try:
+                time.sleep(0.1)
+                return read_file_bytes(fpath)
+            finally:
+                with lock:
+                    running[0] -= 1
+
+        with mock.patch.object(f, "_read_file_bytes", slow_read_file_bytes):
+            plex = self.load(concurrency=6)
+
+        # Reads are overlapped rather than made one at a time
+        self.assertTrue(running[1] > 1)
+        self.assertEqual(serial._targets, plex._targets)
+        self.assertEqual(serial._store.observations, plex._store.observations)
+        parameters = serial.list_parameters()
+        self.assertTrue((serial.get_data_by_parameters(parameters)
+                == plex.get_data_by_parameters(parameters)).all())
+        self.assertEqual(6, plex.load_report.files_read)
+
+        plex = self.load(concurrency=2)
+        self.assertEqual(serial._store.observations, plex._store.observations)
+
+    def test_cached_load(self):
+        cache = ParseCache(os.path.join(self.tmp_dir, "cache"))
+        plex = self.load()
+        cold = self.load(cache=cache)
+        warm = self.load(cache=cache, processes=2)
+
+        parameters = plex.list_parameters()
+        for cached in [cold, warm]:
+            self.assertEqual(plex._store.observations, cached._store.observations)
+            self.assertTrue((plex.get_data_by_parameters(parameters)
+                    == cached.get_data_by_parameters(parameters)).all())
+        shutil.rmtree(cache.cache_dir)
+
+    def test_results_cache(self):
+        plex = self.load()
+        fingerprint = plex.fingerprint()
+        self.assertEqual(fingerprint, self.load().fingerprint())
+
+        # The fingerprint of a snapshot is that of the data it was saved from
+        path = os.path.join(self.tmp_dir, "results_snapshot")
+        plex.save(path)
+        snapshot = f.Statplexer.open(path)
+        self.assertEqual(fingerprint, snapshot.fingerprint())
+        snapshot._remove_observations(snapshot._store.observations[:1])
+        self.assertNotEqual(fingerprint, snapshot.fingerprint())
+        shutil.rmtree(path)
+
+        cache = ResultsCache(os.path.join(self.tmp_dir, "results.db"))
+        parameters = plex.find_parameters(["reads"])
+        data, target, levels = plex.get_data_by_target(parameters, [1, -1])
+        self.assertIsNone(plex.cached_result(cache, parameters, target, 2))
+
+        log_path = os.path.join(self.tmp_dir, "log.txt")
+        with mock.patch("sys.stdout"):
+            plex.write_log(log_path, "owl.pdf", None, "owls", parameters, target,
+                    np.array([0.5, 0.75]), 2, {parameters[0]: 0.5}, cache=cache, timings={"fit": 0.1})
+        result = plex.cached_result(cache, parameters, [-1, 1], 2)
+        self.assertEqual([0.5, 0.75], result.scores.tolist())
+        self.assertEqual({"fit": 0.1}, result.timings)
+
+        # The log can be written again from the cache
+        with mock.patch("sys.stdout"):
+            plex.write_log(log_path, "owl.pdf", None, "owls", parameters, target, None, 2, None, cache=cache)
+            self.assertRaises(KeyError, plex.write_log, log_path, "owl.pdf", None, "owls",
+                    parameters, target, None, 3, None, cache=cache)
+        fh = open(log_path)
+        log = fh.read()
+        fh.close()
+        self.assertEqual(2, log.count("Data Hash\t%s" % fingerprint))
+        self.assertEqual(2, log.count("CV Score (Fld)\t0.62 +/- 0.25 (2)"))
+        cache.close()
+
+    def test_dtypes(self):
+        plex = self.load()
+        compact = self.load(dtypes=DtypePolicy.compact())
+        parameters = plex.find_parameters(["reads"])
+
+        data, target, levels = plex.get_data_by_target(parameters, [1, -1])
+        c_data, c_target, c_levels = compact.get_data_by_target(parameters, [1, -1])
+        self.assertEqual(np.float64, data.dtype)
+        self.assertEqual(np.float64, target.dtype)
+        self.assertEqual(np.int8, c_target.dtype)
+        self.assertEqual(data.tolist(), c_data.tolist())
+
+        # Counts too large for float32 are kept (and returned) as float64
+        wide = compact._store.wide_parameters
+        narrow = [p for p in parameters if p not in wide]
+        self.assertIn("total-length", wide)
+        self.assertEqual(np.float64, c_data.dtype)
+        self.assertEqual(np.float32, compact.get_data_by_parameters(narrow).dtype)
+        self.assertEqual(target.tolist(), c_target.tolist())
+        self.assertEqual(levels, c_levels)
+        self.assertEqual(np.int8, compact.get_targets().dtype)
+
+        # Loaded data can be converted, and is saved with its dtypes
+        plex.set_dtypes(DtypePolicy("float32"))
+        self.assertEqual(np.float32, plex.get_data_by_parameters(narrow).dtype)
+        self.assertEqual(np.float64, plex.get_targets().dtype)
+
+        path = os.path.join(self.tmp_dir, "snapshot")
+        compact.save(path)
+        snapshot = f.Statplexer.open(path)
+        self.assertEqual(compact.dtypes.to_dict(), snapshot.dtypes.to_dict())
+        self.assertEqual(c_data.tolist(), snapshot.get_data_by_target(parameters, [1, -1])[0].tolist())
+        shutil.rmtree(path)
+
+    def test_snapshot(self):
+        plex = self.load()
+        path = os.path.join(self.tmp_dir, "snapshot")
+        plex.save(path)
+        snapshot = f.Statplexer.open(path)
+
+        # The matrix is read from the snapshot as it is used
+        self.assertIsInstance(snapshot._store.matrix, np.memmap)
+
+        self.assertEqual(len(plex), len(snapshot))
+        self.assertEqual(plex.list_parameters(), snapshot.list_parameters())
+        self.assertEqual(plex.count_parameters(), snapshot.count_parameters())
+        self.assertEqual(plex.parameter_stats(), snapshot.parameter_stats())
+        self.assertEqual(plex._targets, snapshot._targets)
+        self.assertEqual(plex.count_targets_by_class(), snapshot.count_targets_by_class())
+        for cl in CLASSES:
+            self.assertEqual(plex._classes[cl]["_count"], snapshot._classes[cl]["_count"])
+
+        parameters = plex.find_parameters(["reads"])
+        data, target, levels = plex.get_data_by_target(parameters, [1, -1])
+        s_data, s_target, s_levels = snapshot.get_data_by_target(parameters, [1, -1])
+        self.assertTrue((data == s_data).all())
+        self.assertTrue((target == s_target).all())
+        self.assertEqual(levels, s_levels)
+
+        # Chunks are read from the snapshot as they are taken
+        chunks = list(snapshot.iter_data_by_target(parameters, [1, -1], chunk_rows=2))
+        self.assertEqual(data.tolist(), np.vstack([chunk[0] for chunk in chunks]).tolist())
+
+        # Splits are saved with the data
+        splits = plex.make_folds(k=3, seed=2)
+        plex.save(path)
+        snapshot = f.Statplexer.open(path)
+        self.assertEqual([test.tolist() for train, test in splits],
+                [test.tolist() for train, test in snapshot.get_splits("folds")])
+
+        # The readers are not saved, so the snapshot cannot read data files
+        self.assertRaises(Exception, snapshot.refresh)
+        self.assertRaises(Exception, snapshot.add_files, [])
+
+        # An opened snapshot can be saved over itself, while it is mapped
+        snapshot.make_holdouts(repeats=2, seed=1)
+        snapshot.save(path)
+        resaved = f.Statplexer.open(path)
+        self.assertEqual(["folds", "holdout"], resaved.list_splits())
+        self.assertEqual(data.tolist(), resaved.get_data_by_target(parameters, [1, -1])[0].tolist())
+        self.assertEqual(data.tolist(), snapshot.get_data_by_target(parameters, [1, -1])[0].tolist())
+
+        # The opened data can still be changed, but its splits are then stale
+        snapshot._remove_observations(snapshot._store.observations[:1])
+        self.assertEqual(len(plex) - 1, len(snapshot))
+        self.assertRaises(Exception, snapshot.get_splits, "folds")
+        shutil.rmtree(path)
+
+    def test_refresh(self):
+        data_dir = os.path.join(self.tmp_dir, "refresh")
+        shutil.copytree(self.data_dir, data_dir)
+        target_path = os.path.join(self.tmp_dir, "refresh.aqc.txt")
+        shutil.copy(self.target_path, target_path)
+
+        plex = f.Statplexer(data_dir, target_path, CLASSES, BamcheckReader, AQCReader)
+        self.assertEqual(([], []), plex.refresh())
+
+        # Remove a lanelet, change another and add a lanelet with a new target
+        os.remove(os.path.join(data_dir, "9999_9#1.bamcheck"))
+        changed_path = os.path.join(data_dir, "sub", "9999_9#2.bamcheck")
+        fh = open(changed_path, "a")
+        fh.write("SN\towls:\t2\n")
+        fh.close()
+        os.utime(changed_path, (0, 0))
+        shutil.copy(BAMCHECK_PATH, os.path.join(data_dir, "9999_9#7.bamcheck"))
+        fh = open(target_path, "a")
+        fh.write("9999_9#7\tS\tS\tnpg\twarn\t...\n")
+        fh.close()
+
+        # The target file has changed so the lanelet without a target is read again
+        added, removed = plex.refresh()
+        missing_path = os.path.join(data_dir, "sub", "9999_9#6.bamcheck")
+        self.assertEqual(sorted([changed_path, missing_path, os.path.join(data_dir, "9999_9#7.bamcheck")]), sorted(added))
+        self.assertEqual([os.path.join(data_dir, "9999_9#1.bamcheck")], removed)
+
+        self.assertEqual(len(LOAD_TARGETS), len(plex))
+        self.assertNotIn("9999_9#1", plex._targets)
+        self.assertEqual(1, plex._classes["pass"]["_count"])
+        self.assertEqual(2, plex._classes["fail"]["_count"])
+        self.assertEqual(2, plex._classes["warn"]["_count"])
+
+        # New parameter is missing from the unchanged lanelets
+        owls = plex.get_data_by_parameters(["owls"])[:, 0]
+        self.assertEqual(1, (owls == 2).sum())
+
+        # The lanelet without a target is kept once it has a target, and
+        # changed targets are recounted
+        fh = open(target_path, "w")
+        fh.write("lanelet\tsample\tstudy\tnpg\taqc\t...\n")
+        for _id in ["9999_9#2", "9999_9#3", "9999_9#4", "9999_9#5", "9999_9#6", "9999_9#7"]:
+            fh.write("%s\tS\tS\tnpg\tfail\t...\n" % _id)
+        fh.close()
+        os.utime(target_path, (0, 0))
+
+        added, removed = plex.refresh()
+        self.assertEqual([missing_path], added)
+        self.assertEqual(6, len(plex))
+        self.assertEqual(0, plex._classes["pass"]["_count"])
+        self.assertEqual(6, plex._classes["fail"]["_count"])
+        self.assertEqual(0, plex._classes["warn"]["_count"])
+        self.assertEqual([-1] * 6, plex.get_targets().tolist())
+
+    def test_refresh_same_name(self):
+        # Data files of the same name in different directories are one observation
+        data_dir = os.path.join(self.tmp_dir, "same_name")
+        shutil.copytree(self.data_dir, data_dir)
+        os.mkdir(os.path.join(data_dir, "rerun"))
+        paths = [os.path.join(data_dir, "9999_9#1.bamcheck"), os.path.join(data_dir, "rerun", "9999_9#1.bamcheck")]
+        shutil.copy(paths[0], paths[1])
+
+        plex = f.Statplexer(data_dir, self.target_path, CLASSES, BamcheckReader, AQCReader)
+        self.assertEqual(len(LOAD_TARGETS), len(plex))
+        self.assertEqual(2, plex._classes["pass"]["_count"])
+
+        # Removing the file the observation was read from reads the other again
+        read_from = plex._sources["9999_9#1.bamcheck"]
+        os.remove(read_from)
+        other = [fpath for fpath in paths if fpath != read_from][0]
+        self.assertEqual(([other], [read_from]), plex.refresh())
+        self.assertEqual(len(LOAD_TARGETS), len(plex))
+        self.assertEqual(2, plex._classes["pass"]["_count"])
+
+        # Removing a file the observation was not read from keeps it
+        shutil.copy(other, read_from)
+        self.assertEqual(([read_from], []), plex.refresh())
+        self.assertEqual(read_from, plex._sources["9999_9#1.bamcheck"])
+        os.remove(other)
+        self.assertEqual(([], [other]), plex.refresh())
+        self.assertEqual(len(LOAD_TARGETS), len(plex))
+        self.assertIn("9999_9#1", plex._targets)
+        self.assertEqual(2, plex._classes["pass"]["_count"])
+
+        os.remove(read_from)
+        plex.refresh()
+        self.assertEqual(len(LOAD_TARGETS) - 1, len(plex))
+        self.assertEqual(1, plex._classes["pass"]["_count"])
+        shutil.rmtree(data_dir)
+
+    def test_join_targets(self):
+        plex = self.load()
+        joined = self.load(join_targets=True)
+        self.assertEqual(plex._targets, joined._targets)
+        self.assertEqual(plex._store.observations, joined._store.observations)
+        self.assertEqual(sorted(LOAD_TARGETS), joined._target_lookup.keys())
+
+    def test_target_index(self):
+        index = os.path.join(self.tmp_dir, "index")
+        plex = self.load()
+        indexed = self.load(target_index=index)
+        self.assertIsInstance(indexed._target_lookup, TargetTable)
+        self.assertIsInstance(indexed._target_lookup.ids, np.memmap)
+        self.assertEqual(plex._targets, indexed._targets)
+        self.assertEqual(plex._store.observations, indexed._store.observations)
+
+        # The index is only built again if the target file changes
+        mtime = os.path.getmtime(os.path.join(index, "ids.npy"))
+        os.utime(os.path.join(index, "ids.npy"), (0, 0))
+        self.load(target_index=index)
+        self.assertEqual(0, os.path.getmtime(os.path.join(index, "ids.npy")))
+        os.utime(self.target_path, (0, 0))
+        self.load(target_index=index)
+        self.assertNotEqual(0, os.path.getmtime(os.path.join(index, "ids.npy")))
+
+        # Or if another target file, or other classes, are used with it
+        other_path = os.path.join(self.tmp_dir, "other.aqc.txt")
+        shutil.copy(self.target_path, other_path)
+        shutil.copystat(self.target_path, other_path)
+        plex = f.Statplexer(self.data_dir, other_path, CLASSES, BamcheckReader, AQCReader, target_index=index)
+        self.assertEqual(os.path.abspath(other_path), plex._target_lookup.source[0])
+
+        recoded = dict((cl, dict(CLASSES[cl])) for cl in CLASSES)
+        recoded["pass"]["code"] = 2
+        plex = f.Statplexer(self.data_dir, other_path, recoded, BamcheckReader, AQCReader, target_index=index)
+        self.assertEqual(2, plex._targets["9999_9#1"])
+        os.remove(other_path)
+        shutil.rmtree(index)
+
+    def test_join_targets_refresh(self):
+        data_dir = os.path.join(self.tmp_dir, "join")
+        shutil.copytree(self.data_dir, data_dir)
+        target_path = os.path.join(self.tmp_dir, "join.aqc.txt")
+        shutil.copy(self.target_path, target_path)
+        fh = open(target_path, "a")
+        fh.write("9999_9#7\tS\tS\tnpg\twarn\t...\n")
+        fh.close()
+
+        plex = f.Statplexer(data_dir, target_path, CLASSES, BamcheckReader, AQCReader, join_targets=True)
+        self.assertNotIn("9999_9#7", plex._target_lookup)
+
+        # A data file of an id that was not joined reads the targets again
+        shutil.copy(BAMCHECK_PATH, os.path.join(data_dir, "9999_9#7.bamcheck"))
+        added, removed = plex.refresh()
+        self.assertIn(os.path.join(data_dir, "9999_9#7.bamcheck"), added)
+        self.assertIn("9999_9#7", plex._targets)
+        self.assertEqual(len(LOAD_TARGETS) + 1, len(plex))
+
+    def test_archive_load(self):
+        plex = self.load()
+        parameters = plex.list_parameters()
+
+        archive_dir = os.path.join(self.tmp_dir, "archives")
+        os.makedirs(os.path.join(archive_dir, "zips"))
+        tar_path = os.path.join(archive_dir, "data.tar.gz")
+        tf = tarfile.open(tar_path, "w:gz")
+        tf.add(self.data_dir, arcname="data")
+        tf.close()
+
+        # A directory of archives, with gzip compressed members
+        content = gzip.compress(open(BAMCHECK_PATH, "rb").read())
+        for i, _id in enumerate(sorted(LOAD_TARGETS) + ["9999_9#6"]):
+            zf = zipfile.ZipFile(os.path.join(archive_dir, "zips", "part%d.zip" % (i % 2)), "a")
+            zf.writestr("lanelets/%s.bamcheck.gz" % _id, content)
+            zf.close()
+
+        for data_dir in [tar_path, os.path.join(archive_dir, "zips")]:
+            archive_plex = f.Statplexer(data_dir, self.target_path, CLASSES, BamcheckReader, AQCReader)
+            self.assertEqual(sorted(plex._targets.items()), sorted(archive_plex._targets.items()))
+            self.assertEqual(len(plex), len(archive_plex))
+            self.assertTrue((plex.get_data_by_parameters(parameters)
+                    == archive_plex.get_data_by_parameters(parameters)).all())
+            self.assertEqual(6, archive_plex.load_report.files_total)
+            self.assertEqual(6, archive_plex.load_report.files_read)
+
+        # Unchanged archives are not read again
+        archive_plex = f.Statplexer(tar_path, self.target_path, CLASSES, BamcheckReader, AQCReader)
+        self.assertEqual(([], []), archive_plex.refresh())
+        archive_plex.remove_files([tar_path])
+        self.assertEqual(0, len(archive_plex))
+        archive_plex.add_files([tar_path])
+        self.assertEqual(len(LOAD_TARGETS), len(archive_plex))
+
+        # A changed archive is read again in full
+        tf = tarfile.open(tar_path, "w:gz")
+        tf.add(os.path.join(self.data_dir, "sub"), arcname="data/sub")
+        tf.close()
+        os.utime(tar_path, (0, 0))
+        added, removed = archive_plex.refresh()
+        self.assertEqual([tar_path], added)
+        self.assertEqual(["9999_9#1.bamcheck", "9999_9#3.bamcheck", "9999_9#5.bamcheck"],
+                sorted(os.path.basename(fpath) for fpath in removed))
+        self.assertFalse(any("sub" in fpath for fpath in removed))
+        self.assertEqual(2, len(archive_plex))
+        shutil.rmtree(archive_dir)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,82 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from frontier.IO import BamcheckReader as bcr
+from frontier.IO.ParseCache import ParseCache
+
+DATA_PATH = "tests/data/example.bamcheck.txt"
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.data_path = os.path.join(self.tmp_dir, "9999_9#1.bamcheck")
+        shutil.copy(DATA_PATH, self.data_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self, cache):
+        return bcr.BamcheckReader(self.data_path, cache=cache)
+
+    def test_hit(self):
+        cache = ParseCache(self.cache_dir)
+        self.assertEqual(41400090, self.read(cache).get_data()["sequences"])
+
+        # Change a value without changing the size or modification time of the file
+        st = os.stat(self.data_path)
+        content = open(self.data_path, "rb").read()
+        fh = open(self.data_path, "wb")
+        fh.write(content.replace(b"sequences:\t41400090", b"sequences:\t41400091"))
+        fh.close()
+        os.utime(self.data_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        # The file is restored from the cache rather than parsed
+        self.assertEqual(41400090, self.read(cache).get_data()["sequences"])
+
+        # Unless the cache also compares the content of the file
+        cache = ParseCache(self.cache_dir, use_hash=True)
+        self.assertEqual(41400091, self.read(cache).get_data()["sequences"])
+        self.assertEqual(41400091, self.read(cache).get_data()["sequences"])
+
+    def test_modified(self):
+        cache = ParseCache(self.cache_dir)
+        self.read(cache)
+
+        fh = open(self.data_path, "a")
+        fh.write("SN\towls:\t2\n")
+        fh.close()
+        os.utime(self.data_path, (0, 0))
+        self.assertEqual(2, self.read(cache).get_data()["owls"])
+
+    def test_invalidate(self):
+        cache = ParseCache(self.cache_dir)
+        self.read(cache)
+        cache.invalidate(bcr.BamcheckReader, self.data_path)
+        self.assertIsNone(cache.get(bcr.BamcheckReader, self.data_path))
+
+        self.read(cache)
+        cache.clear()
+        self.assertEqual(0, len(os.listdir(self.cache_dir)))
+
+    def test_evict(self):
+        cache = ParseCache(self.cache_dir, max_size=1)
+        self.read(cache)
+        self.assertEqual(0, len(os.listdir(self.cache_dir)))
+
+    def test_disabled(self):
+        cache = ParseCache(self.cache_dir, enabled=False)
+        self.read(cache)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from frontier.results import ResultsCache, result_key
+
+PARAMETERS = ["hoot", "owl-ratio"]
+
+class TestResultsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "results", "results.db")
+        self.cache = ResultsCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_key(self):
+        key = result_key("abc", PARAMETERS, [1, -1], 10)
+        self.assertEqual(key, result_key("abc", PARAMETERS, np.array([-1, 1, 1]), 10))
+        self.assertEqual(key, result_key("abc", PARAMETERS, np.array([1.0, -1.0]), 10))
+        self.assertNotEqual(key, result_key("abd", PARAMETERS, [1, -1], 10))
+        self.assertNotEqual(key, result_key("abc", PARAMETERS[::-1], [1, -1], 10))
+        self.assertNotEqual(key, result_key("abc", PARAMETERS, [1], 10))
+        self.assertNotEqual(key, result_key("abc", PARAMETERS, [1, -1], 5))
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.get("abc", PARAMETERS, [1, -1], 10))
+        self.cache.put("abc", PARAMETERS, np.array([1, 1, -1]), 10, scores=np.array([0.5, 0.75]),
+                importance={"hoot": np.float64(0.25)}, timings={"fit": 1.5}, param_set="owls")
+
+        self.assertTrue(self.cache.contains("abc", PARAMETERS, [-1, 1], 10))
+        result = self.cache.get("abc", PARAMETERS, [-1, 1], 10)
+        self.assertEqual([0.5, 0.75], result.scores.tolist())
+        self.assertEqual({"hoot": 0.25}, result.importance)
+        self.assertEqual({"fit": 1.5}, result.timings)
+        self.assertEqual("owls", result.param_set)
+        self.assertEqual([-1, 1], result.targets)
+        self.assertEqual(10, result.folds)
+
+        # Results outlive the session that stored them, a result is replaced
+        self.cache.close()
+        self.cache = ResultsCache(self.path)
+        self.cache.put("abc", PARAMETERS, [1, -1], 10, scores=[0.25])
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual([0.25], self.cache.get("abc", PARAMETERS, [1, -1], 10).scores.tolist())
+
+    def test_find_remove(self):
+        self.cache.put("abc", PARAMETERS, [1], 5, param_set="owls")
+        self.cache.put("abc", PARAMETERS[:1], [1], 5, param_set="hoots")
+        self.cache.put("def", PARAMETERS, [1], 5, param_set="owls")
+
+        self.assertEqual(3, len(self.cache.find()))
+        self.assertEqual(2, len(self.cache.find(fingerprint="abc")))
+        self.assertEqual(["hoots"], [r.param_set for r in self.cache.find("abc", "hoots")])
+
+        self.cache.remove("abc")
+        self.assertEqual(["def"], [r.fingerprint for r in self.cache.find()])
+        self.cache.remove()
+        self.assertEqual(0, len(self.cache))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import unittest
+
+import numpy as np
+
+from frontier import sampling
+
+CODES = [1] * 60 + [0] * 30 + [-1] * 10
+
+class TestSampling(unittest.TestCase):
+
+    def test_class_rows(self):
+        groups = sampling.class_rows([1, 0, 1, -1, 0])
+        self.assertEqual({-1: [3], 0: [1, 4], 1: [0, 2]},
+                dict((code, rows.tolist()) for code, rows in groups.items()))
+        self.assertEqual({}, sampling.class_rows([]))
+
+    def test_shuffled_rows(self):
+        rows = sampling.shuffled_rows(CODES, np.random.RandomState(0))
+        self.assertEqual(list(range(0, len(CODES))), sorted(rows.tolist()))
+        self.assertNotEqual(list(range(0, len(CODES))), rows.tolist())
+
+        # The same seed gives the same order
+        self.assertEqual(rows.tolist(), sampling.shuffled_rows(CODES, np.random.RandomState(0)).tolist())
+
+    def test_stratified_rows(self):
+        codes = np.array(CODES)
+        rows = sampling.shuffled_rows(codes, np.random.RandomState(1), stratify=True)
+        self.assertEqual(list(range(0, len(CODES))), sorted(rows.tolist()))
+
+        # Each tenth of the order holds about a tenth of each class
+        for start in range(0, len(rows), 10):
+            chunk = codes[rows[start:start + 10]]
+            self.assertTrue(5 <= (chunk == 1).sum() <= 7)
+            self.assertTrue(2 <= (chunk == 0).sum() <= 4)
+            self.assertTrue(0 <= (chunk == -1).sum() <= 2)
+
+    def test_balanced_rows(self):
+        codes = np.array(CODES)
+        rows = sampling.shuffled_rows(codes, np.random.RandomState(2), balance=True)
+        self.assertEqual(180, len(rows))
+        for code in [1, 0, -1]:
+            self.assertEqual(60, (codes[rows] == code).sum())
+
+        # Every row of a smaller class is drawn at least once
+        self.assertEqual(list(range(0, len(CODES))), sorted(set(rows.tolist())))
+        self.assertEqual(0, len(sampling.shuffled_rows([], np.random.RandomState(0), balance=True)))
+
+    def test_prefetch(self):
+        self.assertEqual(list(range(0, 100)), list(sampling.prefetch(iter(range(0, 100)), 4)))
+
+        def fail():
+            yield 1
+            raise ValueError("hoot")
+        batches = sampling.prefetch(fail(), 2)
+        self.assertEqual(1, next(batches))
+        self.assertRaises(ValueError, next, batches)
+
+        # Closing early stops the producer
+        batches = sampling.prefetch(iter(range(0, 1000)), 1)
+        self.assertEqual(0, next(batches))
+        batches.close()
+
+if __name__ == '__main__':
+    unittest.main()
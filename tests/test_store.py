@@ -0,0 +1,305 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from frontier.store import DtypePolicy, ObservationStore, ParameterStats
+
+DATA = {
+    "owl2.txt": {"hoot": 2, "wing-span": 20},
+    "owl0.txt": {"hoot": 0, "wing-span": 0},
+    "owl1.txt": {"hoot": 1, "wing-span": 10},
+}
+IDS = dict((name, name.split(".")[0]) for name in DATA)
+TARGETS = {"owl0.txt": 1, "owl1.txt": 0, "owl2.txt": 1}
+
+class TestObservationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ObservationStore()
+        self.store.add(DATA, IDS, TARGETS)
+
+    def test_sorted(self):
+        self.assertEqual(["owl0.txt", "owl1.txt", "owl2.txt"], self.store.observations)
+        self.assertEqual(["owl0", "owl1", "owl2"], self.store.ids)
+        self.assertEqual(["hoot", "wing-span"], self.store.parameters)
+        self.assertEqual([1, 0, 1], self.store.targets.tolist())
+
+    def test_take(self):
+        data = self.store.take([2, 0], self.store.columns(["wing-span"]))
+        self.assertEqual([[20], [0]], data.tolist())
+
+    def test_iter_take(self):
+        columns = self.store.columns(["wing-span"])
+        chunks = list(self.store.iter_take(columns=columns, chunk_rows=2))
+        self.assertEqual([[0, 1], [2]], [rows.tolist() for rows, data in chunks])
+        self.assertEqual(self.store.take(columns=columns).tolist(),
+                np.vstack([data for rows, data in chunks]).tolist())
+        self.assertEqual([], list(self.store.iter_take([], columns)))
+        self.assertRaises(Exception, list, self.store.iter_take(columns=columns, chunk_rows=0))
+
+    def test_unknown_column(self):
+        self.assertRaises(KeyError, self.store.columns, ["talon-length"])
+
+    def test_add_new_parameter(self):
+        self.store.add({"owl3.txt": {"hoot": 3, "talon-length": 4}}, {"owl3.txt": "owl3"}, {"owl3.txt": 0})
+        self.assertEqual(["hoot", "talon-length", "wing-span"], self.store.parameters)
+        self.assertEqual(4, len(self.store))
+
+        # Missing parameters are NaN
+        talons = self.store.take(columns=self.store.columns(["talon-length"]))
+        self.assertTrue(np.isnan(talons[:3]).all())
+        self.assertEqual(4, talons[3, 0])
+
+    def test_replace(self):
+        self.store.add({"owl1.txt": {"hoot": 5, "wing-span": "hoot"}}, {"owl1.txt": "owl1"}, {"owl1.txt": 1})
+        self.assertEqual(3, len(self.store))
+        self.assertEqual(5, self.store.take(self.store.rows(["owl1.txt"]), [0])[0, 0])
+
+        # Values that are not numeric are NaN
+        self.assertTrue(np.isnan(self.store.take(self.store.rows(["owl1.txt"]), [1])[0, 0]))
+        self.assertEqual([1, 1, 1], self.store.targets.tolist())
+
+    def test_target_rows(self):
+        self.assertEqual([0, 2], self.store.target_rows([1]).tolist())
+        self.assertEqual([0, 2], self.store.target_rows(1).tolist())
+        self.assertEqual([0, 1, 2], self.store.target_rows([0, 1]).tolist())
+        self.assertEqual([0, 1, 2], self.store.target_rows().tolist())
+        self.assertEqual([], self.store.target_rows([5]).tolist())
+
+        self.store.set_targets([0], [0])
+        self.assertEqual([2], self.store.target_rows([1]).tolist())
+
+    def test_id_rows(self):
+        self.assertEqual([2, 0], self.store.id_rows(["owl2", "owl0"]))
+        self.assertTrue(self.store.has_id("owl1"))
+        self.assertFalse(self.store.has_id("owl1.txt"))
+        self.assertRaises(KeyError, self.store.id_rows, ["owl3"])
+
+    def test_remove(self):
+        self.store.remove(["owl1.txt"])
+        self.assertEqual(["owl0.txt", "owl2.txt"], self.store.observations)
+        self.assertEqual([[0, 0], [2, 20]], self.store.take().tolist())
+        self.assertNotIn("owl1.txt", self.store)
+
+    def test_shared_rows(self):
+        # Observations with the same content key share a row of the matrix
+        self.store.add({"owl3.txt": DATA["owl1.txt"], "owl4.txt": DATA["owl1.txt"]},
+                {"owl3.txt": "owl3", "owl4.txt": "owl4"}, {"owl3.txt": 1, "owl4.txt": 2},
+                keys={"owl3.txt": "abc", "owl4.txt": "abc"})
+        self.assertEqual(5, len(self.store))
+        self.assertEqual(4, len(self.store.matrix))
+        self.assertEqual([[1, 10], [1, 10]], self.store.take([3, 4]).tolist())
+        self.assertEqual([1, 2], self.store.targets[[3, 4]].tolist())
+        self.assertEqual([["owl3.txt", "owl4.txt"]], self.store.shared_rows())
+
+        # Statistics count each observation
+        self.assertEqual([5, 5], self.store.stats.count.tolist())
+        self.assertEqual(1.0, self.store.stats.mean[0])
+
+        # An observation added later with a known key is not read
+        self.store.set_content_keys({"owl0.txt": "def"})
+        self.store.add({"owl5.txt": {}}, {"owl5.txt": "owl5"}, {"owl5.txt": 0}, keys={"owl5.txt": "def"})
+        self.assertEqual(4, len(self.store.matrix))
+        self.assertEqual([[0, 0]], self.store.take([5]).tolist())
+
+        # Rows are kept while any of their observations remain
+        self.store.remove(["owl3.txt", "owl0.txt"])
+        self.assertEqual(["owl1.txt", "owl2.txt", "owl4.txt", "owl5.txt"], self.store.observations)
+        self.assertEqual([[1, 10], [2, 20], [1, 10], [0, 0]], self.store.take().tolist())
+        self.store.remove(["owl4.txt", "owl5.txt"])
+        self.assertEqual(2, len(self.store.matrix))
+        self.assertEqual([], self.store.shared_rows())
+        self.assertEqual([[1, 10], [2, 20]], self.store.take().tolist())
+        self.assertEqual([2, 2], self.store.stats.count.tolist())
+
+    def test_catalogue(self):
+        catalogue = self.store.catalogue
+        self.assertEqual(["hoot", "wing-span"], catalogue.parameters)
+        self.assertEqual({"hoot": 3, "wing-span": 3}, catalogue.counts)
+        self.assertEqual(["wing-span"], catalogue.find(["span"]))
+        self.assertEqual([], catalogue.find(["SPAN"]))
+        self.assertEqual(["wing-span"], catalogue.find(["SPAN"], ignore_case=True))
+        self.assertEqual(["hoot", "wing-span"], catalogue.find(["^h", "n$"], regex=True))
+        self.assertEqual(["wing-span"], catalogue.exclude(["HOO"]))
+        self.assertEqual(["hoot", "wing-span"], catalogue.exclude(["HOO"], exact=True))
+
+        # The catalogue is rebuilt once the store changes
+        self.assertIs(catalogue, self.store.catalogue)
+        self.store.add({"owl3.txt": {"talon-length": 4}}, {"owl3.txt": "owl3"}, {"owl3.txt": 0})
+        self.assertEqual({"hoot": 3, "talon-length": 1, "wing-span": 3}, self.store.catalogue.counts)
+
+
+class TestDtypePolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ObservationStore(DtypePolicy.compact())
+        self.store.add(DATA, IDS, TARGETS)
+
+    def test_policy(self):
+        policy = DtypePolicy.compact(wide=["reads"])
+        self.assertEqual(np.float32, policy.features)
+        self.assertEqual(np.int8, policy.targets)
+        self.assertEqual(policy.to_dict(), DtypePolicy.from_dict(policy.to_dict()).to_dict())
+        self.assertRaises(Exception, DtypePolicy, "int32")
+        self.assertRaises(Exception, DtypePolicy, targets="float32")
+
+        self.assertEqual([1, -1], policy.check_targets([1, -1]).tolist())
+        self.assertRaises(Exception, policy.check_targets, [1, 300])
+
+    def test_compact(self):
+        self.assertEqual(np.float32, self.store.matrix.dtype)
+        self.assertEqual(np.int8, self.store.targets.dtype)
+        self.assertEqual(np.float32, self.store.take().dtype)
+        self.assertEqual([[0, 0], [1, 10], [2, 20]], self.store.take().tolist())
+        self.assertEqual(np.int8, self.store.target_values(self.store.targets).dtype)
+        self.assertRaises(Exception, self.store.add, {"owl3.txt": {"hoot": 3}},
+                {"owl3.txt": "owl3"}, {"owl3.txt": 200})
+
+    def test_promote(self):
+        # Counts too large for float32 are kept as float64
+        self.store.add({"owl3.txt": {"hoot": 3, "reads": 2 ** 24 + 1}}, {"owl3.txt": "owl3"}, {"owl3.txt": 0})
+        self.assertEqual(["reads"], self.store.wide_parameters)
+        self.assertEqual(np.float32, self.store.take(columns=self.store.columns(["hoot"])).dtype)
+
+        data = self.store.take(columns=self.store.columns(["hoot", "reads"]))
+        self.assertEqual(np.float64, data.dtype)
+        self.assertEqual(2 ** 24 + 1, data[3, 1])
+        self.assertTrue(np.isnan(data[:3, 1]).all())
+
+        # Values already stored are kept when a parameter becomes wide
+        self.store.add({"owl4.txt": {"hoot": 1e40}}, {"owl4.txt": "owl4"}, {"owl4.txt": 0})
+        self.assertEqual(["hoot", "reads"], self.store.wide_parameters)
+        self.assertEqual([0, 1, 2, 3, 1e40], self.store.take(columns=[0])[:, 0].tolist())
+
+        self.store.remove(["owl4.txt"])
+        self.assertEqual(3, self.store.stats.max[0])
+
+        strict = ObservationStore(DtypePolicy("float32", promote=False))
+        self.assertRaises(Exception, strict.add, {"owl0.txt": {"reads": 2 ** 30}},
+                {"owl0.txt": "owl0"}, {"owl0.txt": 0})
+
+    def test_fingerprint(self):
+        # The fingerprint of the same data does not depend on how it is stored
+        store = ObservationStore()
+        store.add(DATA, IDS, TARGETS)
+        wide = ObservationStore(DtypePolicy(wide=["hoot"]))
+        wide.add(DATA, IDS, TARGETS)
+        self.assertEqual(["hoot"], wide.wide_parameters)
+        self.assertEqual(store.data_fingerprint(), wide.data_fingerprint())
+        self.assertEqual(store.data_fingerprint(), self.store.data_fingerprint())
+
+    def test_rejected(self):
+        # Values and targets that do not fit are rejected before anything is stored
+        strict = ObservationStore(DtypePolicy.compact(promote=False))
+        self.assertRaises(Exception, strict.add, {"owl0.txt": {"x": 1e40}},
+                {"owl0.txt": "owl0"}, {"owl0.txt": 0})
+        self.assertRaises(Exception, strict.add, {"owl0.txt": {"y": 1}},
+                {"owl0.txt": "owl0"}, {"owl0.txt": 300})
+        self.assertEqual(0, len(strict))
+        self.assertEqual([], strict.parameters)
+        self.assertEqual([], strict.stats.count.tolist())
+
+        # Replaced observations are kept if their replacement is rejected
+        self.assertRaises(Exception, self.store.add, {"owl1.txt": {"hoot": 1}},
+                {"owl1.txt": "owl1"}, {"owl1.txt": 300})
+        self.assertEqual(3, len(self.store))
+        self.assertEqual([3, 3], self.store.stats.count.tolist())
+
+        store = ObservationStore()
+        store.add({"owl0.txt": {"reads": 2 ** 30}}, {"owl0.txt": "owl0"}, {"owl0.txt": 1})
+        self.assertRaises(Exception, store.set_dtypes, DtypePolicy.compact(promote=False))
+        self.assertEqual(np.float64, store.dtypes.features)
+        self.assertEqual([[2 ** 30]], store.take().tolist())
+
+    def test_set_dtypes(self):
+        store = ObservationStore()
+        store.add({"owl0.txt": {"hoot": 1, "reads": 2 ** 25 + 1}}, {"owl0.txt": "owl0"}, {"owl0.txt": 1})
+        store.set_dtypes(DtypePolicy.compact(wide=["hoot"]))
+        self.assertEqual(np.float32, store.matrix.dtype)
+        self.assertEqual(["hoot", "reads"], store.wide_parameters)
+        self.assertEqual([[1, 2 ** 25 + 1]], store.take().tolist())
+
+        tmp_dir = tempfile.mkdtemp()
+        store.save(os.path.join(tmp_dir, "store"))
+        opened = ObservationStore.open(os.path.join(tmp_dir, "store"))
+        self.assertEqual(store.dtypes.to_dict(), opened.dtypes.to_dict())
+        self.assertEqual(store.take().tolist(), opened.take().tolist())
+        self.assertEqual(store.data_fingerprint(), opened.data_fingerprint())
+
+        # Snapshots of another version are refused
+        fh = open(os.path.join(tmp_dir, "store", "store.json"))
+        names = json.load(fh)
+        fh.close()
+        names["version"] = 1
+        fh = open(os.path.join(tmp_dir, "store", "store.json"), "w")
+        json.dump(names, fh)
+        fh.close()
+        self.assertRaises(Exception, ObservationStore.open, os.path.join(tmp_dir, "store"))
+        shutil.rmtree(tmp_dir)
+
+class TestParameterStats(unittest.TestCase):
+
+    def assertStatsEqual(self, expected, stats):
+        for name in ["count", "missing", "mean", "variance", "min", "max"]:
+            self.assertTrue(np.allclose(getattr(expected, name), getattr(stats, name), equal_nan=True), name)
+
+    def test_from_matrix(self):
+        matrix = np.array([[1, np.nan, 5], [2, np.nan, 5], [6, np.nan, 5], [np.nan, np.nan, 5]])
+        stats = ParameterStats.from_matrix(matrix)
+        self.assertEqual([3, 0, 4], stats.count.tolist())
+        self.assertEqual([1, 4, 0], stats.missing.tolist())
+        self.assertAlmostEqual(3, stats.mean[0])
+        self.assertAlmostEqual(np.var([1, 2, 6]), stats.variance[0])
+        self.assertTrue(np.isnan(stats.variance[1]))
+        self.assertEqual(0, stats.variance[2])
+        self.assertEqual([1, 5], stats.min[[0, 2]].tolist())
+        self.assertEqual([6, 5], stats.max[[0, 2]].tolist())
+        self.assertTrue(np.isnan(stats.min[1]) and np.isnan(stats.max[1]))
+
+    def test_constant(self):
+        # A constant fractional column has exactly zero variance, however its
+        # statistics were combined
+        stats = ParameterStats.from_matrix(np.full((3, 2), 0.7))
+        self.assertEqual([0, 0], stats.variance.tolist())
+        self.assertEqual([0.7, 0.7], stats.mean.tolist())
+
+        stats.merge(ParameterStats.from_matrix(np.full((3, 2), 0.1)))
+        self.assertTrue((stats.variance > 0).all())
+        stats.remove(ParameterStats.from_matrix(np.full((3, 2), 0.1)), np.full((3, 2), 0.7))
+        self.assertEqual([0, 0], stats.variance.tolist())
+
+        stats = ParameterStats.from_matrix(np.full((1, 1), 0.1))
+        for _ in range(0, 5):
+            stats.merge(ParameterStats.from_matrix(np.full((1, 1), 0.1)))
+        self.assertEqual([0], stats.variance.tolist())
+
+    def test_incremental(self):
+        # Statistics kept by the store as observations come and go must match
+        # those computed over the final matrix
+        rng = np.random.RandomState(0)
+        store = ObservationStore()
+        for i in range(0, 5):
+            data = {}
+            for k in range(0, 20):
+                data["obs%d-%d" % (i, k)] = dict(("p%d" % j, rng.normal(j, 10 ** j))
+                        for j in range(0, i + 2) if rng.rand() > 0.1)
+            store.add(data, dict((name, name) for name in data), dict((name, 0) for name in data))
+            store.remove(["obs%d-%d" % (i, k) for k in range(0, 20, 3)])
+
+        self.assertStatsEqual(ParameterStats.from_matrix(store.matrix), store.stats)
+
+        store.remove(list(store.observations))
+        self.assertEqual(0, store.stats.count.sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
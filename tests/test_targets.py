@@ -0,0 +1,79 @@
+__author__ = "Sam Nicholls <sn8@sanger.ac.uk>"
+__copyright__ = "Copyright (c) Sam Nicholls"
+__version__ = "0.1.2"
+__maintainer__ = "Sam Nicholls <sam@samnicholls.net>"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from frontier.targets import TargetTable
+
+TARGETS = {
+    "9999_9#1": 1,
+    "9999_9#10": -1,
+    "9999_9#2": 0,
+    "1000_1#1": 1,
+}
+
+class TestTargetTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = TargetTable.from_dict(TARGETS)
+
+    def test_lookup(self):
+        self.assertEqual(len(TARGETS), len(self.table))
+        self.assertEqual(sorted(TARGETS), self.table.keys())
+        for _id, code in TARGETS.items():
+            self.assertIn(_id, self.table)
+            self.assertEqual(code, self.table[_id])
+            self.assertIsInstance(self.table[_id], int)
+
+        for _id in ["9999_9#3", "9999_9#100", "0", ""]:
+            self.assertNotIn(_id, self.table)
+            self.assertRaises(KeyError, self.table.__getitem__, _id)
+            self.assertEqual(None, self.table.get(_id))
+
+        codes, found = self.table.lookup(["9999_9#2", "9999_9#3", "9999_9#10", "zzz"])
+        self.assertEqual([True, False, True, False], found.tolist())
+        self.assertEqual([0, -1], codes[found].tolist())
+
+    def test_duplicate_ids(self):
+        # The last code of an id is kept, as in a dictionary
+        table = TargetTable(["b", "a", "b", "c", "b"], [1, 2, 3, 4, 5])
+        self.assertEqual({"a": 2, "b": 5, "c": 4}, table.to_dict())
+
+    def test_equality(self):
+        self.assertEqual(self.table, TARGETS)
+        self.assertEqual(self.table, TargetTable.from_dict(TARGETS))
+        self.assertNotEqual(self.table, {"9999_9#1": 1})
+
+    def test_labels(self):
+        table = TargetTable(["a", "b"], ["pass", "failed"])
+        self.assertEqual("failed", table["b"])
+
+    def test_empty(self):
+        table = TargetTable()
+        self.assertEqual(0, len(table))
+        self.assertNotIn("a", table)
+        self.assertEqual([False], table.lookup(["a"])[1].tolist())
+
+    def test_save_open(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "index")
+        self.table.source = [1, 2.0]
+        self.table.save(path)
+
+        table = TargetTable.open(path)
+        self.assertIsInstance(table.ids, np.memmap)
+        self.assertEqual([1, 2.0], table.source)
+        self.assertEqual(self.table, table)
+        self.assertEqual(-1, table["9999_9#10"])
+        self.assertNotIn("9999_9#3", table)
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()